@@ -0,0 +1,209 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+import websockets
+from binance.exceptions import BinanceAPIException
+
+import metrics
+from config import ACCOUNT_RECONCILE_SECONDS
+from market_stream import RECONNECT_DELAY_MIN, RECONNECT_DELAY_MAX
+
+logger = logging.getLogger("binance_bot")
+
+USER_STREAM_URL = 'wss://stream.binance.com:9443/ws'
+TESTNET_USER_STREAM_URL = 'wss://testnet.binance.vision/ws'
+
+LISTEN_KEY_KEEPALIVE_SECONDS = 30 * 60  # listenKey wygasa po 60 minutach bez odświeżenia
+FINISHED_ORDERS = 1000                  # Zakończone zlecenia pamiętane do potwierdzeń
+FINAL_STATUSES = ('FILLED', 'CANCELED', 'EXPIRED', 'REJECTED', 'EXPIRED_IN_MATCH')
+
+
+class AccountCache:
+    # Salda i zlecenia konta w pamięci, aktualizowane zdarzeniami strumienia użytkownika
+    # (outboundAccountPosition, balanceUpdate, executionReport) i okresowo uzgadniane z REST.
+    # Odczyty to słownik pod blokadą; dopóki strumień nie działa (live == False),
+    # bot czyta salda przez REST jak wcześniej.
+    def __init__(self):
+        self.balances = {}          # asset -> [free, locked]
+        self.open_orders = {}       # orderId -> zlecenie w formacie odpowiedzi get_order
+        self.finished = OrderedDict()
+        self.live = False
+        self.updated_at = 0         # Czas (ms) ostatniej zmiany sald znany z giełdy
+        self.listeners = []         # Wywoływane z każdą aktualizacją zlecenia
+        self.lock = threading.Lock()
+
+    def load(self, account, open_orders):
+        # Migawka z REST; zwraca aktywa, których saldo różniło się od stanu ze strumienia
+        balances = {b['asset']: [float(b['free']), float(b['locked'])] for b in account['balances']}
+        snapshot_time = int(account.get('updateTime', 0))
+        drift = []
+        with self.lock:
+            # Zdarzenie ze strumienia nowsze niż migawka wygrywa z migawką
+            if snapshot_time >= self.updated_at:
+                if self.live:
+                    drift = [asset for asset, value in balances.items() if asset in self.balances and self.balances[asset] != value]
+                self.balances = balances
+                self.updated_at = snapshot_time
+            # Zlecenie zakończone według strumienia nie wraca do otwartych
+            self.open_orders = {o['orderId']: _order_fields(o) for o in open_orders if o['orderId'] not in self.finished}
+        return drift
+
+    def free(self, asset):
+        with self.lock:
+            return self.balances.get(asset, (0.0, 0.0))[0]
+
+    def total(self, asset):
+        with self.lock:
+            free, locked = self.balances.get(asset, (0.0, 0.0))
+            return free + locked
+
+    def order(self, order_id):
+        with self.lock:
+            return self.open_orders.get(order_id) or self.finished.get(order_id)
+
+    def apply(self, event):
+        kind = event.get('e')
+        metrics.ACCOUNT_STREAM_EVENTS.inc(event=kind)
+        if kind == 'outboundAccountPosition':
+            with self.lock:
+                if event['u'] < self.updated_at:
+                    return # Starsze niż migawka REST
+                self.updated_at = event['u']
+                for b in event['B']:
+                    self.balances[b['a']] = [float(b['f']), float(b['l'])]
+        elif kind == 'balanceUpdate':
+            # Wpłaty i wypłaty - dokładne saldo przyjdzie w outboundAccountPosition,
+            # do tego czasu korygujemy wolne saldo o zmianę
+            with self.lock:
+                if event['T'] < self.updated_at:
+                    return
+                balance = self.balances.setdefault(event['a'], [0.0, 0.0])
+                balance[0] += float(event['d'])
+        elif kind == 'executionReport':
+            order = {
+                'symbol': event['s'],
+                'orderId': event['i'],
+                'clientOrderId': event['c'],
+                'side': event['S'],
+                'type': event['o'],
+                'status': event['X'],
+                'origQty': event['q'],
+                'executedQty': event['z'],
+                'cummulativeQuoteQty': event['Z'],
+                'stopPrice': event['P'],
+                'price': event['p'],
+                'updateTime': event['T'],
+            }
+            with self.lock:
+                previous = self.open_orders.get(order['orderId']) or self.finished.get(order['orderId'])
+                if previous is not None and previous['updateTime'] > order['updateTime']:
+                    return
+                if order['status'] in FINAL_STATUSES:
+                    self.open_orders.pop(order['orderId'], None)
+                    self.finished[order['orderId']] = order
+                    while len(self.finished) > FINISHED_ORDERS:
+                        self.finished.popitem(last=False)
+                else:
+                    self.open_orders[order['orderId']] = order
+            for listener in self.listeners:
+                try:
+                    listener(order)
+                except Exception as e:
+                    logger.error(f"Błąd obsługi aktualizacji zlecenia {order['orderId']}: {e}", exc_info=True)
+
+    def set_live(self, live):
+        with self.lock:
+            self.live = live
+
+
+def _order_fields(order):
+    fields = ('symbol', 'orderId', 'clientOrderId', 'side', 'type', 'status', 'origQty', 'executedQty', 'cummulativeQuoteQty', 'stopPrice', 'price', 'updateTime')
+    return {field: order.get(field) for field in fields}
+
+
+class UserDataStream:
+    # Strumień danych użytkownika Binance (listenKey) zasilający AccountCache. Po każdym
+    # połączeniu i co ACCOUNT_RECONCILE_SECONDS stan jest uzgadniany z REST (get_account,
+    # get_open_orders), a listenKey odświeżany co LISTEN_KEY_KEEPALIVE_SECONDS.
+    def __init__(self, client, cache=None, url=USER_STREAM_URL, reconcile_seconds=ACCOUNT_RECONCILE_SECONDS):
+        self.client = client
+        self.cache = cache or AccountCache()
+        self.url = url
+        self.reconcile_seconds = reconcile_seconds
+        self._stopped = asyncio.Event()
+        self._connection = None
+
+    def stop(self):
+        self._stopped.set()
+        if self._connection is not None:
+            asyncio.ensure_future(self._connection.close())
+
+    def reconcile(self):
+        account = self.client.get_account()
+        open_orders = self.client.get_open_orders()
+        drift = self.cache.load(account, open_orders)
+        if drift:
+            logger.warning(f"Salda ze strumienia konta różniły się od REST dla: {', '.join(drift)}. Poprawiono.")
+
+    def _dispatch(self, message):
+        # Zwraca False, gdy listenKey wygasł i trzeba połączyć się z nowym
+        event = json.loads(message)
+        if event.get('e') == 'listenKeyExpired':
+            logger.warning("listenKey strumienia konta wygasł.")
+            return False
+        self.cache.apply(event)
+        return True
+
+    async def _maintain(self, listen_key):
+        # Okresowe odświeżanie listenKey i uzgadnianie z REST w trakcie połączenia
+        next_keepalive = time.monotonic() + LISTEN_KEY_KEEPALIVE_SECONDS
+        next_reconcile = time.monotonic() + self.reconcile_seconds
+        while True:
+            await asyncio.sleep(max(0.0, min(next_keepalive, next_reconcile) - time.monotonic()))
+            try:
+                if time.monotonic() >= next_keepalive:
+                    await asyncio.to_thread(self.client.stream_keepalive, listen_key)
+                    next_keepalive = time.monotonic() + LISTEN_KEY_KEEPALIVE_SECONDS
+                if time.monotonic() >= next_reconcile:
+                    await asyncio.to_thread(self.reconcile)
+                    next_reconcile = time.monotonic() + self.reconcile_seconds
+            except BinanceAPIException as e:
+                logger.warning(f"Błąd podtrzymania strumienia konta: {e}")
+                next_keepalive = min(next_keepalive, time.monotonic() + 60)
+                next_reconcile = min(next_reconcile, time.monotonic() + 60)
+
+    async def run(self):
+        delay = RECONNECT_DELAY_MIN
+        while not self._stopped.is_set():
+            maintain = None
+            try:
+                listen_key = await asyncio.to_thread(self.client.stream_get_listen_key)
+                async with websockets.connect(f"{self.url}/{listen_key}") as connection:
+                    self._connection = connection
+                    # Zdarzenia z czasu pobierania migawki czekają w buforze połączenia
+                    # i są nakładane po niej (starsze od migawki są pomijane)
+                    await asyncio.to_thread(self.reconcile)
+                    self.cache.set_live(True)
+                    logger.info("Połączono ze strumieniem konta.")
+                    delay = RECONNECT_DELAY_MIN
+                    maintain = asyncio.create_task(self._maintain(listen_key))
+                    async for message in connection:
+                        if not self._dispatch(message) or self._stopped.is_set():
+                            break
+            except (OSError, BinanceAPIException, websockets.exceptions.WebSocketException) as e:
+                logger.warning(f"Utracono połączenie ze strumieniem konta: {e}. Ponowna próba za {delay}s.")
+            finally:
+                self.cache.set_live(False)
+                self._connection = None
+                if maintain is not None:
+                    maintain.cancel()
+            if not self._stopped.is_set():
+                try:
+                    await asyncio.wait_for(self._stopped.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                delay = min(delay * 2, RECONNECT_DELAY_MAX)
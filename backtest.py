@@ -0,0 +1,161 @@
+import logging
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+from binance.client import Client
+from binance.helpers import date_to_milliseconds
+
+import kernels
+import strategy
+import timeframes
+from candle_store import CandleStore
+from config import *
+from data import as_daily
+
+logger = logging.getLogger("binance_bot")
+
+PREPARED_CACHE_SIZE = 4  # Ile tabel wskaźników (zestawów okresów) trzyma cache procesu roboczego
+
+
+def load_history(client, symbol=SYMBOL, interval=INTERVAL, start=BACKTEST_START_DATE, regime_period=REGIME_FILTER_PERIOD):
+    # Historia świec strategii oraz świece dzienne z zapasem na SMA reżimu, z lokalnego
+    # magazynu - z sieci pobierane są tylko świece nowsze niż ostatnia zapisana
+    start_ms = date_to_milliseconds(start)
+    daily_start_ms = start_ms - regime_period * timeframes.DAY_MS
+    store = CandleStore.open(CANDLE_STORE_DIR, symbol, interval)
+    store.ensure(client, start_ms)
+    daily_store = CandleStore.open(CANDLE_STORE_DIR, symbol, Client.KLINE_INTERVAL_1DAY)
+    daily_store.ensure(client, daily_start_ms)
+    return store.to_df(start_ms=start_ms), as_daily(daily_store.to_df(start_ms=daily_start_ms))
+
+
+def add_live_regime(df, df_daily, period, cache=None):
+    # Odtwarza filtr reżimu tak, jak widzi go bot na żywo: świeca dzienna dla bieżącej
+    # daty jest jeszcze otwarta, więc jej "close" to aktualna cena, a SMA obejmuje
+    # period-1 zamkniętych dni plus bieżącą cenę. Dzięki temu backtest nie zagląda
+    # w przyszłość przez zamknięcie dnia, które w chwili sygnału nie było znane.
+    close = df['close'].to_numpy(dtype=float)
+    df['daily_close'] = close
+    key = ('regime', period, df['timestamp'].iloc[0], len(df)) if len(df) else ('regime', period, None, 0)
+    prev_sum = strategy._cached(cache, key, lambda: _prev_days_sum(df, df_daily, period))
+    df['daily_regime_sma'] = (prev_sum + close) / period
+    return df
+
+
+def _prev_days_sum(df, df_daily, period):
+    # Suma period-1 ostatnich dni zamkniętych przed dniem każdej świecy (NaN, jeśli brak historii)
+    daily_close = df_daily['close'].to_numpy(dtype=float)
+    if period > 1:
+        prev_sum = pd.Series(daily_close).rolling(period - 1).sum().to_numpy()
+    else:
+        prev_sum = np.zeros(len(daily_close))
+    return timeframes.take(prev_sum, timeframes.closed_index(df['timestamp'], df_daily.index, '1d'))
+
+
+def prepare(df, df_daily=None, params=None, cache=None):
+    # Liczy wskaźniki (ten sam kod co bot) oraz maski sygnałów dla całej historii. Z cache
+    # (proces roboczy optymalizatora) tabela wskaźników powstaje raz na zestaw okresów
+    # i jest współdzielona przez kombinacje różniące się tylko progami RSI i stop lossem.
+    p = params or strategy.default_params()
+    if cache is None:
+        df = _indicator_frame(df, df_daily, p, cache)
+    else:
+        frames = cache.setdefault('prepared', OrderedDict())
+        key = _indicator_key(p, df_daily)
+        if key in frames:
+            frames.move_to_end(key)
+        else:
+            frames[key] = _indicator_frame(df, df_daily, p, cache)
+            while len(frames) > PREPARED_CACHE_SIZE:
+                frames.popitem(last=False)
+        df = frames[key]
+    return df, strategy.buy_signals(df, p), strategy.sell_signals(df, p)
+
+
+def _indicator_key(p, df_daily):
+    # Parametry, od których zależą kolumny wskaźników - pozostałe zmieniają tylko sygnały i symulację
+    regime = p['USE_MARKET_REGIME_FILTER'] and df_daily is not None and not df_daily.empty
+    return (p['EMA_SHORT'], p['EMA_LONG'], p['RSI_PERIOD'], p['ATR_PERIOD'],
+            p['USE_DYNAMIC_RISK'] and p['ADX_PERIOD_FOR_RISK'], regime and p['REGIME_FILTER_PERIOD'])
+
+
+def _indicator_frame(df, df_daily, p, cache):
+    # Płytka kopia: nowe kolumny trafiają tylko do niej, same świece (np. memmap) nie są kopiowane
+    df = strategy.calculate_indicators(df.copy(deep=False), None, p, cache)
+    if p['USE_MARKET_REGIME_FILTER'] and df_daily is not None and not df_daily.empty:
+        df = add_live_regime(df, df_daily, p['REGIME_FILTER_PERIOD'], cache)
+    df.reset_index(drop=True, inplace=True)
+    return df
+
+
+def simulate(df, buy, sell, params=None, initial_capital=INITIAL_CAPITAL):
+    # Pętla ścieżkowa: wejście na zamknięciu świecy z sygnałem, potem na każdej
+    # kolejnej świecy ta sama kontrola SL i aktualizacja trailing stopu co w
+    # _monitor_and_manage_position. Sama pętla to kernels.run_path na tablicach float64.
+    p = params or strategy.default_params()
+    close = df['close'].to_numpy(dtype=float)
+    atr = df['atr'].to_numpy(dtype=float)
+    adx = df['adx'].to_numpy(dtype=float) if 'adx' in df else np.zeros(len(df))
+    timestamps = df['timestamp'].to_numpy()
+
+    equity, trades = kernels.run_path(close, atr, adx, buy, sell, p, initial_capital, strategy.MIN_ORDER_USDC)
+
+    trades_df = pd.DataFrame({
+        'entry_time': timestamps[trades[:, kernels.ENTRY_INDEX].astype(np.int64)],
+        'exit_time': timestamps[trades[:, kernels.EXIT_INDEX].astype(np.int64)],
+        'side': np.where(trades[:, kernels.SIDE] == kernels.BUY, 'BUY', 'SELL'),
+        'entry_price': trades[:, kernels.ENTRY_PRICE],
+        'exit_price': trades[:, kernels.EXIT_PRICE],
+        'size_usdc': trades[:, kernels.SIZE_USDC],
+        'pnl_usdc': trades[:, kernels.PNL_USDC],
+        'pnl_percent': trades[:, kernels.PNL_PERCENT],
+    })
+    equity_curve = pd.Series(equity, index=pd.DatetimeIndex(timestamps), name='equity')
+    return equity_curve, trades_df
+
+
+def summarize(equity_curve, trades_df, initial_capital=INITIAL_CAPITAL):
+    final = float(equity_curve.iloc[-1]) if len(equity_curve) else float(initial_capital)
+    running_max = np.maximum.accumulate(equity_curve.to_numpy()) if len(equity_curve) else np.array([initial_capital])
+    drawdown = (equity_curve.to_numpy() / running_max - 1) * 100 if len(equity_curve) else np.array([0.0])
+    wins = int((trades_df['pnl_usdc'] > 0).sum())
+    return {
+        'initial_capital': float(initial_capital),
+        'final_capital': final,
+        'total_return_percent': (final / initial_capital - 1) * 100,
+        'max_drawdown_percent': float(drawdown.min()),
+        'trades': len(trades_df),
+        'win_rate_percent': wins / len(trades_df) * 100 if len(trades_df) else 0.0,
+    }
+
+
+def run_backtest(df, df_daily=None, params=None, initial_capital=INITIAL_CAPITAL, cache=None):
+    p = params or strategy.default_params()
+    df, buy, sell = prepare(df, df_daily, p, cache)
+    equity_curve, trades_df = simulate(df, buy, sell, p, initial_capital)
+    return {
+        'equity': equity_curve,
+        'trades': trades_df,
+        'stats': summarize(equity_curve, trades_df, initial_capital),
+    }
+
+
+def main():
+    client = Client()  # Publiczne dane rynkowe nie wymagają kluczy API
+    df, df_daily = load_history(client)
+
+    started = time.perf_counter()
+    result = run_backtest(df, df_daily)
+    elapsed = time.perf_counter() - started
+
+    stats = result['stats']
+    logger.info(f"Backtest {SYMBOL} {INTERVAL}: {len(df)} świec w {elapsed:.3f}s")
+    logger.info(f"  Kapitał: {stats['initial_capital']:.2f} -> {stats['final_capital']:.2f} USDC ({stats['total_return_percent']:+.2f}%)")
+    logger.info(f"  Transakcje: {stats['trades']}, skuteczność: {stats['win_rate_percent']:.1f}%, max DD: {stats['max_drawdown_percent']:.2f}%")
+
+    result['trades'].to_csv(BACKTEST_TRADES_FILE, index=False)
+    result['equity'].to_csv(BACKTEST_EQUITY_FILE)
+    logger.info(f"Zapisano transakcje do {BACKTEST_TRADES_FILE} i krzywą kapitału do {BACKTEST_EQUITY_FILE}.")
+    return result
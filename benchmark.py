@@ -0,0 +1,343 @@
+import gc
+import json
+import logging
+import os
+import platform
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+from binance.helpers import interval_to_milliseconds
+
+import backtest
+import kernels
+import optimize
+import robustness
+import strategy
+from candle_store import CandleStore
+from config import *
+from data import KLINE_DTYPE, as_daily, klines_to_df, parse_klines
+from indicators import IndicatorEngine
+from timeframes import DAY_MS
+
+logger = logging.getLogger("binance_bot")
+
+PATH_LOOP_ROWS = 100_000
+PATH_LOOP_MIN_SPEEDUP = 100
+OPTIMIZER_COMBOS = 4        # Kombinacje siatki liczone w jednym pomiarze optymalizatora
+MONTE_CARLO_BENCH_RUNS = 1000
+TICKS_PER_CANDLE = 4        # Tiki syntetyczne: open, high, low, close każdej świecy
+SEED_CANDLES = 300          # Historia do inicjalizacji wskaźników przed pierwszym tikiem
+
+
+# --- Dane testowe (bez sieci) ----------------------------------------------------
+
+def _format_klines(timestamps, open_, high, low, close, volume, interval_ms):
+    # Surowe świece w formacie odpowiedzi get_klines (liczby jako tekst)
+    return [[int(t), f"{o:.2f}", f"{h:.2f}", f"{l:.2f}", f"{c:.2f}", f"{v:.5f}", int(t) + interval_ms - 1, "0", 0, "0", "0", "0"]
+            for t, o, h, l, c, v in zip(timestamps.tolist(), open_.tolist(), high.tolist(), low.tolist(), close.tolist(), volume.tolist())]
+
+
+def synthetic_klines(n, interval=INTERVAL, seed=0, start_ms=1577836800000):
+    # Losowy spacer cen z deterministycznym ziarnem - ten sam zestaw przy każdym uruchomieniu
+    interval_ms = interval_to_milliseconds(interval)
+    rng = np.random.default_rng(seed)
+    close = 30000 * np.exp(np.cumsum(rng.normal(0, 0.003, n)))
+    open_ = np.concatenate(([close[0]], close[:-1]))
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.001, n)))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.001, n)))
+    timestamps = start_ms + np.arange(n, dtype=np.int64) * interval_ms
+    return _format_klines(timestamps, open_, high, low, close, rng.random(n), interval_ms)
+
+
+def recorded_klines(n, symbol=SYMBOL, interval=INTERVAL):
+    # Ostatnie n świec z lokalnego magazynu (zapisanych przez bota lub backtest), bez pobierania
+    if not os.path.isdir(os.path.join(CANDLE_STORE_DIR, f"{symbol}_{interval}")):
+        return None
+    store = CandleStore.open(CANDLE_STORE_DIR, symbol, interval)
+    if len(store) < n:
+        return None
+    columns = {name: np.asarray(store.column(name)[len(store) - n:]) for name in ('timestamp', 'open', 'high', 'low', 'close', 'volume')}
+    return _format_klines(columns['timestamp'], columns['open'], columns['high'], columns['low'], columns['close'],
+                          columns['volume'], interval_to_milliseconds(interval))
+
+
+def daily_klines(klines, history_days=REGIME_FILTER_PERIOD, seed=0):
+    # Świece dzienne zagregowane z klines, poprzedzone syntetycznymi dniami, żeby SMA
+    # reżimu była dostępna od pierwszej świecy (inaczej filtr blokuje wszystkie sygnały)
+    df = klines_to_df(klines)
+    daily = df.set_index('timestamp').resample('1D').agg({'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last', 'volume': 'sum'})
+    first_day = int(daily.index[0].value // 10**6)
+    rng = np.random.default_rng(seed)
+    prefix = daily['open'].iloc[0] * np.exp(-np.cumsum(rng.normal(0, 0.02, history_days)))[::-1]
+    timestamps = np.concatenate((first_day - np.arange(history_days, 0, -1, dtype=np.int64) * DAY_MS,
+                                 daily.index.to_numpy(dtype='datetime64[ms]').astype(np.int64)))
+    close = np.concatenate((prefix, daily['close'].to_numpy()))
+    open_ = np.concatenate((prefix, daily['open'].to_numpy()))
+    high = np.concatenate((prefix, daily['high'].to_numpy()))
+    low = np.concatenate((prefix, daily['low'].to_numpy()))
+    volume = np.concatenate((np.zeros(history_days), daily['volume'].to_numpy()))
+    return _format_klines(timestamps, open_, high, low, close, volume, DAY_MS)
+
+
+def synthetic_path(n, seed=0, signal_rate=0.01):
+    # Tablice wejściowe pętli ścieżkowej: ceny, ATR/ADX i rzadkie sygnały
+    rng = np.random.default_rng(seed)
+    close = 30000 * np.exp(np.cumsum(rng.normal(0, 0.004, n)))
+    atr = close * rng.uniform(0.002, 0.01, n)
+    adx = rng.uniform(5, 60, n)
+    signal = rng.random(n) < signal_rate
+    long_side = rng.random(n) < 0.5
+    return pd.DataFrame({
+        'timestamp': pd.date_range('2020-01-01', periods=n, freq='h'),
+        'close': close, 'atr': atr, 'adx': adx,
+        'buy': signal & long_side, 'sell': signal & ~long_side,
+    })
+
+
+def synthetic_ticks(df, n):
+    # n tików TRADE po świecach następujących po historii inicjalizującej
+    import tick_sim
+    candles = df.iloc[SEED_CANDLES:SEED_CANDLES + -(-n // TICKS_PER_CANDLE)]
+    start = candles['timestamp'].to_numpy(dtype='datetime64[ms]').astype(np.int64)
+    offsets = np.array([1, 200000, 400000, 899000])
+    ticks = []
+    for t, o, h, l, c in zip(start.tolist(), candles['open'].tolist(), candles['high'].tolist(), candles['low'].tolist(), candles['close'].tolist()):
+        for offset, price in zip(offsets.tolist(), (o, h, l, c)):
+            ticks.append((t + offset, tick_sim.TRADE, price, 0.01))
+    return ticks[:n]
+
+
+# --- Pomiar ----------------------------------------------------------------------
+
+def _measure(fn, repeats):
+    # Najlepszy i środkowy czas z repeats uruchomień oraz szczyt pamięci z osobnego
+    # uruchomienia pod tracemalloc (który sam spowalnia kod, więc nie liczy się do czasu)
+    level = logger.level
+    logger.setLevel(logging.WARNING)
+    try:
+        times = []
+        for _ in range(repeats):
+            gc.collect()
+            started = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - started)
+        gc.collect()
+        tracemalloc.start()
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    finally:
+        logger.setLevel(level)
+    return min(times), float(np.median(times)), peak
+
+
+def _stages(klines, params):
+    # Etapy ścieżek krytycznych: (nazwa, funkcja) na danych przygotowanych raz dla rozmiaru
+    p = params
+    df = klines_to_df(klines)
+    df_daily = as_daily(klines_to_df(daily_klines(klines)))
+    ohlcv = df[['timestamp', 'open', 'high', 'low', 'close', 'volume']]
+
+    indexed = ohlcv.set_index('timestamp')
+    daily_sma = df_daily.copy()
+    daily_sma['regime_sma'] = daily_sma['close'].rolling(p['REGIME_FILTER_PERIOD']).mean()
+
+    prepared, buy, sell = backtest.prepare(ohlcv, df_daily, p)
+    _, trades = backtest.simulate(prepared, buy, sell, p)
+    returns = robustness.trade_returns(trades)
+
+    combos = list(optimize.param_grid())[:OPTIMIZER_COMBOS]
+    span_days = max(2, int((df['timestamp'].iloc[-1] - df['timestamp'].iloc[0]) / pd.Timedelta(days=1)))
+    windows = robustness.walk_forward_windows(ohlcv, max(1, span_days // 2), max(1, span_days // 4))
+
+    def optimizer():
+        optimize._worker.update(df=ohlcv, df_daily=df_daily, cache={})
+        for combo in combos:
+            optimize._evaluate(combo)
+
+    def walk_forward():
+        optimize._worker.update(df=ohlcv, df_daily=df_daily, cache={}, windows=windows)
+        robustness._evaluate_windows(combos[0])
+
+    buffer = np.empty(len(klines), dtype=KLINE_DTYPE)
+
+    stages = [
+        ('parse_klines', lambda: klines_to_df(klines)),
+        ('parse_klines_buffer', lambda: parse_klines(klines, out=buffer)),
+        ('indicators', lambda: strategy.calculate_indicators(ohlcv.copy(), None, p)),
+        ('regime_join', lambda: strategy.join_daily(indexed, daily_sma)),
+        ('signals', lambda: (strategy.buy_signals(prepared, p), strategy.sell_signals(prepared, p))),
+        ('indicator_engine', lambda: IndicatorEngine(p).sync(ohlcv, in_progress=False)),
+        ('backtest_prepare', lambda: backtest.prepare(ohlcv, df_daily, p)),
+        ('backtest_simulate', lambda: backtest.simulate(prepared, buy, sell, p)),
+        ('optimizer', optimizer),
+    ]
+    if windows:
+        stages.append(('walk_forward', walk_forward))
+    if len(returns):
+        stages.append(('monte_carlo', lambda: robustness.monte_carlo(returns, MONTE_CARLO_BENCH_RUNS, processes=1, seed=0)))
+    return stages, ohlcv, df_daily
+
+
+def _tick_stage(ohlcv, df_daily, rows, params):
+    import tick_sim
+    ticks = synthetic_ticks(ohlcv, rows)
+
+    def run():
+        tick_sim.TickSimulator(params=params).run(ticks, ohlcv, df_daily)
+    return run
+
+
+def run_suite(sizes=BENCHMARK_SIZES, repeats=BENCHMARK_REPEATS, params=None):
+    p = params or strategy.default_params()
+    fixtures = []
+    for rows in sizes:
+        fixtures.append(('synthetic', rows, synthetic_klines(rows + SEED_CANDLES)))
+        recorded = recorded_klines(rows + SEED_CANDLES)
+        if recorded is not None:
+            fixtures.append(('recorded', rows, recorded))
+
+    results = []
+    for fixture, rows, klines in fixtures:
+        stage_repeats = 1 if rows == max(sizes) and len(sizes) > 1 else repeats
+        stages, ohlcv, df_daily = _stages(klines, p)
+        if rows <= BENCHMARK_TICK_MAX_ROWS:
+            stages.append(('tick_sim', _tick_stage(ohlcv, df_daily, rows, p)))
+        for stage, fn in stages:
+            best, median, peak = _measure(fn, stage_repeats)
+            results.append({
+                'fixture': fixture,
+                'stage': stage,
+                'rows': rows,
+                'seconds': best,
+                'median_seconds': median,
+                'us_per_row': best / rows * 1e6,
+                'peak_mb': peak / 2**20,
+                'repeats': stage_repeats,
+            })
+            logger.info(f"  {fixture:9} {rows:>9} {stage:18} {best * 1000:10.2f} ms {best / rows * 1e6:9.3f} us/wiersz {peak / 2**20:9.1f} MB")
+    return results
+
+
+# --- Kernel ścieżkowy kontra pętla pandas ----------------------------------------
+
+def pandas_path_loop(df, params, initial_capital=INITIAL_CAPITAL):
+    # Referencja: ta sama pętla wiersz po wierszu przez df.iloc i funkcje strategy,
+    # czyli tak, jak wyglądałby backtest bez kernela
+    capital = initial_capital
+    position = None
+    equity = np.empty(len(df))
+    trades = []
+    for i in range(len(df)):
+        row = df.iloc[i]
+        price = row['close']
+        if position is not None:
+            if strategy.stop_loss_hit(position['side'], position['stop_loss'], price):
+                pnl_usdc, pnl_percent = strategy.position_pnl(position['side'], position['entry_price'], position['stop_loss'], position['size_usdc'])
+                capital += pnl_usdc
+                trades.append((position['entry_index'], i, position['side'], position['entry_price'], position['stop_loss'],
+                               position['size_usdc'], pnl_usdc, pnl_percent))
+                position = None
+            elif params['USE_TRAILING_STOP']:
+                position['stop_loss'] = strategy.trail_stop_loss(position['side'], position['stop_loss'], price, row['atr'], params)
+        elif (row['buy'] or row['sell']) and capital > strategy.MIN_ORDER_USDC:
+            side = 'BUY' if row['buy'] else 'SELL'
+            stop_loss = strategy.initial_stop_loss(side, price, row['atr'], params)
+            size = min(strategy.position_size_usdc(capital, price, stop_loss, row['adx'], params), capital)
+            if size >= strategy.MIN_ORDER_USDC:
+                position = {'side': side, 'entry_price': price, 'stop_loss': stop_loss, 'size_usdc': size, 'entry_index': i}
+        equity[i] = capital + (strategy.position_pnl(position['side'], position['entry_price'], price, position['size_usdc'])[0] if position else 0)
+    return equity, trades
+
+
+def _as_rows(trades):
+    return [(int(t[kernels.ENTRY_INDEX]), int(t[kernels.EXIT_INDEX]), 'BUY' if t[kernels.SIDE] == kernels.BUY else 'SELL',
+             *map(float, t[kernels.ENTRY_PRICE:])) for t in trades]
+
+
+def bench_path_loop(rows=PATH_LOOP_ROWS, params=None):
+    p = params or strategy.default_params()
+    df = synthetic_path(rows)
+    arrays = [df[c].to_numpy() for c in ('close', 'atr', 'adx', 'buy', 'sell')]
+
+    kernels.run_path(*[a[:100] for a in arrays], p, INITIAL_CAPITAL, strategy.MIN_ORDER_USDC) # Kompilacja Numby poza pomiarem
+    started = time.perf_counter()
+    equity, trades = kernels.run_path(*arrays, p, INITIAL_CAPITAL, strategy.MIN_ORDER_USDC)
+    kernel_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    ref_equity, ref_trades = pandas_path_loop(df, p)
+    pandas_seconds = time.perf_counter() - started
+
+    if not np.array_equal(equity, ref_equity) or _as_rows(trades) != ref_trades:
+        raise AssertionError("Kernel ścieżkowy daje inny wynik niż pętla referencyjna.")
+    return {
+        'rows': rows,
+        'trades': len(trades),
+        'numba': kernels.njit is not None,
+        'kernel_seconds': kernel_seconds,
+        'pandas_seconds': pandas_seconds,
+        'speedup': pandas_seconds / kernel_seconds,
+    }
+
+
+# --- Zapis i porównanie ----------------------------------------------------------
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def compare(baseline, results, ratio=BENCHMARK_REGRESSION_RATIO):
+    # Etapy wolniejsze niż w pliku bazowym o więcej niż ratio: (etap, stary czas, nowy czas)
+    old = {(r['fixture'], r['stage'], r['rows']): r['seconds'] for r in baseline['results']}
+    slower = []
+    for r in results:
+        key = (r['fixture'], r['stage'], r['rows'])
+        if key in old and r['seconds'] > old[key] * ratio:
+            slower.append((key, old[key], r['seconds']))
+    return slower
+
+
+def main(baseline_file=None):
+    logger.info(f"Benchmark etapów strategii dla {BENCHMARK_SIZES} świec:")
+    results = run_suite()
+    path_loop = bench_path_loop()
+    logger.info(f"Pętla ścieżkowa, {path_loop['rows']} świec (numba: {'tak' if path_loop['numba'] else 'nie'}): "
+                f"kernel {path_loop['kernel_seconds'] * 1000:.1f} ms, pandas {path_loop['pandas_seconds']:.2f} s, "
+                f"przyspieszenie {path_loop['speedup']:.0f}x")
+    if path_loop['speedup'] < PATH_LOOP_MIN_SPEEDUP:
+        logger.warning(f"Przyspieszenie pętli ścieżkowej poniżej {PATH_LOOP_MIN_SPEEDUP}x.")
+
+    report = {
+        'commit': _git_commit(),
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'numba': kernels.njit is not None,
+        'machine': platform.machine(),
+        'results': results,
+        'path_loop': path_loop,
+    }
+    os.makedirs(BENCHMARK_DIR, exist_ok=True)
+    path = os.path.join(BENCHMARK_DIR, f"benchmark_{report['commit']}.json")
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=1)
+    logger.info(f"Zapisano wyniki do {path}.")
+
+    if baseline_file:
+        with open(baseline_file) as f:
+            baseline = json.load(f)
+        slower = compare(baseline, results)
+        for (fixture, stage, rows), old, new in slower:
+            logger.warning(f"Regresja względem {baseline['commit']}: {stage} ({fixture}, {rows} świec) {old * 1000:.2f} ms -> {new * 1000:.2f} ms")
+        if not slower:
+            logger.info(f"Brak regresji względem {baseline['commit']} (próg {BENCHMARK_REGRESSION_RATIO}x).")
+    return report
@@ -5,11 +5,29 @@ import pandas as pd
 import numpy as np
 from binance.client import Client
 from binance.exceptions import BinanceAPIException
+from binance.helpers import interval_to_milliseconds
 from datetime import datetime, timedelta
-import pandas_ta as ta
 import telegram
 from dotenv import load_dotenv
 import json
+import sys
+import asyncio
+import threading
+import requests
+
+import metrics
+import strategy
+from data import KLINE_DTYPE, parse_klines, as_daily
+from candle_store import CandleStore
+from exchange_stop import ExchangeStop, average_price, round_step, symbol_filters
+from indicators import IndicatorEngine, snapshot_row
+from account_stream import UserDataStream, USER_STREAM_URL, TESTNET_USER_STREAM_URL
+from notifier import TelegramNotifier
+from rest_client import AsyncBinanceClient, BudgetAdapter, API_URL as REST_API_URL, TESTNET_API_URL as REST_TESTNET_API_URL
+from market_stream import MarketDataFeed, STREAM_URL, TESTNET_STREAM_URL
+from scheduler import CandleScheduler, ServerClock
+from state_journal import StateJournal
+from risk import PortfolioRisk
 
 # Importuj konfigurację
 from config import *
@@ -35,19 +53,77 @@ TELEGRAM_TOKEN = os.getenv('TELEGRAM_TOKEN')
 TELEGRAM_CHAT_ID = os.getenv('TELEGRAM_CHAT_ID')
 
 STATE_FILE = "state.json"
+SEED_KLINES = 200  # Historia do inicjalizacji silnika wskaźników
+SYNC_KLINES = 3    # Przy kolejnych sprawdzeniach wystarczą najnowsze świece
+
+def create_client(pool_size=10):
+    client = Client(API_KEY, API_SECRET)
+    
+    # Przełącz na Testnet, jeśli jest włączony w konfiguracji
+    if USE_TESTNET:
+        client.API_URL = 'https://testnet.binance.vision/api'
+        logger.info("Łączenie z Binance Spot Testnet...")
+    
+    # Jedna sesja HTTP (keep-alive) współdzielona przez wszystkie instancje, z tym samym
+    # budżetem wagi zapytań co klient asynchroniczny
+    adapter = BudgetAdapter(pool_connections=1, pool_maxsize=pool_size)
+    client.session.mount('https://', adapter)
+    client.session.hooks['response'].append(metrics.record_response)
+    return client
+
+def create_rest_client(pool_size=10):
+    # Klient asynchroniczny do równoległych zapytań cyklu (świece, świece dzienne, saldo)
+    return AsyncBinanceClient(API_KEY, API_SECRET, REST_TESTNET_API_URL if USE_TESTNET else REST_API_URL, pool_size=pool_size)
+
+def create_account_stream(client):
+    # Jeden strumień danych użytkownika na konto (wspólny dla wszystkich instancji)
+    if USE_ACCOUNT_STREAM and API_KEY:
+        return UserDataStream(client, url=TESTNET_USER_STREAM_URL if USE_TESTNET else USER_STREAM_URL)
+    return None
+
+def create_notifier():
+    if TELEGRAM_TOKEN and TELEGRAM_CHAT_ID:
+        return TelegramNotifier(telegram.Bot(token=TELEGRAM_TOKEN), TELEGRAM_CHAT_ID)
+    return None
 
 class BinanceTradingBot:
-    def __init__(self):
-        self.client = Client(API_KEY, API_SECRET)
+    def __init__(self, symbol=SYMBOL, interval=INTERVAL, params=None, client=None, notifier=None,
+                 state_file=STATE_FILE, label='', daily_summary=True, rest=None, account_stream=None, risk=None,
+                 candle_store_dir=CANDLE_STORE_DIR):
+        self.symbol = symbol
+        self.interval = interval
+        # Z podstawionym klientem (np. FakeExchange w symulatorze) wszystkie zapytania idą przez niego
+        self.rest = rest or (create_rest_client() if client is None else None)
+        self.client = client or create_client()
+        self.account_stream = account_stream or (create_account_stream(self.client) if client is None else None)
+        self.account = self.account_stream.cache if self.account_stream else None
+        if self.account:
+            self.account.listeners.append(self._on_order_update)
+        self.notifier = notifier or create_notifier()
+        self.state_file = state_file
+        self.journal = StateJournal(state_file)
+        self.label = label # Prefiks wiadomości Telegram, gdy działa wiele instancji
+        self.daily_summary = daily_summary
         
-        # Przełącz na Testnet, jeśli jest włączony w konfiguracji
-        if USE_TESTNET:
-            self.client.API_URL = 'https://testnet.binance.vision/api'
-            logger.info("Łączenie z Binance Spot Testnet...")
-        
-        self.telegram_bot = None
-        if TELEGRAM_TOKEN and TELEGRAM_CHAT_ID:
-            self.telegram_bot = telegram.Bot(token=TELEGRAM_TOKEN)
+        self.params = params or strategy.default_params()
+        self.indicators = IndicatorEngine(self.params)
+        self._kline_buffer = np.empty(SEED_KLINES, dtype=KLINE_DTYPE) # Bufor parsowania świec z REST
+        self.interval_ms = interval_to_milliseconds(interval)
+        self.candles = CandleStore.open(candle_store_dir, symbol, interval)
+        self.daily_candles = CandleStore.open(candle_store_dir, symbol, Client.KLINE_INTERVAL_1DAY)
+        self._feed = None
+        self._monitor_task = None
+        self._jobs = {} # Blokujące operacje zlecone z pętli zdarzeń do wątków (nazwa -> zadanie)
+        # Zamknięcie pozycji i zmiany silnika wskaźników / bufora / magazynu świec przychodzą
+        # z kilku wątków naraz (tiki, strumień konta, cykl świecy, backfill)
+        self._position_lock = threading.Lock()
+        self._candles_lock = threading.Lock()
+        self.cycle_timings = {} # Czasy etapów bieżącego cyklu (do linii w logu)
+        self.exchange_stop = ExchangeStop(self.client, symbol, account=self.account) if USE_EXCHANGE_STOP_LOSS else None
+        self.risk = risk # Wspólne ryzyko portfela instancji (None - wielkość tylko z salda i ryzyka na transakcję)
+        self.risk_key = f"{symbol} {interval}"
+        if self.risk:
+            self.risk.register(self.risk_key, symbol, interval)
         
         # Inicjalizacja stanu z wartościami domyślnymi
         self.in_position = False
@@ -58,56 +134,117 @@ class BinanceTradingBot:
         self.last_summary_date = datetime.now().date().isoformat()
         
         self._load_state()
+        self._reconcile_state()
+        if self.risk and self.in_position:
+            self.risk.open(self.risk_key, symbol, self.position_side, self.position_size_usdc, self.entry_price)
         
-        logger.info(f"Bot zainicjalizowany dla {SYMBOL} na interwale {INTERVAL}")
+        logger.info(f"Bot zainicjalizowany dla {symbol} na interwale {interval}")
         if not self.in_position:
              self._send_telegram_message("🤖 Bot został uruchomiony i szuka okazji do wejścia.")
         else:
              self._send_telegram_message(f"🤖 Bot został zrestartowany i kontynuuje zarządzanie pozycją {self.position_side} otwartą po cenie {self.entry_price:.4f}.")
 
-    def _save_state(self):
-        state = {
+    def _state(self):
+        return {
             "in_position": self.in_position,
             "position_side": self.position_side,
             "entry_price": self.entry_price,
             "position_size_usdc": self.position_size_usdc,
             "stop_loss": self.stop_loss,
+            "exchange_stop": self.exchange_stop.state() if self.exchange_stop else None,
             "last_summary_date": self.last_summary_date
         }
+
+    def _record(self, event, **data):
+        # Zdarzenie dopisane do dziennika stanu zamiast przepisywania całego state.json
         try:
-            with open(STATE_FILE, 'w') as f:
-                json.dump(state, f)
+            self.journal.append(event, **data)
+        except (IOError, OSError) as e:
+            logger.error(f"Błąd zapisu stanu: {e}")
+
+    def _save_state(self):
+        # Pełna migawka stanu (zwija dziennik) - przy zatrzymaniu bota
+        try:
+            self.journal.snapshot(self._state())
             logger.info("Stan bota został zapisany.")
-        except IOError as e:
+        except (IOError, OSError) as e:
             logger.error(f"Błąd zapisu stanu: {e}")
 
     def _load_state(self):
-        if not os.path.exists(STATE_FILE):
+        exists = os.path.exists(self.state_file) or os.path.exists(self.journal.wal_path)
+        if not exists:
             logger.info("Plik stanu nie istnieje. Uruchamiam z domyślnym stanem.")
-            return
         try:
-            with open(STATE_FILE, 'r') as f:
-                state = json.load(f)
-            self.in_position = state.get("in_position", False)
-            self.position_side = state.get("position_side")
-            self.entry_price = state.get("entry_price", 0)
-            self.position_size_usdc = state.get("position_size_usdc", 0)
-            self.stop_loss = state.get("stop_loss", 0)
-            self.last_summary_date = state.get("last_summary_date", datetime.now().date().isoformat())
+            state = self.journal.recover(self._state())
+        except (IOError, OSError) as e:
+            # Bez odczytanego dziennika nie wiadomo, czy pozycja jest otwarta - stan domyślny
+            # mógłby zgubić pozycję na giełdzie, a zapisy i tak nie miałyby dokąd trafić
+            logger.critical(f"Błąd wczytywania stanu: {e}. Bot nie zostanie uruchomiony.")
+            raise
+        self.in_position = state["in_position"]
+        self.position_side = state["position_side"]
+        self.entry_price = state["entry_price"]
+        self.position_size_usdc = state["position_size_usdc"]
+        self.stop_loss = state["stop_loss"]
+        if self.exchange_stop:
+            self.exchange_stop.restore(state["exchange_stop"])
+        self.last_summary_date = state["last_summary_date"]
+        if exists:
             logger.info("Stan bota został wczytany.")
-        except (IOError, json.JSONDecodeError) as e:
-            logger.error(f"Błąd wczytywania stanu: {e}. Używam stanu domyślnego.")
 
-    def _send_telegram_message(self, message):
-        if self.telegram_bot and TELEGRAM_CHAT_ID:
-            try:
-                self.telegram_bot.send_message(chat_id=TELEGRAM_CHAT_ID, text=message)
-            except Exception as e:
-                logger.error(f"Błąd wysyłania wiadomości Telegram: {e}")
+    def _reconcile_state(self):
+        # Stan z dziennika porównany z giełdą po starcie: stop wykonany w czasie przerwy
+        # zamyka pozycję, anulowany stop jest składany ponownie, a pozycja BUY bez aktywa
+        # na saldzie jest kasowana. Saldo bez pozycji w stanie nie jest ruszane - może
+        # należeć do użytkownika.
+        if not self.in_position:
+            return
+        base_asset = self.symbol.replace('USDC', '')
+        try:
+            if self.exchange_stop and self.exchange_stop.active:
+                status = self.exchange_stop.status()
+                if status == 'FILLED':
+                    logger.info("Stop loss został wykonany na giełdzie w czasie przerwy w działaniu bota.")
+                    self._close_position(self.stop_loss)
+                    return
+                if status in ('CANCELED', 'EXPIRED', 'REJECTED'):
+                    logger.warning(f"Zlecenie stop loss na giełdzie ma status {status}. Składam je ponownie.")
+                    self.exchange_stop.forget()
+            balance = self.client.get_asset_balance(asset=base_asset)
+            held = float(balance['free']) + float(balance['locked'])
+        except BinanceAPIException as e:
+            logger.error(f"Nie udało się uzgodnić stanu z giełdą: {e}")
+            return
 
-    def _get_account_balance(self, quote_asset='USDC'):
+        if self.position_side == 'BUY' and held * self.entry_price < strategy.MIN_ORDER_USDC:
+            msg = (f"⚠️ Pozycja {self.position_side} z pliku stanu nie istnieje na giełdzie (saldo {base_asset}: {held:.8f}). "
+                   f"Kasuję ją ze stanu - sprawdź historię zleceń.")
+            logger.warning(msg)
+            self._send_telegram_message(msg)
+            if self.exchange_stop:
+                self.exchange_stop.forget()
+            self._reset_position()
+            return
+        if self.exchange_stop and self.exchange_stop.active:
+            # Ostatnie przesunięcia trailing stopu mogły nie zdążyć trafić na giełdę
+            self.exchange_stop.request(self.stop_loss)
+            self._sync_exchange_stop(force=True)
+        elif self.exchange_stop:
+            self._place_exchange_stop()
+            self._record('exchange_stop', exchange_stop=self.exchange_stop.state())
+
+    @metrics.timed('telegram')
+    def _send_telegram_message(self, message):
+        # Tylko kolejkowanie - wysyłką zajmuje się wątek TelegramNotifier
+        if self.notifier:
+            self.notifier.send(self.label + message)
+
+    @metrics.timed('balance')
+    def _get_account_balance(self, quote_asset='USDC', account=None):
+        if self.account and self.account.live:
+            return self.account.free(quote_asset) # Saldo ze strumienia konta, bez zapytania REST
         try:
-            account = self.client.get_account()
+            account = account or self.client.get_account()
             for balance in account['balances']:
                 if balance['asset'] == quote_asset:
                     return float(balance['free'])
@@ -117,66 +254,81 @@ class BinanceTradingBot:
             logger.error(f"Błąd pobierania stanu konta: {e}")
             return 0
 
-    def _fetch_data(self, limit=200):
+    @metrics.timed('fetch')
+    def _fetch_data(self, limit=SYNC_KLINES, include_daily=True, start_time=None, klines=None, daily_klines=None):
+        # klines / daily_klines to odpowiedzi pobrane już równolegle przez _prefetch
         try:
-            klines = self.client.get_klines(symbol=SYMBOL, interval=INTERVAL, limit=limit)
-            df = pd.DataFrame(klines, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume', 'close_time', 'quote_asset_volume', 'number_of_trades', 'taker_buy_base_asset_volume', 'taker_buy_quote_asset_volume', 'ignore'])
-            for col in ['open', 'high', 'low', 'close', 'volume']:
-                df[col] = pd.to_numeric(df[col])
-            df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
+            if klines is None:
+                since = {'startTime': start_time} if start_time is not None else {}
+                klines = self.client.get_klines(symbol=self.symbol, interval=self.interval, limit=limit, **since)
+            # Świece parsowane raz do bufora wielokrotnego użytku (bez DataFrame); zamknięte
+            # trafiają do lokalnego magazynu (luki dociągane przez REST)
+            candles = parse_klines(klines, out=self._kline_buffer)
+            start_ms = int(candles['timestamp'][-1]) - SEED_KLINES * self.interval_ms if len(candles) else None
+            self.candles.sync(self.client, candles, start_ms=start_ms)
 
             df_daily = None
-            if USE_MARKET_REGIME_FILTER:
-                start_date_str = (datetime.utcnow() - timedelta(days=REGIME_FILTER_PERIOD * 2)).strftime("%d %b, %Y")
-                daily_klines = self.client.get_historical_klines(SYMBOL, Client.KLINE_INTERVAL_1DAY, start_date_str)
-                df_daily = pd.DataFrame(daily_klines, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume', 'close_time', 'quote_asset_volume', 'number_of_trades', 'taker_buy_base_asset_volume', 'taker_buy_quote_asset_volume', 'ignore'])
-                for col in ['open', 'high', 'low', 'close', 'volume']:
-                    df_daily[col] = pd.to_numeric(df_daily[col])
-                df_daily['timestamp'] = pd.to_datetime(df_daily['timestamp'], unit='ms').dt.date
-                df_daily.set_index('timestamp', inplace=True)
+            if include_daily and self.params['USE_MARKET_REGIME_FILTER']:
+                # Świece dzienne z magazynu - zapytanie do API tylko po zamknięciu nowego dnia
+                days = self.params['REGIME_FILTER_PERIOD'] * 2
+                # Zegar magazynu (w symulatorze czas symulacji) zamiast zegara systemowego
+                start_ms = self.daily_candles.clock() - int(timedelta(days=days).total_seconds() * 1000)
+                self.daily_candles.sync(self.client, daily_klines, start_ms=start_ms)
+                df_daily = self._new_daily()
             
-            return df, df_daily
+            return candles, df_daily
         except BinanceAPIException as e:
             logger.error(f"Błąd pobierania danych z Binance: {e}")
             return None, None
             
-    def _calculate_indicators(self, df, df_daily=None):
-        try:
-            df.set_index('timestamp', inplace=True)
-            df['ema_short'] = ta.ema(df['close'], length=EMA_SHORT)
-            df['ema_long'] = ta.ema(df['close'], length=EMA_LONG)
-            df['rsi'] = ta.rsi(df['close'], length=RSI_PERIOD)
-            df['atr'] = ta.atr(df['high'], df['low'], df['close'], length=ATR_PERIOD)
-            
-            if USE_DYNAMIC_RISK:
-                adx_df = ta.adx(df['high'], df['low'], df['close'], length=ADX_PERIOD_FOR_RISK)
-                if adx_df is not None and not adx_df.empty:
-                    df['adx'] = adx_df[f'ADX_{ADX_PERIOD_FOR_RISK}']
+    def _new_daily(self):
+        # Tabela dzienna dla filtra reżimu budowana tylko wtedy, gdy w magazynie jest dzień
+        # zamknięty po ostatnim znanym silnikowi wskaźników; w pozostałych cyklach None
+        if self.daily_candles.last_timestamp == self.indicators.last_daily_timestamp:
+            return None
+        return as_daily(self.daily_candles.to_df(limit=self.params['REGIME_FILTER_PERIOD'] * 2))
 
-            if USE_MARKET_REGIME_FILTER and df_daily is not None and not df_daily.empty:
-                df_daily['regime_sma'] = ta.sma(df_daily['close'], length=REGIME_FILTER_PERIOD)
-                
-                df['daily_close'] = df.index.to_series().dt.date.map(df_daily['close'])
-                df['daily_regime_sma'] = df.index.to_series().dt.date.map(df_daily['regime_sma'])
-            
-            df.reset_index(inplace=True)
-            df.dropna(inplace=True)
-            return df
+    @metrics.timed('indicators')
+    def _update_indicators(self, candles, df_daily=None):
+        # Zasila silnik wskaźników tylko nowymi zamkniętymi świecami. Przy luce w danych
+        # (pierwsze uruchomienie, dłuższa przerwa) inicjalizuje go od nowa z pełnej historii.
+        try:
+            if not self.indicators.sync(candles) or not self.indicators.ready:
+                logger.info("Inicjalizacja silnika wskaźników z lokalnego magazynu świec...")
+                self.indicators = IndicatorEngine(self.params)
+                self.indicators.sync(self.candles.to_df(limit=SEED_KLINES), in_progress=False)
+                self.indicators.sync(candles)
+                if not self.indicators.ready:
+                    logger.warning("Za mało historii do obliczenia wskaźników.")
+                    return None
+                if self.params['USE_MARKET_REGIME_FILTER']:
+                    df_daily = self._new_daily() # Nowy silnik nie zna jeszcze żadnego dnia
+            if df_daily is not None and not df_daily.empty:
+                self.indicators.sync_daily(df_daily, in_progress=False)
+            self._report_price()
+            # Sygnały tylko na zamkniętych świecach: świeca w trakcie jest tuż po otwarciu,
+            # więc jej "peek" powtarzałby wartości ostatniej zamkniętej i krzyżowanie RSI nie wystąpi
+            return self.indicators.closed()
         except Exception as e:
             logger.error(f"Błąd obliczania wskaźników: {e}")
             return None
 
-    def _check_buy_signal(self, df):
-        if len(df) < 2: return False
-        last = df.iloc[-1]
-        previous = df.iloc[-2]
+    def _report_price(self):
+        # Zamknięcie ostatniej zatwierdzonej świecy do macierzy zwrotów ryzyka portfela
+        if self.risk and self.indicators.last_timestamp is not None:
+            self.risk.on_price(self.symbol, self.indicators.last_timestamp, self.indicators.last_close)
+
+    @metrics.timed('signal')
+    def _check_buy_signal(self, indicators):
+        last = snapshot_row(indicators, -1)
+        previous = snapshot_row(indicators, -2)
         
         # Debug logging
         logger.info(f"Sprawdzanie sygnału BUY:")
         logger.info(f"  EMA30: {last['ema_short']:.4f}, EMA60: {last['ema_long']:.4f}")
         logger.info(f"  RSI poprzedni: {previous['rsi']:.2f}, RSI aktualny: {last['rsi']:.2f}")
         
-        if USE_MARKET_REGIME_FILTER:
+        if self.params['USE_MARKET_REGIME_FILTER']:
             if 'daily_regime_sma' not in last or pd.isna(last['daily_regime_sma']) or last['daily_close'] < last['daily_regime_sma']:
                 logger.info(f"  Market regime filter: FAIL (daily_close: {last.get('daily_close', 'N/A'):.4f}, regime_sma: {last.get('daily_regime_sma', 'N/A'):.4f})")
                 return False
@@ -184,26 +336,27 @@ class BinanceTradingBot:
                 logger.info(f"  Market regime filter: PASS (daily_close: {last['daily_close']:.4f} >= regime_sma: {last['daily_regime_sma']:.4f})")
 
         trend_ok = last['ema_short'] > last['ema_long']
-        rsi_level = RSI_BUY_LEVEL_ALT if USE_ALTERNATIVE_RSI else RSI_BUY_LEVEL
+        rsi_level = self.params['RSI_BUY_LEVEL']
         rsi_signal = previous['rsi'] < rsi_level and last['rsi'] >= rsi_level
+        signal = bool(strategy.buy_signals(indicators, self.params)[-1])
         
         logger.info(f"  Trend OK: {trend_ok}")
         logger.info(f"  RSI signal: {rsi_signal} (using level: {rsi_level})")
-        logger.info(f"  Final BUY signal: {trend_ok and rsi_signal}")
+        logger.info(f"  Final BUY signal: {signal}")
         
-        return trend_ok and rsi_signal
+        return signal
 
-    def _check_sell_signal(self, df):
-        if len(df) < 2: return False
-        last = df.iloc[-1]
-        previous = df.iloc[-2]
+    @metrics.timed('signal')
+    def _check_sell_signal(self, indicators):
+        last = snapshot_row(indicators, -1)
+        previous = snapshot_row(indicators, -2)
 
         # Debug logging
         logger.info(f"Sprawdzanie sygnału SELL:")
         logger.info(f"  EMA30: {last['ema_short']:.4f}, EMA60: {last['ema_long']:.4f}")
         logger.info(f"  RSI poprzedni: {previous['rsi']:.2f}, RSI aktualny: {last['rsi']:.2f}")
 
-        if USE_MARKET_REGIME_FILTER:
+        if self.params['USE_MARKET_REGIME_FILTER']:
             if 'daily_regime_sma' not in last or pd.isna(last['daily_regime_sma']) or last['daily_close'] > last['daily_regime_sma']:
                 logger.info(f"  Market regime filter: FAIL (daily_close: {last.get('daily_close', 'N/A'):.4f}, regime_sma: {last.get('daily_regime_sma', 'N/A'):.4f})")
                 return False
@@ -211,34 +364,39 @@ class BinanceTradingBot:
                 logger.info(f"  Market regime filter: PASS (daily_close: {last['daily_close']:.4f} <= regime_sma: {last['daily_regime_sma']:.4f})")
 
         trend_ok = last['ema_short'] < last['ema_long']
-        rsi_level = RSI_SELL_LEVEL_ALT if USE_ALTERNATIVE_RSI else RSI_SELL_LEVEL
+        rsi_level = self.params['RSI_SELL_LEVEL']
         rsi_signal = previous['rsi'] > rsi_level and last['rsi'] <= rsi_level
+        signal = bool(strategy.sell_signals(indicators, self.params)[-1])
         
         logger.info(f"  Trend OK: {trend_ok}")
         logger.info(f"  RSI signal: {rsi_signal} (using level: {rsi_level})")
-        logger.info(f"  Final SELL signal: {trend_ok and rsi_signal}")
+        logger.info(f"  Final SELL signal: {signal}")
         
-        return trend_ok and rsi_signal
+        return signal
 
     def _calculate_position_size_usdc(self, balance, entry_price, stop_loss_price, adx_value):
         if entry_price == stop_loss_price: return 0
         
-        risk_per_trade = RISK_PER_TRADE_LOW
-        if USE_DYNAMIC_RISK:
-            risk_per_trade = RISK_PER_TRADE_HIGH if adx_value > RISK_ADX_THRESHOLD else RISK_PER_TRADE_LOW
+        if self.params['USE_DYNAMIC_RISK']:
+            risk_per_trade = strategy.risk_per_trade(adx_value, self.params)
             logger.info(f"Dynamiczne ryzyko aktywne. ADX={adx_value:.2f}, Ryzyko={risk_per_trade*100:.1f}%")
 
-        risk_amount = balance * risk_per_trade
-        sl_distance_percent = abs(entry_price - stop_loss_price) / entry_price
-        
-        position_size_usdc = risk_amount / sl_distance_percent
-        return position_size_usdc
+        return strategy.position_size_usdc(balance, entry_price, stop_loss_price, adx_value, self.params)
 
+    def _create_order(self, **order):
+        # Czas od wysłania zlecenia do odpowiedzi giełdy
+        started = time.perf_counter()
+        try:
+            return self.client.create_order(**order)
+        finally:
+            metrics.ORDER_ROUNDTRIP_SECONDS.observe(time.perf_counter() - started, symbol=self.symbol, side=order['side'])
+
+    @metrics.timed('order')
     def _execute_market_order(self, side, quantity_usdc):
         try:
             # Binance API dla zleceń MARKET wymaga `quoteOrderQty` dla ilości w USDC
-            order = self.client.create_order(
-                symbol=SYMBOL,
+            order = self._create_order(
+                symbol=self.symbol,
                 side=side,
                 type='MARKET',
                 quoteOrderQty=round(quantity_usdc, 2) # Zaokrąglij do 2 miejsc po przecinku dla USDC
@@ -248,36 +406,49 @@ class BinanceTradingBot:
             # Pobierz rzeczywistą cenę wejścia i ilość z odpowiedzi
             entry_price = float(order['fills'][0]['price']) if order['fills'] else float(order['price'])
             executed_qty = float(order['executedQty'])
+            # Prowizja pobrana w aktywie bazowym zmniejsza ilość, która faktycznie jest na saldzie
+            base_asset = self.symbol.replace('USDC', '')
+            commission = sum(float(fill['commission']) for fill in order['fills'] if fill.get('commissionAsset') == base_asset)
             
-            return entry_price, executed_qty
+            return entry_price, executed_qty, executed_qty - commission
 
         except BinanceAPIException as e:
             logger.error(f"Błąd wykonania zlecenia na Binance: {e}")
             self._send_telegram_message(f"⚠️ KRYTYCZNY BŁĄD ZLECENIA: {e}")
-            return None, None
+            return None, None, None
             
-    def _open_position(self, side, df):
-        last_row = df.iloc[-1]
+    def _plan_entry(self, side, indicators, account=None):
+        # Stop loss i pożądana wielkość pozycji dla sygnału; None, gdy brak środków
+        last_row = snapshot_row(indicators, -1)
         current_price = last_row['close']
         atr = last_row['atr']
         adx = last_row.get('adx', 0)
 
-        balance = self._get_account_balance()
-        if balance <= 10: # Minimalna kwota do handlu
+        balance = self._get_account_balance(account=account)
+        if balance <= strategy.MIN_ORDER_USDC: # Minimalna kwota do handlu
             logger.warning(f"Niewystarczające środki na koncie ({balance:.2f} USDC). Handel wstrzymany.")
-            return
+            return None
 
         # Ustaw SL na podstawie ATR
-        sl_price = current_price - atr * TRAILING_SL_ATR_MULTIPLIER if side == 'BUY' else current_price + atr * TRAILING_SL_ATR_MULTIPLIER
+        sl_price = strategy.initial_stop_loss(side, current_price, atr, self.params)
         
         # Oblicz wielkość pozycji
         position_size_usdc = self._calculate_position_size_usdc(balance, current_price, sl_price, adx)
-        if position_size_usdc < 10: # Minimalna wartość zlecenia na Binance
+        return {'symbol': self.symbol, 'side': side, 'stop_loss': sl_price, 'size_usdc': position_size_usdc, 'balance': balance}
+
+    def _open_position(self, side, indicators, account=None):
+        plan = self._plan_entry(side, indicators, account)
+        if plan is not None:
+            self._enter(plan)
+
+    def _enter(self, plan):
+        side, sl_price, position_size_usdc = plan['side'], plan['stop_loss'], plan['size_usdc']
+        if position_size_usdc < strategy.MIN_ORDER_USDC: # Minimalna wartość zlecenia na Binance
             logger.warning(f"Obliczona wielkość pozycji ({position_size_usdc:.2f} USDC) jest poniżej minimum. Nie otwieram pozycji.")
             return
         
         # Wykonaj zlecenie
-        entry_price, executed_qty = self._execute_market_order(side, position_size_usdc)
+        entry_price, executed_qty, held_qty = self._execute_market_order(side, position_size_usdc)
         
         if entry_price is not None and executed_qty > 0:
             self.in_position = True
@@ -285,89 +456,258 @@ class BinanceTradingBot:
             self.entry_price = entry_price
             self.position_size_usdc = executed_qty * entry_price
             self.stop_loss = sl_price
+            if self.risk:
+                self.risk.open(self.risk_key, self.symbol, side, self.position_size_usdc, self.entry_price)
 
-            self._save_state()
+            self._place_exchange_stop(held_qty)
+            self._record('open', in_position=True, position_side=side, entry_price=self.entry_price,
+                         position_size_usdc=self.position_size_usdc, stop_loss=sl_price,
+                         exchange_stop=self.exchange_stop.state() if self.exchange_stop else None)
             msg = f"✅ OTWARTA POZYCJA {side} | Cena: {self.entry_price:.4f} | Wielkość: {self.position_size_usdc:.2f} USDC | Stop Loss: {self.stop_loss:.4f}"
             logger.info(msg)
             self._send_telegram_message(msg)
 
-    def _close_position(self, exit_price):
+    def _close_quantity(self, quantity=None):
+        # Ilość BASE asset (np. BTC) do zamknięcia, przycięta do stepSize pary. Bez ilości
+        # ze zlecenia saldo z REST - cache strumienia konta może jeszcze nie znać wykonania,
+        # które giełda właśnie potwierdziła
+        if quantity is None:
+            base_asset = self.symbol.replace('USDC', '')
+            quantity = float(self.client.get_asset_balance(asset=base_asset)['free'])
+        return round_step(quantity, symbol_filters(self.client, self.symbol)['step_size'])
+
+    def _place_exchange_stop(self, quantity=None):
+        # quantity - ilość z odpowiedzi zlecenia otwarcia (już po prowizji)
+        if not self.exchange_stop:
+            return
         side = 'SELL' if self.position_side == 'BUY' else 'BUY'
-        
-        # Pobierz aktualną ilość BASE asset (np. BTC) do zamknięcia
-        base_asset = SYMBOL.replace('USDC', '')
         try:
-            qty_to_close = float(self.client.get_asset_balance(asset=base_asset)['free'])
+            self.exchange_stop.place(side, self._close_quantity(quantity), self.stop_loss)
+            logger.info(f"Stop loss złożony na giełdzie: {side} STOP_LOSS_LIMIT @ {self.exchange_stop.stop_price}")
+        except (BinanceAPIException, ValueError) as e:
+            logger.error(f"Nie udało się złożyć stop lossa na giełdzie: {e}")
+            self._send_telegram_message(f"⚠️ Stop loss nie został złożony na giełdzie ({e}). SL pilnuje tylko bot.")
+
+    def _sync_exchange_stop(self, force=False):
+        # Wysyła zebrane przesunięcia trailing stopu; wykrywa stop wykonany przez giełdę
+        if not (self.exchange_stop and self.exchange_stop.active):
+            return
+        try:
+            result = self.exchange_stop.flush(force)
+        except BinanceAPIException as e:
+            logger.error(f"Błąd przesuwania stop lossa na giełdzie: {e}")
+            return
+        if result == 'replaced':
+            logger.info(f"Stop loss na giełdzie przesunięty do: {self.exchange_stop.stop_price}")
+            self._record('exchange_stop', exchange_stop=self.exchange_stop.state())
+        elif result == 'gone':
+            logger.info("Stop loss został wykonany na giełdzie.")
+            self._close_position(self.stop_loss)
+
+    def _check_exchange_stop(self):
+        # Stop mógł zadziałać na giełdzie bez udziału bota (np. w czasie przerwy w działaniu)
+        if not (self.in_position and self.exchange_stop and self.exchange_stop.active):
+            return
+        try:
+            filled = self.exchange_stop.filled()
         except BinanceAPIException as e:
+            logger.error(f"Nie udało się sprawdzić stop lossa na giełdzie: {e}")
+            return
+        if filled:
+            logger.info("Stop loss został wykonany na giełdzie.")
+            self._close_position(self.stop_loss)
+        else:
+            self._sync_exchange_stop(force=True)
+
+    def _on_order_update(self, order):
+        # executionReport ze strumienia konta: wykonanie stopu na giełdzie zamyka pozycję
+        # od razu, bez czekania na tik ceny albo zamknięcie świecy
+        if (self.in_position and self.exchange_stop and self.exchange_stop.active
+                and order['orderId'] == self.exchange_stop.order_id and order['status'] == 'FILLED'):
+            logger.info("Stop loss został wykonany na giełdzie.")
+            self._in_thread(self._close_position, self.stop_loss)
+
+    def _close_position(self, exit_price):
+        # Zamknięcie zlecone równocześnie kilkoma ścieżkami (tik ceny, strumień konta, cykl
+        # świecy) wykonuje tylko pierwsza - kolejne widzą już brak pozycji
+        with self._position_lock:
+            if not self.in_position:
+                return
+            self._close_open_position(exit_price)
+
+    def _close_open_position(self, exit_price):
+        side = 'SELL' if self.position_side == 'BUY' else 'BUY'
+        base_asset = self.symbol.replace('USDC', '')
+        try:
+            # Zlecenie stop na giełdzie najpierw anulujemy - jeśli już zadziałało, pozycja jest zamknięta
+            stop_order = self.exchange_stop.finish() if self.exchange_stop else None
+            stop_filled = stop_order is not None and stop_order['status'] == 'FILLED'
+            if stop_filled:
+                exit_price = average_price(stop_order)
+                qty_to_close = 0
+            elif stop_order is not None:
+                # Niewykonana reszta anulowanego stopu to dokładnie ilość pozycji
+                qty_to_close = self._close_quantity(float(stop_order['origQty']) - float(stop_order['executedQty']))
+            else:
+                # Pobierz aktualną ilość BASE asset (np. BTC) do zamknięcia
+                qty_to_close = self._close_quantity()
+        except (BinanceAPIException, ValueError) as e:
             logger.error(f"Nie udało się pobrać salda {base_asset} do zamknięcia pozycji: {e}")
             self._send_telegram_message(f"⚠️ BŁĄD KRYTYCZNY: Nie mogę pobrać salda {base_asset} do zamknięcia pozycji!")
             return # Nie resetuj stanu, jeśli nie wiemy, czy pozycja jest zamknięta
 
-        # Wykonaj zlecenie zamknięcia
-        self.client.create_order(symbol=SYMBOL, side=side, type='MARKET', quantity=qty_to_close)
+        if qty_to_close <= 0 and not stop_filled:
+            # Pozycja jest w stanie, a na giełdzie nie ma czego zamknąć - nie kasujemy jej
+            # w ciemno, to wymaga sprawdzenia historii zleceń
+            logger.error(f"Brak {base_asset} do zamknięcia pozycji {self.position_side} - stan pozycji pozostaje bez zmian.")
+            self._send_telegram_message(f"⚠️ BŁĄD KRYTYCZNY: Brak {base_asset} na saldzie do zamknięcia pozycji {self.position_side}. Sprawdź konto!")
+            return
 
-        pnl = (exit_price - self.entry_price) if self.position_side == 'BUY' else (self.entry_price - exit_price)
-        pnl_percent = (pnl / self.entry_price) * 100
-        pnl_usdc = self.position_size_usdc * (pnl_percent / 100)
+        # Wykonaj zlecenie zamknięcia
+        if qty_to_close > 0:
+            try:
+                self._create_order(symbol=self.symbol, side=side, type='MARKET', quantity=qty_to_close)
+            except Exception:
+                # Stop na giełdzie jest już anulowany - bez ponownego złożenia pozycja
+                # zostałaby bez ochrony do następnej udanej próby zamknięcia
+                if stop_order is not None:
+                    logger.error("Zamknięcie pozycji nie powiodło się - składam ponownie stop loss na giełdzie.")
+                    self._place_exchange_stop(qty_to_close)
+                    self._record('exchange_stop', exchange_stop=self.exchange_stop.state())
+                raise
+
+        pnl_usdc, pnl_percent = strategy.position_pnl(self.position_side, self.entry_price, exit_price, self.position_size_usdc)
         
         msg = f"❌ ZAMKNIĘTA POZYCJA {self.position_side} | Cena wyjścia: {exit_price:.4f} | Zysk/Strata: {pnl_usdc:.2f} USDC ({pnl_percent:.2f}%)"
         logger.info(msg)
         self._send_telegram_message(msg)
         
-        # Resetuj stan
+        self._reset_position(exit_price)
+
+    def _reset_position(self, exit_price=None):
+        if self.risk:
+            self.risk.close(self.risk_key, exit_price)
         self.in_position = False
         self.position_side = None
         self.entry_price = 0
         self.position_size_usdc = 0
         self.stop_loss = 0
-        self._save_state()
+        self._record('close')
 
-    def _monitor_and_manage_position(self):
-        logger.info(f"Rozpoczynam monitorowanie otwartej pozycji {self.position_side}...")
+    async def _monitor_and_manage_position(self):
+        logger.info(f"Rozpoczynam monitorowanie otwartej pozycji {self.position_side} na {self.symbol}...")
         
         while self.in_position:
             try:
-                # Pobierz najnowszą cenę i wskaźniki
-                df, _ = self._fetch_data(limit=100) # Pobierz mniej danych, tylko do TSL
-                if df is None or df.empty:
-                    time.sleep(60)
-                    continue
-
-                df_with_indicators = self._calculate_indicators(df)
-                if df_with_indicators is None or df_with_indicators.empty:
-                    time.sleep(60)
-                    continue
-                    
-                last_row = df_with_indicators.iloc[-1]
-                current_price = last_row['close']
-                current_atr = last_row['atr']
-                
-                # Sprawdź warunek Stop Loss
-                if (self.position_side == 'BUY' and current_price <= self.stop_loss) or \
-                   (self.position_side == 'SELL' and current_price >= self.stop_loss):
-                    logger.info(f"Warunek Stop Loss ({self.stop_loss:.4f}) został spełniony przy cenie {current_price:.4f}.")
-                    self._close_position(self.stop_loss)
-                    break # Wyjdź z pętli monitorowania
-
-                # Zaktualizuj Trailing Stop Loss
-                if USE_TRAILING_STOP:
-                    new_sl = 0
-                    if self.position_side == 'BUY':
-                        new_sl = max(self.stop_loss, current_price - current_atr * TRAILING_SL_ATR_MULTIPLIER)
-                    else: # SELL
-                        new_sl = min(self.stop_loss, current_price + current_atr * TRAILING_SL_ATR_MULTIPLIER)
-                    
-                    if new_sl != self.stop_loss:
-                        self.stop_loss = new_sl
-                        self._save_state()
-                        logger.info(f"Trailing Stop Loss zaktualizowany do: {self.stop_loss:.4f}")
-
-                time.sleep(60) # Sprawdzaj co 60 sekund
-
+                await self._stream_position()
             except Exception as e:
                 logger.error(f"Wystąpił błąd w pętli monitorującej: {e}")
                 self._send_telegram_message(f"⚠️ Błąd w pętli monitorującej: {e}")
-                time.sleep(60)
+                await asyncio.sleep(60)
+
+    async def _stream_position(self):
+        # Każda aktualizacja ceny ze strumienia WebSocket trafia od razu do kontroli SL/TSL
+        self._live_candle = None
+        self._feed = MarketDataFeed(self.symbol, self.interval, self._on_kline, self._on_book, self._backfill_klines,
+                                    TESTNET_STREAM_URL if USE_TESTNET else STREAM_URL)
+        await self._feed.run()
+
+    def _in_thread(self, func, *args):
+        # Callbacki strumieni działają na pętli zdarzeń - blokujące zapytania REST (zamknięcie
+        # pozycji, backfill, przesunięcie stopu) idą do wątku roboczego, żeby tiki i pozostałe
+        # instancje nie czekały na giełdę. Ta sama operacja nie jest zlecana ponownie, dopóki
+        # poprzednia trwa. Bez działającej pętli (symulator tikowy) wywołanie jest bezpośrednie.
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            func(*args)
+            self._stop_feed_if_closed()
+            return
+        name = func.__name__
+        if name in self._jobs:
+            return
+        task = loop.create_task(self._job(func, *args))
+        self._jobs[name] = task
+        task.add_done_callback(lambda _: self._jobs.pop(name, None))
+
+    async def _job(self, func, *args):
+        try:
+            await asyncio.to_thread(func, *args)
+        except Exception as e:
+            logger.error(f"Błąd operacji {func.__name__} dla {self.symbol}: {e}", exc_info=True)
+            self._send_telegram_message(f"⚠️ Błąd w pętli monitorującej: {e}")
+        self._stop_feed_if_closed()
+
+    def _stop_feed_if_closed(self):
+        # Pozycja zamknięta (przez bota albo stop na giełdzie) - koniec monitorowania
+        if not self.in_position and self._feed:
+            self._feed.stop()
+
+    def _backfill_klines(self):
+        # Uzupełnia przez REST świece zamknięte od ostatniego stanu silnika wskaźników
+        # i sprawdza, czy w czasie przerwy nie zadziałał stop na giełdzie
+        self._check_exchange_stop()
+        with self._candles_lock:
+            candles, _ = self._fetch_data(limit=SEED_KLINES, include_daily=False, start_time=self.indicators.last_timestamp)
+            if candles is not None and len(candles):
+                self._update_indicators(candles)
+
+    def _on_kline(self, open_time, high, low, close, closed):
+        if not closed:
+            self._live_candle = [high, low]
+            self._check_position(close)
+            return
+        # Pętla zdarzeń nie czeka na blokadę: gdy silnik wskaźników zmienia właśnie inny wątek
+        # (_check_signals, backfill), świecę uzupełni backfill
+        contiguous = False
+        if self._candles_lock.acquire(blocking=False):
+            try:
+                last = self.indicators.last_timestamp
+                if last is not None and open_time <= last:
+                    return # Świeca już zatwierdzona (np. przez backfill)
+                contiguous = last is not None and open_time - last == self.interval_ms
+                if contiguous:
+                    self.indicators.update(open_time, high, low, close)
+                    self._report_price()
+            finally:
+                self._candles_lock.release()
+        if not contiguous:
+            self._in_thread(self._backfill_klines)
+        self._live_candle = None
+
+    def _on_book(self, bid, ask):
+        # Pozycję BUY zamykamy sprzedając po bid, pozycję SELL odkupując po ask
+        self._check_position(bid if self.position_side == 'BUY' else ask)
+
+    def _check_position(self, current_price):
+        # Na pętli zdarzeń tylko stan pozycji - zapytania do giełdy przez _in_thread
+        if not self.in_position:
+            self._stop_feed_if_closed() # Pozycja zamknięta poza strumieniem (np. stop wykonany na giełdzie)
+            return
+        live = self._live_candle or [current_price, current_price]
+        live[0], live[1] = max(live[0], current_price), min(live[1], current_price)
+        self._live_candle = live
+        current_atr = self.indicators.atr.peek(live[0], live[1], current_price)
+        
+        # Sprawdź warunek Stop Loss
+        if strategy.stop_loss_hit(self.position_side, self.stop_loss, current_price):
+            if '_close_position' not in self._jobs:
+                logger.info(f"Warunek Stop Loss ({self.stop_loss:.4f}) został spełniony przy cenie {current_price:.4f}.")
+            self._in_thread(self._close_position, self.stop_loss) # Po zamknięciu koniec monitorowania
+            return
+
+        # Zaktualizuj Trailing Stop Loss
+        if self.params['USE_TRAILING_STOP']:
+            new_sl = strategy.trail_stop_loss(self.position_side, self.stop_loss, current_price, current_atr, self.params)
+            
+            if new_sl != self.stop_loss:
+                self.stop_loss = new_sl
+                if self.exchange_stop:
+                    self.exchange_stop.request(new_sl)
+                self._record('stop', stop_loss=new_sl)
+                logger.info(f"Trailing Stop Loss zaktualizowany do: {self.stop_loss:.4f}")
+            if self.exchange_stop and self.exchange_stop.pending is not None:
+                self._in_thread(self._sync_exchange_stop)
 
     def _send_daily_summary(self):
         today_str = datetime.now().date().isoformat()
@@ -379,55 +719,176 @@ class BinanceTradingBot:
                 self._send_telegram_message(msg)
                 
                 self.last_summary_date = today_str
-                self._save_state()
+                self._record('summary', last_summary_date=today_str)
             except Exception as e:
                 logger.error(f"Nie udało się wysłać dziennego podsumowania: {e}")
 
+    async def _prefetch(self):
+        # Niezależne zapytania cyklu wysłane równolegle przez klienta asynchronicznego:
+        # świece interwału, świece dzienne (tylko gdy zamknął się nowy dzień) i saldo
+        # (tylko gdy nie ma go w pamięci ze strumienia konta).
+        # Zapytanie zakończone błędem jest pomijane - _check_signals wykona je synchronicznie.
+        started = time.perf_counter()
+        calls = {
+            'klines': self.rest.get_klines(symbol=self.symbol, interval=self.interval, limit=SYNC_KLINES),
+        }
+        if not (self.account and self.account.live):
+            calls['account'] = self.rest.get_account()
+        if self.params['USE_MARKET_REGIME_FILTER'] and self.daily_candles.stale:
+            calls['daily_klines'] = self.rest.get_klines(symbol=self.symbol, interval=Client.KLINE_INTERVAL_1DAY, limit=SYNC_KLINES)
+        results = await asyncio.gather(*calls.values(), return_exceptions=True)
+        prefetched = {}
+        for name, result in zip(calls, results):
+            if isinstance(result, Exception):
+                logger.warning(f"Równoległe zapytanie {name} nie powiodło się: {result}")
+            else:
+                prefetched[name] = result
+        elapsed = time.perf_counter() - started
+        metrics.STAGE_SECONDS.observe(elapsed, symbol=self.symbol, stage='prefetch')
+        self.cycle_timings['prefetch'] = elapsed
+        return prefetched
+
+    def _check_signals(self, prefetched=None):
+        # Logika szukania wejścia na świeżo zamkniętej świecy; zwraca plan wejścia albo None
+        logger.info(f"Sprawdzanie sygnałów na nowej świecy {self.symbol} {self.interval}...")
+        prefetched = prefetched or {}
+        with self._candles_lock:
+            candles, df_daily = self._fetch_data(klines=prefetched.get('klines'), daily_klines=prefetched.get('daily_klines'))
+            indicators = self._update_indicators(candles, df_daily) if candles is not None else None
+        if indicators is not None:
+            side = self._signal_side(indicators)
+            if side:
+                return self._plan_entry(side, indicators, prefetched.get('account'))
+        return None
+
+    def _signal_side(self, indicators):
+        if self._check_buy_signal(indicators):
+            logger.info("Wykryto sygnał KUPNA.")
+            return 'BUY'
+        if self._check_sell_signal(indicators):
+            logger.info("Wykryto sygnał SPRZEDAŻY.")
+            return 'SELL'
+        return None
+
+    def _evaluate_signals(self, indicators, account=None):
+        side = self._signal_side(indicators)
+        if side:
+            self._open_position(side, indicators, account)
+
+    def _ensure_monitoring(self):
+        if self.in_position and (self._monitor_task is None or self._monitor_task.done()):
+            self._monitor_task = asyncio.create_task(self._monitor_and_manage_position())
+
+    async def on_candle_close(self, close_ms=None):
+        # Wywoływane przez harmonogram dokładnie raz po zamknięciu każdej świecy tej instancji
+        plan = None
+        try:
+            if self.daily_summary:
+                await asyncio.to_thread(self._send_daily_summary) # Sprawdź, czy wysłać podsumowanie
+            if self.in_position:
+                await asyncio.to_thread(self._check_exchange_stop)
+            if not self.in_position:
+                prefetched = await self._prefetch() if self.rest else None
+                plan = await asyncio.to_thread(self._check_signals, prefetched)
+        except Exception as e:
+            self._cycle_error(e)
+        try:
+            if self.risk:
+                # Zgłoszenie także bez sygnału - ryzyko portfela dzieli saldo dopiero, gdy
+                # zgłoszą się wszystkie instancje zamykające świecę w tej chwili
+                plan = await self.risk.submit(close_ms, self.risk_key, plan)
+            if plan is not None:
+                await asyncio.to_thread(self._enter, plan)
+            self._ensure_monitoring()
+        except Exception as e:
+            self._cycle_error(e)
+        if self.cycle_timings:
+            logger.info(f"Cykl {self.symbol} {self.interval}: {metrics.format_cycle(self.cycle_timings)}")
+            self.cycle_timings = {}
+
+    def _cycle_error(self, e):
+        logger.critical(f"KRYTYCZNY BŁĄD w obsłudze świecy {self.symbol}: {e}", exc_info=True)
+        self._send_telegram_message(f"🚨 KRYTYCZNY BŁĄD BOTA: {e}")
+
     def run(self):
-        while True:
-            try:
-                self._send_daily_summary() # Sprawdź, czy wysłać podsumowanie
-
-                if self.in_position:
-                    self._monitor_and_manage_position()
-                else:
-                    # Logika szukania wejścia
-                    now = datetime.utcnow()
-                    minutes = now.minute
-                    seconds = now.second
-                    
-                    # Sprawdzaj sygnały w pierwszych 2 minutach po zamknięciu świecy 15-minutowej
-                    # To daje większe okno na sprawdzenie sygnałów w przypadku problemów z API
-                    if minutes % 15 <= 1:  # 0 lub 1 minuta po zamknięciu świecy
-                        logger.info(f"Sprawdzanie sygnałów na nowej świecy (minuta {minutes})...")
-                        df, df_daily = self._fetch_data()
-                        if df is not None:
-                            df_with_indicators = self._calculate_indicators(df, df_daily)
-                            if df_with_indicators is not None and not df_with_indicators.empty:
-                                if self._check_buy_signal(df_with_indicators):
-                                    logger.info("Wykryto sygnał KUPNA.")
-                                    self._open_position('BUY', df_with_indicators)
-                                elif self._check_sell_signal(df_with_indicators):
-                                    logger.info("Wykryto sygnał SPRZEDAŻY.")
-                                    self._open_position('SELL', df_with_indicators)
-                        
-                        # Po sprawdzeniu sygnałów, czekaj do następnego okna
-                        time.sleep(60)  # Czekaj minutę przed następnym sprawdzeniem
-                    else:
-                        # Uśpij bota do następnej świecy
-                        time_to_sleep = (15 - (minutes % 15)) * 60 - seconds
-                        logger.info(f"Brak pozycji. Czekam {time_to_sleep:.0f} sekund do następnej świecy.")
-                        time.sleep(max(60, time_to_sleep))  # Minimum 60 sekund
-            
-            except KeyboardInterrupt:
-                logger.info("Zatrzymywanie bota...")
-                self._save_state()
-                break
-            except Exception as e:
-                logger.critical(f"KRYTYCZNY BŁĄD w głównej pętli: {e}", exc_info=True)
-                self._send_telegram_message(f"🚨 KRYTYCZNY BŁĄD BOTA: {e}")
-                time.sleep(60)
+        run_instances([self])
+
+async def _run_scheduler(bots):
+    scheduler = CandleScheduler(ServerClock(bots[0].client))
+    for stream in {id(bot.account_stream): bot.account_stream for bot in bots if bot.account_stream}.values():
+        asyncio.create_task(stream.run())
+    for bot in bots:
+        scheduler.add(bot.interval, bot.on_candle_close)
+        bot._ensure_monitoring() # Po restarcie wróć do zarządzania otwartymi pozycjami
+    try:
+        await scheduler.run()
+    finally:
+        for rest in {id(bot.rest): bot.rest for bot in bots if bot.rest}.values():
+            await rest.close()
+
+def run_instances(bots):
+    if METRICS_PORT:
+        metrics.start_server(METRICS_PORT)
+    try:
+        asyncio.run(_run_scheduler(bots))
+    except KeyboardInterrupt:
+        logger.info("Zatrzymywanie bota...")
+        for bot in bots:
+            bot._save_state()
+        if bots[0].notifier:
+            bots[0].notifier.close()
+
+def create_instances(instances=INSTANCES):
+    # Wiele par/interwałów w jednym procesie: wspólny klient API i kolejka Telegram,
+    # osobny stan, parametry, magazyn świec i silnik wskaźników dla każdej instancji
+    client = create_client(pool_size=max(10, len(instances)))
+    rest = create_rest_client(pool_size=max(10, len(instances) * 3))
+    account_stream = create_account_stream(client)
+    risk = PortfolioRisk() if USE_PORTFOLIO_RISK else None
+    notifier = create_notifier()
+    multiple = len(instances) > 1
+    bots = []
+    for i, instance in enumerate(instances):
+        symbol, interval = instance['SYMBOL'], instance['INTERVAL']
+        overrides = {k: v for k, v in instance.items() if k not in ('SYMBOL', 'INTERVAL')}
+        default = (symbol, interval) == (SYMBOL, INTERVAL)
+        bots.append(BinanceTradingBot(
+            symbol, interval, strategy.default_params(**overrides), client, notifier,
+            state_file=STATE_FILE if default else f"state_{symbol}_{interval}.json",
+            label=f"[{symbol} {interval}] " if multiple else '',
+            daily_summary=(i == 0), # Jedno podsumowanie dzienne dla całego konta
+            rest=rest,
+            account_stream=account_stream,
+            risk=risk,
+        ))
+    if risk:
+        # Okno zwrotów od razu z lokalnych magazynów świec, bez czekania tygodnia na historię
+        risk.seed({bot.symbol: (bot.candles.column('timestamp'), bot.candles.column('close')) for bot in bots})
+    return bots
 
 if __name__ == "__main__":
-    bot = BinanceTradingBot()
-    bot.run()
+    # Tryby uruchomienia: `python bot.py` (handel na żywo), `python bot.py backtest`,
+    # `python bot.py optimize`, `python bot.py walkforward`, `python bot.py montecarlo`,
+    # `python bot.py ticksim` lub `python bot.py benchmark [plik_bazowy.json]`
+    mode = sys.argv[1] if len(sys.argv) > 1 else 'live'
+    if mode == 'backtest':
+        import backtest
+        backtest.main()
+    elif mode == 'optimize':
+        import optimize
+        optimize.main()
+    elif mode == 'walkforward':
+        import robustness
+        robustness.main_walk_forward()
+    elif mode == 'montecarlo':
+        import robustness
+        robustness.main_monte_carlo()
+    elif mode == 'ticksim':
+        import tick_sim
+        tick_sim.main()
+    elif mode == 'benchmark':
+        import benchmark
+        benchmark.main(sys.argv[2] if len(sys.argv) > 2 else None)
+    else:
+        run_instances(create_instances())
+
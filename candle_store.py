@@ -0,0 +1,168 @@
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+from binance.helpers import interval_to_milliseconds
+
+from data import KLINE_DTYPE, parse_klines
+
+logger = logging.getLogger("binance_bot")
+
+# Kolumny przechowywane na dysku: jeden plik binarny na kolumnę, dopisywany na końcu
+# i czytany przez np.memmap. Przechowujemy tylko zamknięte świece, w polach data.KLINE_DTYPE.
+COLUMNS = {name: KLINE_DTYPE[name].type for name in KLINE_DTYPE.names}
+MAX_KLINES_PER_REQUEST = 1000
+
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+
+class CandleStore:
+    _open_stores = {}
+    _open_lock = threading.Lock()
+
+    def __init__(self, root, symbol, interval):
+        self.symbol = symbol
+        self.interval = interval
+        self.interval_ms = interval_to_milliseconds(interval)
+        self.path = os.path.join(root, f"{symbol}_{interval}")
+        self.lock = threading.RLock()
+        self.clock = _now_ms # Symulator podmienia na czas symulowany
+        os.makedirs(self.path, exist_ok=True)
+        self._repair()
+
+    @classmethod
+    def open(cls, root, symbol, interval):
+        # Jeden obiekt na katalog w procesie, żeby instancje z tą samą parą (np. wspólne
+        # świece dzienne) nie dopisywały równolegle do tych samych plików
+        key = os.path.abspath(os.path.join(root, f"{symbol}_{interval}"))
+        with cls._open_lock:
+            if key not in cls._open_stores:
+                cls._open_stores[key] = cls(root, symbol, interval)
+            return cls._open_stores[key]
+
+    def _file(self, column):
+        return os.path.join(self.path, f"{column}.bin")
+
+    def _rows_on_disk(self, column):
+        path = self._file(column)
+        return os.path.getsize(path) // np.dtype(COLUMNS[column]).itemsize if os.path.exists(path) else 0
+
+    def _repair(self):
+        # Przerwany zapis może zostawić kolumny różnej długości - przycinamy do najkrótszej
+        rows = min(self._rows_on_disk(column) for column in COLUMNS)
+        for column, dtype in COLUMNS.items():
+            size = rows * np.dtype(dtype).itemsize
+            with open(self._file(column), 'ab') as f:
+                if f.tell() != size:
+                    f.truncate(size)
+        self._length = rows
+
+    def __len__(self):
+        return self._length
+
+    def column(self, name):
+        if not self._length:
+            return np.empty(0, dtype=COLUMNS[name])
+        return np.memmap(self._file(name), dtype=COLUMNS[name], mode='r', shape=(self._length,))
+
+    @property
+    def first_timestamp(self):
+        return int(self.column('timestamp')[0]) if self._length else None
+
+    @property
+    def last_timestamp(self):
+        return int(self.column('timestamp')[-1]) if self._length else None
+
+    @property
+    def last_close_time(self):
+        return int(self.column('close_time')[-1]) if self._length else None
+
+    @property
+    def stale(self):
+        # True, gdy od ostatniej zapisanej świecy zamknęła się kolejna
+        return not self._length or self.last_close_time < self.clock() - self.interval_ms
+
+    def clear(self):
+        for column in COLUMNS:
+            open(self._file(column), 'wb').close()
+        self._length = 0
+
+    def append(self, klines, now_ms=None, allow_gap=False):
+        # Dopisuje zamknięte świece nowsze niż ostatnia zapisana. Zwraca False, jeśli
+        # między magazynem a podanymi świecami jest luka (trzeba dociągnąć brakujące).
+        # allow_gap dopuszcza luki, które istnieją w danych giełdy (np. przerwy techniczne).
+        with self.lock:
+            return self._append(klines, now_ms, allow_gap)
+
+    def _append(self, klines, now_ms, allow_gap):
+        now_ms = self.clock() if now_ms is None else now_ms
+        last = self.last_timestamp
+        candles = parse_klines(klines)
+        keep = candles['close_time'] < now_ms
+        if last is not None:
+            keep &= candles['timestamp'] > last
+        rows = candles[keep]
+        if not len(rows):
+            return True
+        if not allow_gap and last is not None and int(rows['timestamp'][0]) != last + self.interval_ms:
+            return False
+        for column in COLUMNS:
+            with open(self._file(column), 'ab') as f:
+                f.write(rows[column].tobytes())
+        self._length += len(rows)
+        return True
+
+    def _download(self, client, start_ms):
+        # Pobiera zamknięte świece od start_ms do teraz, stronicując po MAX_KLINES_PER_REQUEST
+        while True:
+            klines = client.get_klines(symbol=self.symbol, interval=self.interval, startTime=start_ms, limit=MAX_KLINES_PER_REQUEST)
+            if not klines:
+                return
+            self.append(klines, allow_gap=True)
+            if len(klines) < MAX_KLINES_PER_REQUEST:
+                return
+            start_ms = int(klines[-1][0]) + self.interval_ms
+
+    def sync(self, client, klines=None, start_ms=None):
+        # Dopisuje zamknięte świece z już pobranej odpowiedzi (klines), a brakujące
+        # dociąga przez REST tylko od ostatniego zapisanego close_time
+        with self.lock:
+            self._sync(client, klines, start_ms)
+
+    def _sync(self, client, klines, start_ms):
+        if klines is not None and self._length and self.append(klines):
+            return
+        if not self.stale:
+            return # Najnowsza zamknięta świeca jest już w magazynie
+        if not self._length and start_ms is None:
+            start_ms = self.clock() - 200 * self.interval_ms
+        self._download(client, self.last_close_time + 1 if self._length else start_ms)
+        if klines is not None:
+            self.append(klines)
+
+    def ensure(self, client, start_ms):
+        # Gwarantuje historię od start_ms; magazyn tylko dopisuje, więc jeśli zaczyna się
+        # później niż trzeba, budujemy go od nowa
+        if self._length and self.first_timestamp > start_ms + self.interval_ms:
+            logger.info(f"Magazyn świec {self.symbol} {self.interval} zaczyna się za późno - pobieram od nowa.")
+            self.clear()
+        if not self._length:
+            logger.info(f"Pobieranie historii {self.symbol} {self.interval} do lokalnego magazynu...")
+        self.sync(client, start_ms=start_ms)
+
+    def to_df(self, limit=None, start_ms=None):
+        # DataFrame w układzie data.klines_to_df (timestamp jako datetime64[ms]). Kolumny są
+        # kopiowane z memmap, bo clear() może obciąć pliki pod żyjącym widokiem.
+        begin = 0
+        if start_ms is not None:
+            begin = int(np.searchsorted(self.column('timestamp'), start_ms))
+        if limit is not None:
+            begin = max(begin, self._length - limit)
+        columns = {column: np.array(self.column(column)[begin:]) for column in COLUMNS}
+        columns['timestamp'] = columns['timestamp'].view('datetime64[ms]')
+        return pd.DataFrame(columns, copy=False)
@@ -9,6 +9,23 @@ USE_TESTNET = False
 
 SYMBOL = 'BTCUSDC'
 INTERVAL = '15m'  # Interwał strategii
+CANDLE_STORE_DIR = "candles"  # Lokalny magazyn zamkniętych świec (pliki kolumnowe czytane przez memmap)
+STATE_COMPACT_EVENTS = 500    # Dziennik stanu (state.json.wal) jest zwijany do migawki co tyle zdarzeń
+
+# Instancje strategii uruchamiane w jednym procesie (wspólny harmonogram i sesja HTTP).
+# Każdy wpis to SYMBOL i INTERVAL oraz opcjonalne nadpisania parametrów strategii,
+# np. {'SYMBOL': 'ETHUSDC', 'INTERVAL': '1h', 'EMA_SHORT': 20}.
+# Uwaga: instancje dzielą saldo konta - nie uruchamiaj dwóch instancji na tej samej parze.
+INSTANCES = [
+    {'SYMBOL': SYMBOL, 'INTERVAL': INTERVAL},
+]
+
+API_WEIGHT_LIMIT = 6000    # Limit REQUEST_WEIGHT Binance Spot na minutę (na IP)
+API_WEIGHT_RESERVE = 600   # Zapytania czekają na nową minutę, zanim zużyta waga dojdzie do limitu minus rezerwa
+USE_ACCOUNT_STREAM = True          # Salda i zlecenia ze strumienia danych użytkownika zamiast odpytywania get_account
+ACCOUNT_RECONCILE_SECONDS = 300    # Co tyle sekund stan ze strumienia jest uzgadniany z REST
+
+METRICS_PORT = 9108  # Lokalny endpoint http://127.0.0.1:9108/metrics (0 = wyłączony)
 
 # ==============================================================================
 # 2. STRATEGIA PRZECIĘCIA EMA (Exponential Moving Average)
@@ -47,6 +64,21 @@ RISK_ADX_THRESHOLD = 25    # Próg ADX, powyżej którego trend uznajemy za siln
 RISK_PER_TRADE_HIGH = 0.125 # 12.5% ryzyka kapitału na transakcję przy silnym trendzie
 RISK_PER_TRADE_LOW = 0.03   # 3% ryzyka kapitału na transakcję przy słabym trendzie
 
+# 4.3 Stop Loss na giełdzie (zlecenie STOP_LOSS_LIMIT przesuwane za trailing stopem)
+USE_EXCHANGE_STOP_LOSS = True    # SL działa na Binance także przy opóźnieniu lub awarii bota
+STOP_LIMIT_OFFSET_PERCENT = 0.5  # Cena limit poniżej (SELL) / powyżej (BUY) ceny aktywacji, w %
+STOP_REPLACE_SECONDS = 5         # Przesunięcia trailing stopu wysyłane najczęściej co tyle sekund
+
+# 4.4 Ryzyko portfela (wszystkie instancje w procesie dzielą jeden budżet)
+USE_PORTFOLIO_RISK = True
+PORTFOLIO_MAX_EXPOSURE = 1.0          # Łączna ekspozycja wszystkich pozycji jako ułamek kapitału portfela
+PORTFOLIO_MAX_DAILY_VOLATILITY = 0.05 # Dzienna zmienność portfela (odch. std. zwrotów * ekspozycja) jako ułamek kapitału
+PORTFOLIO_MAX_DRAWDOWN = 0.20         # Po takim spadku od szczytu kapitału nowe pozycje nie są otwierane
+PORTFOLIO_RETURNS_INTERVAL = '1h'     # Interwał zwrotów do macierzy kowariancji (nie krótszy niż interwały instancji)
+PORTFOLIO_RETURNS_WINDOW = 168        # Liczba zwrotów w oknie kroczącym (tydzień dla 1h)
+PORTFOLIO_MIN_OBSERVATIONS = 24       # Poniżej tylu zwrotów limit zmienności nie jest stosowany
+PORTFOLIO_BATCH_TIMEOUT = 5.0         # Maks. czas oczekiwania na sygnały pozostałych instancji z tej samej świecy (s)
+
 # ==============================================================================
 # 5. FILTR REŻIMU RYNKU (GLOBALNY TREND)
 # ==============================================================================
@@ -79,6 +111,9 @@ REGIME_FILTER_PERIOD = 50
 # 6. USTAWIENIA BACKTESTU
 # ==============================================================================
 INITIAL_CAPITAL = 1000  # Początkowy kapitał do backtestu w USDC
+BACKTEST_START_DATE = "3 years ago UTC"  # Początek historii dla trybu backtest (format python-binance)
+BACKTEST_TRADES_FILE = "backtest_trades.csv"
+BACKTEST_EQUITY_FILE = "backtest_equity.csv"
 
 # Parametry do optymalizacji (używane tylko w trybie optimize)
 OPTIMIZATION_PARAMS = {
@@ -89,4 +124,39 @@ OPTIMIZATION_PARAMS = {
     'RSI_SELL_LEVEL': [35, 40, 45],
     'TRAILING_SL_ATR_MULTIPLIER': [1.5, 2.0, 2.5, 3.0],
     'REGIME_FILTER_PERIOD': [30, 50, 70]
-}
\ No newline at end of file
+}
+OPTIMIZE_RESULTS_FILE = "optimize_results.jsonl"  # Wyniki dopisywane na bieżąco (wznawianie po przerwaniu)
+OPTIMIZE_RANKED_FILE = "optimize_ranked.csv"      # Ranking kombinacji wg zwrotu
+OPTIMIZE_DATA_DIR = "optimize_data"               # Świece w plikach .npy współdzielone przez memmap
+
+# Walk-forward (python bot.py walkforward): optymalizacja na oknie treningowym,
+# sprawdzenie najlepszej kombinacji na kolejnym oknie testowym, przesunięcie o okno testowe
+WALK_FORWARD_TRAIN_DAYS = 365
+WALK_FORWARD_TEST_DAYS = 90
+WALK_FORWARD_METRIC = 'total_return_percent'  # Kryterium wyboru parametrów w oknie treningowym
+WALK_FORWARD_FILE = "walkforward_windows.csv"
+
+# Monte Carlo (python bot.py montecarlo): losowanie transakcji backtestu ze zwracaniem
+MONTE_CARLO_RUNS = 10000
+MONTE_CARLO_FILE = "montecarlo_runs.csv"
+
+# ==============================================================================
+# 7. SYMULACJA TIKOWA (python bot.py ticksim)
+# ==============================================================================
+TICK_TRADES_FILES = []    # Zrzuty aggTrades (CSV lub ZIP z data.binance.vision)
+TICK_BOOK_FILES = []      # Zapisany bookTicker: update_id, bid, bid_qty, ask, ask_qty, transaction_time, event_time
+TICK_FEE_RATE = 0.001     # Prowizja taker (0.1%)
+TICK_SLIPPAGE_BPS = 1.0   # Poślizg zleceń MARKET względem bid/ask w punktach bazowych
+TICK_PRICE_STEP = 0.01    # Filtr PRICE_FILTER pary (tickSize)
+TICK_STEP_SIZE = 0.00001  # Filtr LOT_SIZE pary (stepSize)
+TICK_MIN_NOTIONAL = 5.0   # Filtr NOTIONAL pary (minimalna wartość zlecenia)
+TICK_REPORT_FILE = "tick_sim_report.csv"
+
+# ==============================================================================
+# 8. BENCHMARKI (python bot.py benchmark [plik_bazowy.json])
+# ==============================================================================
+BENCHMARK_SIZES = [200, 10_000, 1_000_000]  # Liczba świec (i tików) w kolejnych pomiarach
+BENCHMARK_REPEATS = 3                # Powtórzenia pomiaru czasu (najlepszy wynik); największy rozmiar raz
+BENCHMARK_TICK_MAX_ROWS = 100_000    # Symulacja tikowa jest wolna - większe rozmiary są pomijane
+BENCHMARK_DIR = "benchmarks"         # Wyniki JSON, jeden plik na commit
+BENCHMARK_REGRESSION_RATIO = 1.2     # Etap wolniejszy o ponad 20% od pliku bazowego jest zgłaszany
@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+
+KLINE_COLUMNS = ['timestamp', 'open', 'high', 'low', 'close', 'volume', 'close_time', 'quote_asset_volume', 'number_of_trades', 'taker_buy_base_asset_volume', 'taker_buy_quote_asset_volume', 'ignore']
+
+# Pola świecy używane przez strategię - pierwsze 7 kolumn odpowiedzi get_klines
+KLINE_DTYPE = np.dtype([
+    ('timestamp', np.int64),   # czas otwarcia świecy (ms)
+    ('open', np.float64),
+    ('high', np.float64),
+    ('low', np.float64),
+    ('close', np.float64),
+    ('volume', np.float64),
+    ('close_time', np.int64),  # czas zamknięcia świecy (ms)
+])
+
+
+def parse_klines(klines, out=None):
+    # Surowe świece z API Binance -> tablica strukturalna KLINE_DTYPE, bez pośredniego
+    # DataFrame z napisami. out to prealokowany bufor wielokrotnego użytku: wynik jest
+    # widokiem jego początku i jest ważny do następnego parsowania w ten sam bufor.
+    if isinstance(klines, np.ndarray) and klines.dtype == KLINE_DTYPE:
+        return klines
+    n = len(klines)
+    if out is None or len(out) < n:
+        out = np.empty(n, dtype=KLINE_DTYPE)
+    else:
+        out = out[:n]
+    if n:
+        columns = list(zip(*klines))
+        for index, name in enumerate(KLINE_DTYPE.names):
+            out[name] = columns[index] # NumPy sam zamienia napisy z API na liczby
+    return out
+
+
+def klines_frame(candles):
+    # DataFrame w układzie klines_to_df nad tablicą z parse_klines: kolumny są widokami
+    # tablicy (bez kopiowania), timestamp to ta sama pamięć int64 jako datetime64[ms]
+    columns = {'timestamp': candles['timestamp'].view('datetime64[ms]')}
+    columns.update((name, candles[name]) for name in KLINE_DTYPE.names[1:])
+    return pd.DataFrame(columns, copy=False)
+
+
+def klines_to_df(klines):
+    # Zamienia surowe świece z API Binance na DataFrame z liczbowymi kolumnami OHLCV
+    return klines_frame(parse_klines(klines))
+
+
+def as_daily(df_daily):
+    # Dzienne świece indeksowane datą (używane przez filtr reżimu rynku)
+    df_daily['timestamp'] = df_daily['timestamp'].dt.date
+    df_daily.set_index('timestamp', inplace=True)
+    return df_daily
+
+
+def daily_klines_to_df(klines):
+    return as_daily(klines_to_df(klines))
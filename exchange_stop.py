@@ -0,0 +1,192 @@
+import logging
+import math
+import threading
+import time
+
+from binance.exceptions import BinanceAPIException
+
+from config import STOP_LIMIT_OFFSET_PERCENT, STOP_REPLACE_SECONDS
+
+logger = logging.getLogger("binance_bot")
+
+_filters = {}
+_filters_lock = threading.Lock()
+
+
+def symbol_filters(client, symbol):
+    # tickSize i stepSize pary z exchangeInfo, pobierane raz na proces
+    with _filters_lock:
+        if symbol not in _filters:
+            info = client.get_symbol_info(symbol)
+            if info is None:
+                raise ValueError(f"Nieznana para: {symbol}")
+            filters = {f['filterType']: f for f in info['filters']}
+            _filters[symbol] = {
+                'tick_size': float(filters['PRICE_FILTER']['tickSize']),
+                'step_size': float(filters['LOT_SIZE']['stepSize']),
+            }
+        return _filters[symbol]
+
+
+def _decimals(step):
+    return max(0, -int(math.floor(math.log10(step)))) if step < 1 else 0
+
+
+def round_step(value, step):
+    # Ilość w dół do wielokrotności stepSize (filtr LOT_SIZE)
+    return round(math.floor(value / step + 1e-9) * step, _decimals(step))
+
+
+def round_price(value, tick):
+    return round(round(value / tick) * tick, _decimals(tick))
+
+
+def _fmt(value, step):
+    return f"{value:.{_decimals(step)}f}"
+
+
+class ExchangeStop:
+    # Stop loss pozycji jako zlecenie STOP_LOSS_LIMIT na Binance: giełda zamyka pozycję
+    # bez czekania na bota (i po jego awarii). Przesunięcia trailing stopu zbierane są
+    # przez request() i wysyłane przez flush() jednym cancelReplace najczęściej co
+    # STOP_REPLACE_SECONDS - pośrednie poziomy, które zdążyły się zdezaktualizować, są pomijane.
+    # place/flush/finish/forget wykluczają się blokadą: przesunięcie z wątku monitora i
+    # zamknięcie pozycji z innego wątku nie mogą zostawić osieroconego zlecenia stop.
+    def __init__(self, client, symbol, offset_percent=STOP_LIMIT_OFFSET_PERCENT, replace_seconds=STOP_REPLACE_SECONDS, clock=time.time,
+                 account=None):
+        self.client = client
+        self.account = account # AccountCache - status zlecenia ze strumienia konta zamiast get_order
+        self.symbol = symbol
+        self.offset = offset_percent / 100
+        self.replace_seconds = replace_seconds
+        self.clock = clock # Symulator podmienia na czas symulowany
+        self.order_id = None
+        self.side = None
+        self.quantity = 0.0
+        self.stop_price = 0.0
+        self.pending = None
+        self.last_replace = 0.0
+        self.lock = threading.Lock()
+
+    @property
+    def active(self):
+        return self.order_id is not None
+
+    def state(self):
+        if not self.active:
+            return None
+        return {'order_id': self.order_id, 'side': self.side, 'quantity': self.quantity, 'stop_price': self.stop_price}
+
+    def restore(self, state):
+        if state:
+            self.order_id = state['order_id']
+            self.side = state['side']
+            self.quantity = state['quantity']
+            self.stop_price = state['stop_price']
+
+    def _reset(self):
+        self.order_id = None
+        self.side = None
+        self.quantity = 0.0
+        self.stop_price = 0.0
+        self.pending = None
+
+    def _order_params(self, stop):
+        f = symbol_filters(self.client, self.symbol)
+        stop = round_price(stop, f['tick_size'])
+        limit = stop * (1 - self.offset) if self.side == 'SELL' else stop * (1 + self.offset)
+        limit = round_price(limit, f['tick_size'])
+        return stop, {
+            'symbol': self.symbol,
+            'side': self.side,
+            'type': 'STOP_LOSS_LIMIT',
+            'timeInForce': 'GTC',
+            'quantity': _fmt(self.quantity, f['step_size']),
+            'stopPrice': _fmt(stop, f['tick_size']),
+            'price': _fmt(limit, f['tick_size']),
+        }
+
+    def place(self, side, quantity, stop):
+        # side to strona zamknięcia (SELL dla pozycji BUY)
+        with self.lock:
+            self.side = side
+            self.quantity = quantity
+            stop, params = self._order_params(stop)
+            try:
+                order = self.client.create_order(**params)
+            except BinanceAPIException:
+                self._reset()
+                raise
+            self.order_id = order['orderId']
+            self.stop_price = stop
+            self.last_replace = self.clock()
+            return order
+
+    def request(self, stop):
+        if self.active:
+            self.pending = stop
+
+    def flush(self, force=False):
+        # Zwraca 'replaced' po przesunięciu zlecenia, 'gone', gdy stop został już
+        # wykonany na giełdzie, albo None, gdy nic nie wysłano
+        with self.lock:
+            if not self.active or self.pending is None:
+                return None
+            if not force and self.clock() - self.last_replace < self.replace_seconds:
+                return None
+            stop, params = self._order_params(self.pending)
+            self.pending = None
+            if stop == self.stop_price:
+                return None
+            self.last_replace = self.clock()
+            try:
+                result = self.client.cancel_replace_order(cancelReplaceMode='STOP_ON_FAILURE', cancelOrderId=self.order_id, **params)
+            except BinanceAPIException as e:
+                # Anulowanie nie powiodło się - najczęściej stop został właśnie wykonany
+                if self.filled():
+                    return 'gone'
+                logger.warning(f"Nie udało się przesunąć stop lossa na giełdzie do {stop}: {e}")
+                return None
+            self.order_id = result['newOrderResponse']['orderId']
+            self.stop_price = stop
+            return 'replaced'
+
+    def _get_order(self):
+        if self.account is not None and self.account.live:
+            order = self.account.order(self.order_id)
+            if order is not None:
+                return order
+        return self.client.get_order(symbol=self.symbol, orderId=self.order_id)
+
+    def status(self):
+        return self._get_order()['status']
+
+    def filled(self):
+        return self.status() == 'FILLED'
+
+    def forget(self):
+        # Zlecenia nie ma już na giełdzie (anulowane, wygasłe) - nic do anulowania
+        with self.lock:
+            self._reset()
+
+    def finish(self):
+        # Anuluje zlecenie przed zamknięciem pozycji przez bota i zwraca jego końcowy
+        # stan: FILLED oznacza, że giełda już zamknęła pozycję (częściowe wykonanie
+        # zostawia resztę na saldzie do zamknięcia zleceniem MARKET). Trwające przesunięcie
+        # kończy się przed anulowaniem, więc anulowane jest zlecenie, które je zastąpiło.
+        with self.lock:
+            if not self.active:
+                return None
+            try:
+                order = self.client.cancel_order(symbol=self.symbol, orderId=self.order_id)
+            except BinanceAPIException:
+                order = self._get_order()
+                if order['status'] not in ('FILLED', 'CANCELED', 'EXPIRED', 'REJECTED'):
+                    raise
+            self._reset()
+            return order
+
+
+def average_price(order):
+    executed = float(order['executedQty'])
+    return float(order['cummulativeQuoteQty']) / executed if executed else None
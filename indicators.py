@@ -0,0 +1,319 @@
+import math
+from collections import deque
+
+import numpy as np
+
+import strategy
+
+# Strumieniowe wersje wskaźników z pandas_ta: stan inicjalizowany raz z historii,
+# potem aktualizowany jedną zamkniętą świecą w O(1), bez budowania DataFrame.
+# update(x) zatwierdza nową wartość, peek(x) liczy wartość dla świecy w trakcie
+# (bez zmiany stanu) - tak jak bot na żywo ocenia ostatni, niezamknięty wiersz.
+
+NAN = float('nan')
+
+
+class EMA:
+    # ta.ema: pierwsza wartość to SMA z `length` świec, dalej ewm(span, adjust=False)
+    def __init__(self, length):
+        self.length = length
+        self.alpha = 2 / (length + 1)
+        self.count = 0
+        self.seed_sum = 0.0
+        self.value = NAN
+
+    def peek(self, x):
+        n = self.count + 1
+        if n < self.length:
+            return NAN
+        if n == self.length:
+            return (self.seed_sum + x) / self.length
+        return (1 - self.alpha) * self.value + self.alpha * x
+
+    def update(self, x):
+        self.value = self.peek(x)
+        if self.count < self.length:
+            self.seed_sum += x
+        self.count += 1
+        return self.value
+
+
+class RMA:
+    # Średnia Wildera jak w pandas_ta: ewm(alpha=1/length, min_periods=length) z adjust=True,
+    # więc trzymamy osobno licznik i mianownik średniej ważonej
+    def __init__(self, length):
+        self.length = length
+        self.decay = 1 - 1 / length
+        self.num = 0.0
+        self.den = 0.0
+        self.nobs = 0
+
+    @property
+    def value(self):
+        return self.num / self.den if self.nobs >= self.length else NAN
+
+    def peek(self, x):
+        if math.isnan(x):
+            return self.value
+        if self.nobs + 1 < self.length:
+            return NAN
+        return (self.decay * self.num + x) / (self.decay * self.den + 1)
+
+    def update(self, x):
+        if math.isnan(x):
+            # Brak obserwacji nadal postarza wagi (ignore_na=False w pandas)
+            self.num *= self.decay
+            self.den *= self.decay
+        else:
+            self.num = self.decay * self.num + x
+            self.den = self.decay * self.den + 1
+            self.nobs += 1
+        return self.value
+
+
+class SMA:
+    def __init__(self, length):
+        self.length = length
+        self.window = deque(maxlen=length)
+        self.total = 0.0
+
+    @property
+    def value(self):
+        return self.total / self.length if len(self.window) == self.length else NAN
+
+    def peek(self, x):
+        if len(self.window) + 1 < self.length:
+            return NAN
+        oldest = self.window[0] if len(self.window) == self.length else 0.0
+        return (self.total - oldest + x) / self.length
+
+    def update(self, x):
+        if len(self.window) == self.length:
+            self.total -= self.window[0]
+        self.window.append(x)
+        self.total += x
+        return self.value
+
+
+def _ratio(a, b):
+    # 100 * a / (a + b) z NaN zamiast dzielenia przez zero (jak w pandas)
+    total = a + b
+    return 100 * a / total if total else NAN
+
+
+class RSI:
+    def __init__(self, length):
+        self.positive = RMA(length)
+        self.negative = RMA(length)
+        self.prev_close = None
+        self.value = NAN
+
+    def _changes(self, close):
+        change = close - self.prev_close
+        return max(change, 0.0), -min(change, 0.0)
+
+    def peek(self, close):
+        if self.prev_close is None:
+            return NAN
+        gain, loss = self._changes(close)
+        return _ratio(self.positive.peek(gain), self.negative.peek(loss))
+
+    def update(self, close):
+        if self.prev_close is not None:
+            gain, loss = self._changes(close)
+            self.value = _ratio(self.positive.update(gain), self.negative.update(loss))
+        self.prev_close = close
+        return self.value
+
+
+class ATR:
+    def __init__(self, length):
+        self.rma = RMA(length)
+        self.prev_close = None
+        self.value = NAN
+
+    def _true_range(self, high, low):
+        pc = self.prev_close
+        return max(high - low, abs(high - pc), abs(pc - low))
+
+    def peek(self, high, low, close):
+        if self.prev_close is None:
+            return NAN
+        return self.rma.peek(self._true_range(high, low))
+
+    def update(self, high, low, close):
+        if self.prev_close is not None:
+            self.value = self.rma.update(self._true_range(high, low))
+        self.prev_close = close
+        return self.value
+
+
+class ADX:
+    # ta.adx: DM+/DM- wygładzone RMA i podzielone przez ATR. ATR skraca się w ilorazie
+    # DX = |DM+ - DM-| / (DM+ + DM-), więc liczymy DX bezpośrednio z wygładzonych DM.
+    def __init__(self, length):
+        self.plus = RMA(length)
+        self.minus = RMA(length)
+        self.dx = RMA(length)
+        self.prev_high = None
+        self.prev_low = None
+        self.value = NAN
+
+    def _moves(self, high, low):
+        up = high - self.prev_high
+        down = self.prev_low - low
+        plus = up if up > down and up > 0 else 0.0
+        minus = down if down > up and down > 0 else 0.0
+        return plus, minus
+
+    @staticmethod
+    def _dx(plus, minus):
+        if math.isnan(plus) or math.isnan(minus):
+            return NAN
+        total = plus + minus
+        return 100 * abs(plus - minus) / total if total else NAN
+
+    def peek(self, high, low, close):
+        if self.prev_high is None:
+            return NAN
+        plus, minus = self._moves(high, low)
+        return self.dx.peek(self._dx(self.plus.peek(plus), self.minus.peek(minus)))
+
+    def update(self, high, low, close):
+        if self.prev_high is not None:
+            plus, minus = self._moves(high, low)
+            self.value = self.dx.update(self._dx(self.plus.update(plus), self.minus.update(minus)))
+        self.prev_high, self.prev_low = high, low
+        return self.value
+
+
+def _timestamps_ms(values):
+    return np.asarray(values, dtype='datetime64[ms]').astype(np.int64)
+
+
+class IndicatorEngine:
+    # Zestaw wskaźników strategii dla jednej pary/interwału. sync() dokarmia silnik
+    # tylko nowymi zamkniętymi świecami. closed() zwraca dwa "wiersze" (przedostatnia
+    # i ostatnia zamknięta świeca - do sygnałów, jak w backteście), snapshot() ostatnią
+    # zamkniętą i świecę w trakcie; oba w układzie kolumn DataFrame z
+    # strategy.calculate_indicators, w prealokowanych tablicach.
+    COLUMNS = ['close', 'ema_short', 'ema_long', 'rsi', 'atr', 'adx', 'daily_close', 'daily_regime_sma']
+
+    def __init__(self, params=None):
+        p = params or strategy.default_params()
+        self.params = p
+        self.ema_short = EMA(p['EMA_SHORT'])
+        self.ema_long = EMA(p['EMA_LONG'])
+        self.rsi = RSI(p['RSI_PERIOD'])
+        self.atr = ATR(p['ATR_PERIOD'])
+        self.adx = ADX(p['ADX_PERIOD_FOR_RISK']) if p['USE_DYNAMIC_RISK'] else None
+        self.regime_sma = SMA(p['REGIME_FILTER_PERIOD']) if p['USE_MARKET_REGIME_FILTER'] else None
+        self.last_close = NAN
+        self.last_timestamp = None
+        self.last_daily_timestamp = None
+        self.previous = (NAN,) * 6 # Wartości sprzed ostatniej zatwierdzonej świecy
+        columns = [c for c in self.COLUMNS if (c != 'adx' or self.adx) and (not c.startswith('daily') or self.regime_sma)]
+        self.rows = {column: np.full(2, np.nan) for column in columns}
+        self.closed_rows = {column: np.full(2, np.nan) for column in columns}
+
+    @property
+    def ready(self):
+        values = [self.ema_short.value, self.ema_long.value, self.rsi.value, self.atr.value]
+        if self.adx:
+            values.append(self.adx.value)
+        return self.last_timestamp is not None and not any(math.isnan(v) for v in values)
+
+    def _values(self):
+        adx = self.adx.value if self.adx else NAN
+        return self.last_close, self.ema_short.value, self.ema_long.value, self.rsi.value, self.atr.value, adx
+
+    def update(self, timestamp, high, low, close):
+        # Zatwierdza jedną zamkniętą świecę
+        self.previous = self._values()
+        self.ema_short.update(close)
+        self.ema_long.update(close)
+        self.rsi.update(close)
+        self.atr.update(high, low, close)
+        if self.adx:
+            self.adx.update(high, low, close)
+        self.last_close = close
+        self.last_timestamp = timestamp
+
+    def update_daily(self, timestamp, close):
+        if self.regime_sma:
+            self.regime_sma.update(close)
+        self.last_daily_timestamp = timestamp
+
+    @staticmethod
+    def _new_rows(timestamps, last_timestamp):
+        # Indeks pierwszej nowej świecy albo None, gdy dane nie zachodzą na stan (luka)
+        if last_timestamp is None:
+            return 0
+        if len(timestamps) and timestamps[0] > last_timestamp:
+            return None
+        return int(np.searchsorted(timestamps, last_timestamp, side='right'))
+
+    def sync(self, df, in_progress=True):
+        # df: DataFrame albo tablica świec z data.parse_klines (te same nazwy kolumn).
+        # Ostatni wiersz z get_klines to świeca w trakcie - zatwierdzamy tylko wcześniejsze
+        # (in_progress=False dla danych z magazynu świec, który trzyma tylko zamknięte).
+        # Zwraca False, jeśli między stanem a danymi jest luka i trzeba zainicjalizować od nowa.
+        timestamps = _timestamps_ms(df['timestamp'])
+        if in_progress:
+            timestamps = timestamps[:-1]
+        start = self._new_rows(timestamps, self.last_timestamp)
+        if start is None:
+            return False
+        high = np.asarray(df['high'], dtype=float)
+        low = np.asarray(df['low'], dtype=float)
+        close = np.asarray(df['close'], dtype=float)
+        for i in range(start, len(timestamps)):
+            self.update(int(timestamps[i]), high[i], low[i], close[i])
+        return True
+
+    def sync_daily(self, df_daily, in_progress=True):
+        # Świece dzienne indeksowane datą; przy in_progress ostatnia (dzisiejsza) jest w trakcie
+        timestamps = _timestamps_ms(np.array(df_daily.index, dtype='datetime64[D]'))
+        if in_progress:
+            timestamps = timestamps[:-1]
+        start = self._new_rows(timestamps, self.last_daily_timestamp)
+        if start is None:
+            # Luka w danych dziennych: pobrana historia jest pełna, więc liczymy od zera
+            self.regime_sma = SMA(self.params['REGIME_FILTER_PERIOD']) if self.regime_sma else None
+            self.last_daily_timestamp = None
+            start = 0
+        close = df_daily['close'].to_numpy(dtype=float)
+        for i in range(start, len(timestamps)):
+            self.update_daily(int(timestamps[i]), close[i])
+
+    def closed(self):
+        # Wiersz 0: przedostatnia zamknięta świeca, wiersz 1: świeca, która właśnie się zamknęła
+        rows = self.closed_rows
+        for column, previous, value in zip(self.COLUMNS, self.previous, self._values()):
+            if column in rows:
+                rows[column][:] = (previous, value)
+        if self.regime_sma:
+            # Dzienna świeca w trakcie zamyka się na ostatniej zamkniętej świecy bazowej
+            rows['daily_close'][:] = self.last_close
+            rows['daily_regime_sma'][:] = self.regime_sma.peek(self.last_close)
+        return rows
+
+    def snapshot(self, high, low, close):
+        # Wiersz 0: ostatnia zamknięta świeca, wiersz 1: świeca w trakcie (peek, bez zmiany stanu)
+        rows = self.rows
+        rows['close'][:] = (self.last_close, close)
+        rows['ema_short'][:] = (self.ema_short.value, self.ema_short.peek(close))
+        rows['ema_long'][:] = (self.ema_long.value, self.ema_long.peek(close))
+        rows['rsi'][:] = (self.rsi.value, self.rsi.peek(close))
+        rows['atr'][:] = (self.atr.value, self.atr.peek(high, low, close))
+        if self.adx:
+            rows['adx'][:] = (self.adx.value, self.adx.peek(high, low, close))
+        if self.regime_sma:
+            # Dzienna świeca w trakcie: jej zamknięcie to bieżąca cena (jak w bocie na żywo)
+            rows['daily_close'][:] = close
+            rows['daily_regime_sma'][:] = self.regime_sma.peek(close)
+        return rows
+
+
+def snapshot_row(rows, i=-1):
+    return {column: values[i] for column, values in rows.items()}
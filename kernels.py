@@ -0,0 +1,108 @@
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:  # Numba jest opcjonalna - bez niej ta sama funkcja działa jako zwykły Python
+    njit = None
+
+# Pętla ścieżkowa backtestu (wejście, stop loss, trailing stop, wyjście) na płaskich
+# tablicach float64. Każda operacja arytmetyczna jest w tej samej kolejności co
+# w strategy.initial_stop_loss / trail_stop_loss / position_size_usdc / position_pnl,
+# więc wynik jest bit w bit taki sam jak w logice bota na żywo.
+
+BUY, SELL = 1.0, -1.0
+
+# Kolumny tablicy transakcji zwracanej przez run_path
+ENTRY_INDEX, EXIT_INDEX, SIDE, ENTRY_PRICE, EXIT_PRICE, SIZE_USDC, PNL_USDC, PNL_PERCENT = range(8)
+TRADE_FIELDS = 8
+
+
+def _pnl(side, entry_price, exit_price, size_usdc):
+    pnl = (exit_price - entry_price) if side == BUY else (entry_price - exit_price)
+    pnl_percent = (pnl / entry_price) * 100
+    return size_usdc * (pnl_percent / 100), pnl_percent
+
+
+def _path_loop(close, atr, adx, buy, sell, capital, multiplier, trailing, dynamic_risk, adx_threshold,
+               risk_high, risk_low, min_order, equity, trades):
+    count = 0
+    in_position = False
+    side = BUY
+    entry_price = stop_loss = size_usdc = 0.0
+    entry_index = 0
+
+    for i in range(len(close)):
+        price = close[i]
+        if in_position:
+            if (side == BUY and price <= stop_loss) or (side == SELL and price >= stop_loss):
+                pnl_usdc, pnl_percent = _pnl(side, entry_price, stop_loss, size_usdc)
+                capital += pnl_usdc
+                row = trades[count]
+                row[ENTRY_INDEX] = entry_index
+                row[EXIT_INDEX] = i
+                row[SIDE] = side
+                row[ENTRY_PRICE] = entry_price
+                row[EXIT_PRICE] = stop_loss
+                row[SIZE_USDC] = size_usdc
+                row[PNL_USDC] = pnl_usdc
+                row[PNL_PERCENT] = pnl_percent
+                count += 1
+                in_position = False
+            elif trailing:
+                # max()/min() z Pythona: nowa wartość tylko wtedy, gdy jest ściśle lepsza
+                if side == BUY:
+                    candidate = price - atr[i] * multiplier
+                    if candidate > stop_loss:
+                        stop_loss = candidate
+                else:
+                    candidate = price + atr[i] * multiplier
+                    if candidate < stop_loss:
+                        stop_loss = candidate
+        elif (buy[i] or sell[i]) and capital > min_order:
+            new_side = BUY if buy[i] else SELL
+            offset = atr[i] * multiplier
+            sl_price = price - offset if new_side == BUY else price + offset
+            if price == sl_price:
+                size = 0.0
+            else:
+                risk = (risk_high if adx[i] > adx_threshold else risk_low) if dynamic_risk else risk_low
+                size = capital * risk / (abs(price - sl_price) / price)
+            # Na rynku spot zlecenie nie może przekroczyć dostępnego salda
+            if capital < size:
+                size = capital
+            if size >= min_order:
+                in_position = True
+                side, entry_price, stop_loss, size_usdc, entry_index = new_side, price, sl_price, size, i
+
+        if in_position:
+            equity[i] = capital + _pnl(side, entry_price, price, size_usdc)[0]
+        else:
+            equity[i] = capital
+    return count
+
+
+if njit is not None:
+    _pnl = njit(cache=True)(_pnl)
+    _compiled_loop = njit(cache=True)(_path_loop)
+else:
+    _compiled_loop = None
+
+
+def run_path(close, atr, adx, buy, sell, params, initial_capital, min_order):
+    # Zwraca (equity, trades): equity dla każdej świecy i tablicę transakcji (n, TRADE_FIELDS)
+    n = len(close)
+    equity = np.empty(n)
+    trades = np.empty((n // 2 + 1, TRADE_FIELDS))
+    scalars = (float(initial_capital), float(params['TRAILING_SL_ATR_MULTIPLIER']), bool(params['USE_TRAILING_STOP']),
+               bool(params['USE_DYNAMIC_RISK']), float(params['RISK_ADX_THRESHOLD']), float(params['RISK_PER_TRADE_HIGH']),
+               float(params['RISK_PER_TRADE_LOW']), float(min_order))
+    if _compiled_loop is not None:
+        arrays = [np.ascontiguousarray(a, dtype=np.float64) for a in (close, atr, adx)]
+        signals = [np.ascontiguousarray(a, dtype=np.bool_) for a in (buy, sell)]
+        count = _compiled_loop(*arrays, *signals, *scalars, equity, trades)
+    else:
+        # Bez Numby: listy Pythona indeksują się kilka razy szybciej niż elementy tablic NumPy
+        columns = [np.asarray(a, dtype=np.float64).tolist() for a in (close, atr, adx)]
+        signals = [np.asarray(a, dtype=bool).tolist() for a in (buy, sell)]
+        count = _path_loop(*columns, *signals, *scalars, equity, trades)
+    return equity, trades[:count]
@@ -0,0 +1,68 @@
+import asyncio
+import json
+import logging
+
+import websockets
+
+logger = logging.getLogger("binance_bot")
+
+STREAM_URL = 'wss://stream.binance.com:9443/stream'
+TESTNET_STREAM_URL = 'wss://testnet.binance.vision/stream'
+
+RECONNECT_DELAY_MIN = 1   # sekundy
+RECONNECT_DELAY_MAX = 30
+
+
+class MarketDataFeed:
+    # Strumień rynkowy Binance (kline + bookTicker na jednym połączeniu "combined stream").
+    # Każda aktualizacja trafia od razu do callbacków, więc kontrola stop lossa nie czeka
+    # na kolejne odpytanie REST. Po każdym (ponownym) połączeniu wywoływany jest backfill,
+    # który uzupełnia przez REST świece zamknięte w czasie przerwy.
+    def __init__(self, symbol, interval, on_kline, on_book, backfill=None, url=STREAM_URL):
+        self.symbol = symbol.lower()
+        self.interval = interval
+        self.on_kline = on_kline
+        self.on_book = on_book
+        self.backfill = backfill
+        self.url = f"{url}?streams={self.symbol}@kline_{interval}/{self.symbol}@bookTicker"
+        self._stopped = asyncio.Event()
+        self._connection = None
+
+    def stop(self):
+        self._stopped.set()
+        if self._connection is not None:
+            asyncio.ensure_future(self._connection.close())
+
+    def _dispatch(self, message):
+        payload = json.loads(message)
+        data = payload.get('data', payload)
+        if data.get('e') == 'kline':
+            k = data['k']
+            self.on_kline(int(k['t']), float(k['h']), float(k['l']), float(k['c']), bool(k['x']))
+        elif 'b' in data and 'a' in data:
+            self.on_book(float(data['b']), float(data['a']))
+
+    async def run(self):
+        delay = RECONNECT_DELAY_MIN
+        while not self._stopped.is_set():
+            try:
+                async with websockets.connect(self.url) as connection:
+                    self._connection = connection
+                    logger.info(f"Połączono ze strumieniem rynkowym {self.symbol}.")
+                    delay = RECONNECT_DELAY_MIN
+                    if self.backfill is not None:
+                        await asyncio.to_thread(self.backfill)
+                    async for message in connection:
+                        self._dispatch(message)
+                        if self._stopped.is_set():
+                            break
+            except (OSError, websockets.exceptions.WebSocketException) as e:
+                logger.warning(f"Utracono połączenie ze strumieniem rynkowym: {e}. Ponowna próba za {delay}s.")
+            finally:
+                self._connection = None
+            if not self._stopped.is_set():
+                try:
+                    await asyncio.wait_for(self._stopped.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                delay = min(delay * 2, RECONNECT_DELAY_MAX)
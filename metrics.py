@@ -0,0 +1,175 @@
+import bisect
+import functools
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger("binance_bot")
+
+# Minimalne metryki w formacie tekstowym Prometheusa (bez dodatkowych zależności).
+# Zapis to kilka operacji na słowniku pod blokadą, więc można je wołać na gorącej ścieżce.
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+REGISTRY = []
+
+
+def _labels_text(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join(f'{n}="{v}"' for n, v in zip(names, values)) + '}'
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(labels)
+        self.series = {}
+        self.lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(n, '')) for n in self.label_names)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        with self.lock:
+            for key, value in sorted(self.series.items()):
+                lines.extend(self._render_series(key, value))
+        return lines
+
+    def _render_series(self, key, value):
+        return [f"{self.name}{_labels_text(self.label_names, key)} {value}"]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.series[key] = self.series.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.series[key] = value
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def _render_series(self, key, value):
+        counts, total, count = value
+        names = self.label_names + ('le',)
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+            cumulative += bucket_count
+            lines.append(f"{self.name}_bucket{_labels_text(names, key + (bound,))} {cumulative}")
+        lines.append(f"{self.name}_sum{_labels_text(self.label_names, key)} {total}")
+        lines.append(f"{self.name}_count{_labels_text(self.label_names, key)} {count}")
+        return lines
+
+
+STAGE_SECONDS = Histogram('bot_stage_duration_seconds', 'Czas etapów cyklu bota', ('symbol', 'stage'))
+ORDER_ROUNDTRIP_SECONDS = Histogram('bot_order_roundtrip_seconds', 'Czas od wysłania zlecenia do odpowiedzi giełdy', ('symbol', 'side'))
+WAKE_LAG_SECONDS = Histogram('bot_candle_wake_lag_seconds', 'Opóźnienie wybudzenia względem zamknięcia świecy', ('interval',))
+API_REQUESTS = Counter('bot_api_requests_total', 'Zapytania REST do Binance', ('path', 'status'))
+API_ERRORS = Counter('bot_api_errors_total', 'Zapytania REST zakończone błędem HTTP', ('path', 'status'))
+API_USED_WEIGHT = Gauge('bot_api_used_weight_1m', 'Zużyta waga zapytań API w bieżącej minucie (X-MBX-USED-WEIGHT-1M)')
+API_THROTTLE_SECONDS = Counter('bot_api_throttle_seconds_total', 'Czas wstrzymania zapytań REST przez budżet wagi (limit lub 429/418)')
+ACCOUNT_STREAM_EVENTS = Counter('bot_account_stream_events_total', 'Zdarzenia strumienia danych użytkownika', ('event',))
+TELEGRAM_DROPPED = Counter('bot_telegram_dropped_total', 'Powiadomienia Telegram pominięte (pełna kolejka lub wyczerpane próby)')
+PORTFOLIO_EQUITY = Gauge('bot_portfolio_equity_usdc', 'Kapitał portfela wszystkich instancji z niezrealizowanym PnL')
+PORTFOLIO_DRAWDOWN = Gauge('bot_portfolio_drawdown_ratio', 'Obsunięcie kapitału portfela od szczytu')
+PORTFOLIO_EXPOSURE = Gauge('bot_portfolio_exposure_usdc', 'Łączna ekspozycja otwartych pozycji wszystkich instancji')
+
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+def record_api(path, status, used_weight=None):
+    API_REQUESTS.inc(path=path, status=status)
+    if status >= 400:
+        API_ERRORS.inc(path=path, status=status)
+    if used_weight is not None:
+        API_USED_WEIGHT.set(int(used_weight))
+
+
+def record_response(response, *args, **kwargs):
+    # Hook sesji requests: liczy każde zapytanie REST klienta Binance i zapamiętuje wagę
+    path = response.request.path_url.split('?', 1)[0]
+    record_api(path, response.status_code, response.headers.get('X-MBX-USED-WEIGHT-1M'))
+    return response
+
+
+def timed(stage):
+    # Dekorator metod bota: czas etapu trafia do histogramu i do podsumowania cyklu
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - started
+                STAGE_SECONDS.observe(elapsed, symbol=self.symbol, stage=stage)
+                self.cycle_timings[stage] = self.cycle_timings.get(stage, 0.0) + elapsed
+        return wrapper
+    return decorator
+
+
+def format_cycle(timings):
+    # Zwięzła linia do logu: etap=czas w ms
+    return ' '.join(f"{stage}={seconds * 1000:.1f}ms" for stage, seconds in timings.items())
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass # Nie zaśmiecaj logu bota zapytaniami scrapera
+
+
+def start_server(port, host='127.0.0.1'):
+    server = ThreadingHTTPServer((host, port), _Handler)
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    logger.info(f"Metryki dostępne pod http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,121 @@
+import asyncio
+import inspect
+import logging
+import queue
+import threading
+import time
+
+from telegram.error import BadRequest, Forbidden, RetryAfter, TelegramError
+
+import metrics
+
+logger = logging.getLogger("binance_bot")
+# httpx loguje każde zapytanie razem z adresem zawierającym token bota
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+QUEUE_SIZE = 100          # Maksymalna liczba oczekujących wiadomości
+MIN_SEND_INTERVAL = 1.0   # sekundy między wysyłkami do jednego czatu (limit Telegrama)
+MAX_MESSAGE_LENGTH = 4096 # Limit długości jednej wiadomości Telegram
+MAX_RETRIES = 5
+RETRY_DELAY_MIN = 1       # sekundy, podwajane przy kolejnych próbach
+RETRY_DELAY_MAX = 60
+BATCH_SEPARATOR = '\n\n'
+
+_STOP = object()
+
+
+class TelegramNotifier:
+    # Wysyłka powiadomień w osobnym wątku: send() tylko wrzuca wiadomość do ograniczonej
+    # kolejki, więc ścieżka handlowa (zlecenia, kontrola stop lossa) nigdy nie czeka na
+    # API Telegrama. Wątek łączy wiadomości nagromadzone w czasie oczekiwania w jedną,
+    # pilnuje odstępu między wysyłkami i ponawia nieudane próby z rosnącym opóźnieniem.
+    def __init__(self, bot, chat_id, max_queue=QUEUE_SIZE, min_interval=MIN_SEND_INTERVAL):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.min_interval = min_interval
+        self.queue = queue.Queue(maxsize=max_queue)
+        self._pending = None # Wiadomość pobrana z kolejki, która nie zmieściła się w paczce
+        self._last_sent = 0.0
+        self._thread = threading.Thread(target=self._run, name='telegram', daemon=True)
+        self._thread.start()
+
+    def send(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except queue.Full:
+            metrics.TELEGRAM_DROPPED.inc()
+            logger.warning(f"Kolejka Telegram pełna - pomijam wiadomość: {message}")
+
+    def close(self, timeout=10):
+        # Wysyła to, co zostało w kolejce, i zatrzymuje wątek
+        try:
+            self.queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+
+    def _next_batch(self):
+        # Pierwsza wiadomość blokująco, potem wszystko, co już czeka - do limitu długości
+        first = self._pending if self._pending is not None else self.queue.get()
+        self._pending = None
+        if first is _STOP:
+            return None
+        batch = [first[:MAX_MESSAGE_LENGTH]]
+        length = len(batch[0])
+        while True:
+            try:
+                message = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if message is _STOP or length + len(BATCH_SEPARATOR) + len(message) > MAX_MESSAGE_LENGTH:
+                self._pending = message
+                break
+            batch.append(message)
+            length += len(BATCH_SEPARATOR) + len(message)
+        return BATCH_SEPARATOR.join(batch)
+
+    async def _deliver(self, text):
+        delay = RETRY_DELAY_MIN
+        for attempt in range(1, MAX_RETRIES + 1):
+            wait = self._last_sent + self.min_interval - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            try:
+                result = self.bot.send_message(chat_id=self.chat_id, text=text)
+                if inspect.isawaitable(result): # python-telegram-bot >= 20 ma asynchroniczne API
+                    await result
+                self._last_sent = time.monotonic()
+                return True
+            except RetryAfter as e:
+                # Telegram sam podaje, ile trzeba odczekać po przekroczeniu limitu
+                retry_after = e.retry_after
+                wait = retry_after.total_seconds() if hasattr(retry_after, 'total_seconds') else retry_after
+                logger.warning(f"Limit wiadomości Telegram - ponowna próba za {wait}s.")
+                await asyncio.sleep(wait)
+            except (BadRequest, Forbidden) as e:
+                logger.error(f"Telegram odrzucił wiadomość: {e}")
+                return False
+            except (TelegramError, OSError) as e:
+                logger.warning(f"Błąd wysyłania wiadomości Telegram (próba {attempt}/{MAX_RETRIES}): {e}")
+                if attempt < MAX_RETRIES:
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, RETRY_DELAY_MAX)
+        logger.error(f"Nie udało się wysłać wiadomości Telegram: {text}")
+        return False
+
+    def _run(self):
+        # Własna pętla zdarzeń wątku - klient HTTP Telegrama zostaje przypięty do jednej pętli
+        loop = asyncio.new_event_loop()
+        try:
+            while True:
+                text = self._next_batch()
+                if text is None:
+                    break
+                try:
+                    if not loop.run_until_complete(self._deliver(text)):
+                        metrics.TELEGRAM_DROPPED.inc()
+                except Exception as e:
+                    metrics.TELEGRAM_DROPPED.inc()
+                    logger.error(f"Nieoczekiwany błąd wysyłki Telegram: {e}")
+        finally:
+            loop.close()
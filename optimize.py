@@ -0,0 +1,132 @@
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from binance.client import Client
+
+import backtest
+import strategy
+from config import *
+
+logger = logging.getLogger("binance_bot")
+
+CANDLE_FIELDS = ['timestamp', 'open', 'high', 'low', 'close', 'volume']
+RANK_EVERY = 100  # Co ile wyników przepisywać plik rankingu
+
+# Stan procesu roboczego: świece otwarte z memmap i cache wskaźników per okres
+_worker = {}
+
+
+def param_grid(grid=OPTIMIZATION_PARAMS):
+    names = list(grid)
+    for values in itertools.product(*(grid[name] for name in names)):
+        yield dict(zip(names, values))
+
+
+def combo_key(combo):
+    return json.dumps(combo, sort_keys=True)
+
+
+def dump_candles(df, df_daily, data_dir):
+    # Zapisuje świece jako pliki .npy, które procesy robocze otwierają przez memmap
+    # (tylko do odczytu) zamiast dostawać kopię danych w każdym zadaniu
+    os.makedirs(data_dir, exist_ok=True)
+    daily = df_daily.copy()
+    daily.index = pd.to_datetime(pd.Index(daily.index))
+    daily = daily.rename_axis('timestamp').reset_index()
+    for prefix, frame in (('base', df), ('daily', daily)):
+        for field in CANDLE_FIELDS:
+            values = frame[field].to_numpy()
+            if field == 'timestamp':
+                values = values.astype('datetime64[ms]').astype(np.int64)
+            np.save(os.path.join(data_dir, f"{prefix}_{field}.npy"), values.astype(np.int64 if field == 'timestamp' else np.float64))
+
+
+def load_candles(data_dir):
+    # Kolumny DataFrame to widoki memmap (copy=False, timestamp to ta sama pamięć int64
+    # jako datetime64[ms]) - procesy robocze dzielą jedną kopię świec w pamięci systemu
+    frames = {}
+    for prefix in ('base', 'daily'):
+        columns = {field: np.load(os.path.join(data_dir, f"{prefix}_{field}.npy"), mmap_mode='r') for field in CANDLE_FIELDS}
+        columns['timestamp'] = columns['timestamp'].view('datetime64[ms]')
+        frames[prefix] = pd.DataFrame(columns, copy=False)
+    df_daily = frames['daily']
+    df_daily['timestamp'] = df_daily['timestamp'].dt.date
+    df_daily.set_index('timestamp', inplace=True)
+    return frames['base'], df_daily
+
+
+def _init_worker(data_dir):
+    _worker['df'], _worker['df_daily'] = load_candles(data_dir)
+    _worker['cache'] = {}
+
+
+def _evaluate(combo):
+    params = strategy.default_params(**combo)
+    result = backtest.run_backtest(_worker['df'], _worker['df_daily'], params, INITIAL_CAPITAL, _worker['cache'])
+    return combo, result['stats']
+
+
+def load_results(results_file):
+    # Wczytuje wyniki z poprzedniego (być może przerwanego) uruchomienia
+    done = {}
+    if not os.path.exists(results_file):
+        return done
+    with open(results_file, 'r') as f:
+        for line in f:
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # Ucięta ostatnia linia po przerwaniu
+            done[combo_key(row['params'])] = row
+    return done
+
+
+def rank_results(done):
+    rows = [{**row['params'], **row['stats']} for row in done.values()]
+    ranked = pd.DataFrame(rows)
+    if not ranked.empty:
+        ranked.sort_values('total_return_percent', ascending=False, inplace=True)
+        ranked.reset_index(drop=True, inplace=True)
+    return ranked
+
+
+def run_optimization(df, df_daily, grid=OPTIMIZATION_PARAMS, results_file=OPTIMIZE_RESULTS_FILE,
+                     ranked_file=OPTIMIZE_RANKED_FILE, data_dir=OPTIMIZE_DATA_DIR, processes=None):
+    done = load_results(results_file)
+    pending = [combo for combo in param_grid(grid) if combo_key(combo) not in done]
+    processes = processes or os.cpu_count()
+    logger.info(f"Optymalizacja: {len(done)} kombinacji już policzonych, {len(pending)} do policzenia na {processes} procesach.")
+
+    if pending:
+        dump_candles(df, df_daily, data_dir)
+        chunksize = max(1, len(pending) // (processes * 16))
+        started = time.perf_counter()
+        with multiprocessing.Pool(processes, initializer=_init_worker, initargs=(data_dir,)) as pool, \
+             open(results_file, 'a') as f:
+            for count, (combo, stats) in enumerate(pool.imap_unordered(_evaluate, pending, chunksize), start=1):
+                row = {'params': combo, 'stats': stats}
+                f.write(json.dumps(row) + '\n')
+                f.flush()
+                done[combo_key(combo)] = row
+                if count % RANK_EVERY == 0 or count == len(pending):
+                    rank_results(done).to_csv(ranked_file, index=False)
+                    logger.info(f"  {count}/{len(pending)} kombinacji ({time.perf_counter() - started:.1f}s)")
+
+    ranked = rank_results(done)
+    ranked.to_csv(ranked_file, index=False)
+    return ranked
+
+
+def main():
+    client = Client()  # Publiczne dane rynkowe nie wymagają kluczy API
+    df, df_daily = backtest.load_history(client, regime_period=max(OPTIMIZATION_PARAMS['REGIME_FILTER_PERIOD']))
+    ranked = run_optimization(df, df_daily)
+    logger.info(f"Najlepsze kombinacje zapisano do {OPTIMIZE_RANKED_FILE}:")
+    logger.info("\n" + ranked.head(10).to_string())
+    return ranked
@@ -0,0 +1,195 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import threading
+import time
+from urllib.parse import urlencode
+
+import aiohttp
+import requests
+from binance.exceptions import BinanceAPIException
+
+import metrics
+from config import API_WEIGHT_LIMIT, API_WEIGHT_RESERVE
+
+logger = logging.getLogger("binance_bot")
+
+API_URL = 'https://api.binance.com/api'
+TESTNET_API_URL = 'https://testnet.binance.vision/api'
+
+# Waga zapytań REST według dokumentacji Binance Spot (limit REQUEST_WEIGHT na minutę i IP)
+ENDPOINT_WEIGHTS = {
+    '/api/v3/klines': 2,
+    '/api/v3/account': 20,
+    '/api/v3/exchangeInfo': 20,
+    '/api/v3/order': 4,          # GET; złożenie i anulowanie zlecenia kosztują 1
+    '/api/v3/openOrders': 6,
+    '/api/v3/ticker/price': 2,
+    '/api/v3/depth': 5,
+    '/api/v3/userDataStream': 2,
+}
+
+
+def endpoint_weight(method, path):
+    if method != 'GET' and path.startswith('/api/v3/order'):
+        return 1
+    return ENDPOINT_WEIGHTS.get(path, 1)
+
+
+class WeightBudget:
+    # Wspólny dla procesu licznik wagi zapytań w bieżącej minucie. Każde zapytanie
+    # rezerwuje swoją wagę przed wysłaniem; nagłówek X-MBX-USED-WEIGHT-1M z odpowiedzi
+    # koryguje licznik (liczy też zapytania spoza bota z tego samego IP). Po przekroczeniu
+    # limitu minus rezerwa zapytania czekają na nową minutę, zamiast dostać 429,
+    # a po 429/418 wszystkie czekają tyle, ile każe Retry-After.
+    def __init__(self, limit=API_WEIGHT_LIMIT, reserve=API_WEIGHT_RESERVE, clock=time.time):
+        self.limit = limit
+        self.reserve = reserve
+        self.clock = clock
+        self.used = 0
+        self.minute = None
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def _roll(self, now):
+        minute = int(now // 60)
+        if minute != self.minute:
+            self.minute = minute
+            self.used = 0
+
+    def _reserve(self, weight):
+        # Zwraca 0 po zarezerwowaniu wagi albo liczbę sekund do odczekania
+        with self.lock:
+            now = self.clock()
+            if now < self.blocked_until:
+                return self.blocked_until - now
+            self._roll(now)
+            if self.used and self.used + weight > self.limit - self.reserve:
+                return (self.minute + 1) * 60 - now + 0.05
+            self.used += weight
+            return 0
+
+    def acquire(self, weight=1):
+        while True:
+            delay = self._reserve(weight)
+            if not delay:
+                return
+            metrics.API_THROTTLE_SECONDS.inc(delay)
+            time.sleep(delay)
+
+    async def acquire_async(self, weight=1):
+        while True:
+            delay = self._reserve(weight)
+            if not delay:
+                return
+            metrics.API_THROTTLE_SECONDS.inc(delay)
+            await asyncio.sleep(delay)
+
+    def update(self, status, used_weight=None, retry_after=None):
+        with self.lock:
+            now = self.clock()
+            self._roll(now)
+            if used_weight is not None:
+                self.used = max(self.used, int(used_weight))
+            if status in (418, 429):
+                wait = float(retry_after) if retry_after else 60.0
+                self.blocked_until = max(self.blocked_until, now + wait)
+                logger.warning(f"Binance zwrócił {status} - wstrzymuję zapytania REST na {wait:.0f}s.")
+
+
+BUDGET = WeightBudget()
+
+
+class BudgetAdapter(requests.adapters.HTTPAdapter):
+    # Adapter sesji synchronicznego klienta python-binance pilnujący tego samego budżetu wagi
+    def __init__(self, budget=BUDGET, **kwargs):
+        self.budget = budget
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        path = request.path_url.split('?', 1)[0]
+        self.budget.acquire(endpoint_weight(request.method, path))
+        response = super().send(request, **kwargs)
+        self.budget.update(response.status_code, response.headers.get('X-MBX-USED-WEIGHT-1M'), response.headers.get('Retry-After'))
+        return response
+
+
+class _ErrorResponse:
+    # Minimalna odpowiedź dla BinanceAPIException (tak jak z requests w python-binance)
+    def __init__(self, status, text):
+        self.status_code = status
+        self.text = text
+
+
+class AsyncBinanceClient:
+    # Asynchroniczny klient REST: jedna sesja aiohttp z pulą połączeń keep-alive,
+    # podpisy HMAC jak w python-binance i wspólny budżet wagi z klientem synchronicznym.
+    # Błędy API zgłaszane są jako BinanceAPIException, więc obsługa w bocie jest ta sama.
+    def __init__(self, api_key=None, api_secret=None, base_url=API_URL, budget=BUDGET, pool_size=10, timeout=10, recv_window=5000):
+        self.api_key = api_key
+        self.api_secret = api_secret
+        self.base_url = base_url.rstrip('/')
+        self.budget = budget
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.recv_window = recv_window
+        self._session = None
+
+    def _get_session(self):
+        # Sesja tworzona leniwie, bo musi należeć do działającej pętli zdarzeń
+        if self._session is None or self._session.closed:
+            headers = {'X-MBX-APIKEY': self.api_key} if self.api_key else {}
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers=headers,
+            )
+        return self._session
+
+    def _sign(self, params):
+        params = dict(params, recvWindow=self.recv_window, timestamp=int(time.time() * 1000))
+        query = urlencode(params)
+        signature = hmac.new(self.api_secret.encode(), query.encode(), hashlib.sha256).hexdigest()
+        return f"{query}&signature={signature}"
+
+    async def request(self, method, path, params=None, signed=False):
+        # path względem base_url, np. 'v3/klines'
+        url = f"{self.base_url}/{path}"
+        api_path = '/api/' + path
+        params = {k: v for k, v in (params or {}).items() if v is not None}
+        query = self._sign(params) if signed else urlencode(params)
+        await self.budget.acquire_async(endpoint_weight(method, api_path))
+        async with self._get_session().request(method, f"{url}?{query}" if query else url) as response:
+            text = await response.text()
+            used = response.headers.get('X-MBX-USED-WEIGHT-1M')
+            self.budget.update(response.status, used, response.headers.get('Retry-After'))
+            metrics.record_api(api_path, response.status, used)
+            if response.status >= 400:
+                raise BinanceAPIException(_ErrorResponse(response.status, text), response.status, text)
+            return json.loads(text)
+
+    async def get_server_time(self):
+        return await self.request('GET', 'v3/time')
+
+    async def get_klines(self, symbol, interval, limit=500, startTime=None, endTime=None):
+        return await self.request('GET', 'v3/klines', {'symbol': symbol, 'interval': interval, 'limit': limit,
+                                                       'startTime': startTime, 'endTime': endTime})
+
+    async def get_account(self):
+        return await self.request('GET', 'v3/account', signed=True)
+
+    async def get_asset_balance(self, asset):
+        account = await self.get_account()
+        for balance in account['balances']:
+            if balance['asset'] == asset:
+                return balance
+        return None
+
+    async def create_order(self, **params):
+        return await self.request('POST', 'v3/order', params, signed=True)
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
@@ -0,0 +1,301 @@
+import asyncio
+import logging
+import math
+import threading
+
+import numpy as np
+
+import metrics
+import timeframes
+from config import (PORTFOLIO_BATCH_TIMEOUT, PORTFOLIO_MAX_DAILY_VOLATILITY, PORTFOLIO_MAX_DRAWDOWN, PORTFOLIO_MAX_EXPOSURE,
+                    PORTFOLIO_MIN_OBSERVATIONS, PORTFOLIO_RETURNS_INTERVAL, PORTFOLIO_RETURNS_WINDOW)
+
+logger = logging.getLogger("binance_bot")
+
+SIDES = {'BUY': 1.0, 'SELL': -1.0}
+SERVED_BATCHES = 64 # Ile rozdzielonych zamknięć świec pamiętać (do rozpoznania spóźnionych zgłoszeń)
+
+
+def variance_scale(a, b, c, limit):
+    # Największe s z [0, 1], dla którego wariancja portfela a*s^2 + 2*b*s + c <= limit
+    # (a - nowe pozycje, c - otwarte, b - ich kowariancja); 0, gdy żadne s nie spełnia limitu
+    if a + 2 * b + c <= limit:
+        return 1.0
+    if a <= 0:
+        return 0.0
+    disc = b * b - a * (c - limit)
+    if disc < 0:
+        return 0.0
+    root = math.sqrt(disc)
+    low, high = (-b - root) / a, (-b + root) / a
+    if low > 1 or high < 0:
+        return 0.0
+    return min(1.0, high)
+
+
+class _Batch:
+    def __init__(self, expected):
+        self.expected = expected
+        self.plans = {}
+        self.done = False
+        self.event = asyncio.Event()
+
+
+class PortfolioRisk:
+    # Wspólne ryzyko wszystkich instancji w procesie. Trzyma otwarte pozycje, kapitał
+    # portfela (z szczytem do limitu obsunięcia) i kroczącą macierz kowariancji zwrotów
+    # par z interwału PORTFOLIO_RETURNS_INTERVAL: sumy i sumy iloczynów okna są
+    # aktualizowane przy każdym nowym zwrocie, więc macierz jest gotowa bez przeliczania.
+    # Sygnały wszystkich instancji zamykających świecę w tej samej chwili są zbierane
+    # (submit) i dzielone jednym obliczeniem (allocate): pożądane wielkości są skalowane
+    # wspólnym współczynnikiem tak, by zmieściły się w wolnym saldzie, limicie ekspozycji
+    # i limicie dziennej zmienności portfela; po obsunięciu ponad limit wejścia są wstrzymane.
+    def __init__(self, max_exposure=PORTFOLIO_MAX_EXPOSURE, max_volatility=PORTFOLIO_MAX_DAILY_VOLATILITY,
+                 max_drawdown=PORTFOLIO_MAX_DRAWDOWN, interval=PORTFOLIO_RETURNS_INTERVAL, window=PORTFOLIO_RETURNS_WINDOW,
+                 min_observations=PORTFOLIO_MIN_OBSERVATIONS, batch_timeout=PORTFOLIO_BATCH_TIMEOUT):
+        self.max_exposure = max_exposure
+        self.max_volatility = max_volatility
+        self.max_drawdown = max_drawdown
+        self.interval = interval
+        self.periods_per_day = timeframes.DAY_MS / timeframes.interval_ms(interval)
+        self.window = window
+        self.min_observations = min_observations
+        self.batch_timeout = batch_timeout
+
+        self.symbols = {}          # para -> kolumna macierzy
+        self.members = {}          # instancja -> interwał (do liczenia uczestników zamknięcia świecy)
+        self.positions = {}        # instancja -> (kolumna, kierunek, wielkość USDC, cena wejścia)
+        self.capital = None        # Kapitał portfela bez niezrealizowanego PnL (od pierwszej alokacji)
+        self.peak = None
+        self._batches = {}
+        self._served = {}          # close_ms -> instancje, których plany już rozdzielono
+        self.lock = threading.Lock()
+        self._resize(0)
+
+    def _resize(self, n):
+        # Nowa para w trakcie pracy zaczyna z pustą historią zwrotów (okno liczone od nowa)
+        self.last_price = np.full(n, np.nan)
+        self.bucket_close = np.full(n, np.nan)
+        self.bucket = None
+        self.returns = np.zeros((self.window, n))
+        self.count = 0
+        self.pos = 0
+        self.pushes = 0
+        self.sum = np.zeros(n)
+        self.sum_products = np.zeros((n, n))
+
+    def register(self, key, symbol, interval):
+        with self.lock:
+            self.members[key] = interval
+            if symbol not in self.symbols:
+                self.symbols[symbol] = len(self.symbols)
+                self._resize(len(self.symbols))
+
+    def seed(self, history):
+        # Okno zwrotów z historii świec: {para: (czasy otwarcia ms, zamknięcia)}. Dla każdego
+        # przedziału bierzemy ostatnie zamknięcie świecy, brakujące przedziały powtarzają poprzednie.
+        with self.lock:
+            history = {symbol: (timeframes.to_ms(times), np.asarray(closes, dtype=float))
+                       for symbol, (times, closes) in history.items() if symbol in self.symbols and len(times)}
+            if not history:
+                return
+            last = max(int(timeframes.bucket_ids(times[-1:], self.interval)[0]) for times, _ in history.values())
+            grid = np.arange(last - self.window, last + 1)
+            closes = np.full((len(grid), len(self.symbols)), np.nan)
+            for symbol, (times, values) in history.items():
+                index = np.searchsorted(timeframes.bucket_ids(times, self.interval), grid, side='right') - 1
+                closes[:, self.symbols[symbol]] = np.where(index >= 0, values[np.maximum(index, 0)], np.nan)
+            self._resize(len(self.symbols))
+            self.bucket_close = closes[0].copy()
+            for row in closes[1:-1]: # Ostatni przedział jeszcze trwa
+                self._push_close(row)
+            self.last_price = closes[-1].copy()
+            self.bucket = int(last)
+
+    def _push_close(self, closes):
+        # Zamknięcie przedziału: zwrot logarytmiczny względem poprzedniego (0 bez ceny)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            row = np.log(closes / self.bucket_close)
+        row[~np.isfinite(row)] = 0.0
+        self.bucket_close = np.where(np.isnan(closes), self.bucket_close, closes)
+        if self.count == self.window:
+            old = self.returns[self.pos]
+            self.sum -= old
+            self.sum_products -= np.outer(old, old)
+        else:
+            self.count += 1
+        self.returns[self.pos] = row
+        self.sum += row
+        self.sum_products += np.outer(row, row)
+        self.pos = (self.pos + 1) % self.window
+        self.pushes += 1
+        if self.pushes % self.window == 0:
+            # Okresowo od zera, żeby błędy zaokrągleń odejmowania nie narastały
+            rows = self.returns[:self.count]
+            self.sum = rows.sum(axis=0)
+            self.sum_products = rows.T @ rows
+
+    def on_price(self, symbol, open_ms, close):
+        # Zamknięcie świecy pary (czas otwarcia świecy); świeca z nowego przedziału zamyka poprzedni
+        with self.lock:
+            column = self.symbols.get(symbol)
+            if column is None:
+                return
+            bucket = int(timeframes.bucket_ids(np.array([open_ms], dtype=np.int64), self.interval)[0])
+            if self.bucket is None:
+                self.bucket = bucket
+            elif bucket > self.bucket:
+                missing = bucket - self.bucket
+                if missing > self.window:
+                    self._resize(len(self.symbols)) # Przerwa dłuższa niż okno - historia nieaktualna
+                else:
+                    for _ in range(missing): # Przedziały bez świec to zerowe zwroty
+                        self._push_close(self.last_price)
+                self.bucket = bucket
+            self.last_price[column] = close
+            self._update_peak()
+
+    def covariance(self):
+        # Dzienna macierz kowariancji zwrotów albo None, gdy historii jest za mało
+        m = self.count
+        if m < max(2, self.min_observations):
+            return None
+        cov = (self.sum_products - np.outer(self.sum, self.sum) / m) / (m - 1)
+        return cov * self.periods_per_day
+
+    def _exposure(self):
+        # Ekspozycja otwartych pozycji według pary (ze znakiem, wyceniona po ostatniej cenie) i brutto
+        exposure = np.zeros(len(self.symbols))
+        gross = 0.0
+        for column, side, size_usdc, entry_price in self.positions.values():
+            price = self.last_price[column]
+            value = size_usdc * (price / entry_price) if price > 0 and entry_price > 0 else size_usdc
+            exposure[column] += side * value
+            gross += value
+        return exposure, gross
+
+    def _unrealized(self):
+        pnl = 0.0
+        for column, side, size_usdc, entry_price in self.positions.values():
+            price = self.last_price[column]
+            if price > 0 and entry_price > 0:
+                pnl += side * size_usdc * (price - entry_price) / entry_price
+        return pnl
+
+    def equity(self):
+        return None if self.capital is None else self.capital + self._unrealized()
+
+    def _update_peak(self):
+        equity = self.equity()
+        if equity is not None:
+            self.peak = equity if self.peak is None else max(self.peak, equity)
+            metrics.PORTFOLIO_EQUITY.set(equity)
+            metrics.PORTFOLIO_DRAWDOWN.set(self.drawdown())
+
+    def drawdown(self):
+        equity = self.equity()
+        if equity is None or not self.peak:
+            return 0.0
+        return max(0.0, 1 - equity / self.peak)
+
+    def open(self, key, symbol, side, size_usdc, entry_price):
+        with self.lock:
+            self.positions[key] = (self.symbols[symbol], SIDES[side], float(size_usdc), float(entry_price))
+            metrics.PORTFOLIO_EXPOSURE.set(self._exposure()[1])
+
+    def close(self, key, exit_price=None):
+        # Zamknięcie pozycji: PnL (po exit_price albo ostatniej cenie pary) przechodzi do kapitału
+        with self.lock:
+            position = self.positions.pop(key, None)
+            if position is None:
+                return
+            column, side, size_usdc, entry_price = position
+            price = exit_price or self.last_price[column]
+            if self.capital is not None and price > 0 and entry_price > 0:
+                self.capital += side * size_usdc * (price - entry_price) / entry_price
+            metrics.PORTFOLIO_EXPOSURE.set(self._exposure()[1])
+            self._update_peak()
+
+    def allocate(self, plans):
+        # Jedno obliczenie dla wszystkich sygnałów cyklu. plans: słowniki z symbol, side,
+        # size_usdc (pożądana wielkość) i balance (wolne saldo); size_usdc jest nadpisywane.
+        # Zwraca wspólny współczynnik skali.
+        if not plans:
+            return 1.0
+        with self.lock:
+            columns = np.array([self.symbols[p['symbol']] for p in plans])
+            sides = np.array([SIDES[p['side']] for p in plans])
+            desired = np.array([p['size_usdc'] for p in plans], dtype=float)
+            balance = min(p['balance'] for p in plans) # Instancje dzielą jedno saldo konta
+            exposure, gross = self._exposure()
+            if self.capital is None:
+                # Kapitał portfela: saldo plus otwarte pozycje po koszcie (pozycje SELL są już w saldzie)
+                self.capital = balance + sum(side * size for _, side, size, _ in self.positions.values())
+            self._update_peak()
+            equity = self.equity()
+            total = desired.sum()
+
+            limits = {'saldo': balance / total if total > 0 else 1.0,
+                      'ekspozycja': max(0.0, self.max_exposure * equity - gross) / total if total > 0 else 1.0}
+            cov = self.covariance()
+            if cov is not None:
+                new = np.bincount(columns, weights=sides * desired, minlength=len(self.symbols))
+                limits['zmienność'] = variance_scale(new @ cov @ new, exposure @ cov @ new, exposure @ cov @ exposure,
+                                                     (self.max_volatility * equity) ** 2)
+            if self.drawdown() >= self.max_drawdown:
+                limits['obsunięcie'] = 0.0
+            reason = min(limits, key=limits.get)
+            scale = min(1.0, limits[reason])
+            for plan, size in zip(plans, desired * scale):
+                plan['size_usdc'] = float(size)
+        if scale < 1.0:
+            logger.info(f"Ryzyko portfela: {len(plans)} sygnał(y) przeskalowane x{scale:.3f} (limit: {reason}, "
+                        f"kapitał {equity:.2f} USDC, ekspozycja {gross:.2f} USDC, obsunięcie {self.drawdown() * 100:.1f}%).")
+        return scale
+
+    def _expected(self, close_ms):
+        # Liczba instancji, których świeca zamyka się w close_ms
+        count = 0
+        for interval in self.members.values():
+            offset = timeframes.INTERVAL_OFFSETS_MS.get(interval, 0)
+            if (close_ms - offset) % timeframes.interval_ms(interval) == 0:
+                count += 1
+        return max(1, count)
+
+    async def submit(self, close_ms, key, plan):
+        # Każda instancja zgłasza się raz na zamknięcie swojej świecy (plan None bez sygnału).
+        # Gdy zgłoszą się wszystkie instancje tej świecy (albo minie batch_timeout), plany
+        # są dzielone jednym allocate. Zwraca plan z przydzieloną wielkością albo None.
+        served = self._served.get(close_ms)
+        if close_ms is None or (served is not None and close_ms not in self._batches):
+            # Spóźnione zgłoszenie (paczka tej świecy już rozdzielona) - bez ponownego czekania
+            if served is not None:
+                logger.warning(f"Ryzyko portfela: spóźnione zgłoszenie {key} - dzielę od razu, bez pozostałych ({len(served)}).")
+                served.add(key)
+            self.allocate([plan] if plan else [])
+            return plan
+        batch = self._batches.get(close_ms)
+        if batch is None:
+            batch = self._batches[close_ms] = _Batch(self._expected(close_ms))
+        batch.plans[key] = plan
+        if len(batch.plans) >= batch.expected:
+            self._run(close_ms, batch)
+        else:
+            try:
+                await asyncio.wait_for(batch.event.wait(), self.batch_timeout)
+            except asyncio.TimeoutError:
+                if not batch.done:
+                    logger.warning(f"Ryzyko portfela: zgłosiło się {len(batch.plans)} z {batch.expected} instancji - dzielę bez pozostałych.")
+                    self._run(close_ms, batch)
+        return batch.plans[key]
+
+    def _run(self, close_ms, batch):
+        batch.done = True
+        try:
+            self.allocate([plan for plan in batch.plans.values() if plan])
+        finally:
+            del self._batches[close_ms]
+            self._served[close_ms] = set(batch.plans)
+            while len(self._served) > SERVED_BATCHES:
+                del self._served[next(iter(self._served))]
+            batch.event.set()
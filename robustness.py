@@ -0,0 +1,185 @@
+import json
+import logging
+import multiprocessing
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from binance.client import Client
+
+import backtest
+import optimize
+import strategy
+from config import *
+from timeframes import DAY_MS
+
+logger = logging.getLogger("binance_bot")
+
+MONTE_CARLO_CHUNK = 1000  # Losowań na jedno zadanie procesu roboczego
+
+
+# --- Walk-forward ----------------------------------------------------------------
+
+def walk_forward_windows(df, train_days=WALK_FORWARD_TRAIN_DAYS, test_days=WALK_FORWARD_TEST_DAYS):
+    # Okna (początek treningu, początek testu, koniec testu) w ms, przesuwane o długość testu
+    timestamps = df['timestamp'].to_numpy(dtype='datetime64[ms]').astype(np.int64)
+    first, last = int(timestamps[0]), int(timestamps[-1])
+    windows = []
+    start = first
+    while start + (train_days + test_days) * DAY_MS <= last + DAY_MS:
+        windows.append((start, start + train_days * DAY_MS, start + (train_days + test_days) * DAY_MS))
+        start += test_days * DAY_MS
+    return windows
+
+
+def _init_worker(data_dir, windows):
+    optimize._init_worker(data_dir)
+    optimize._worker['windows'] = windows
+
+
+def _evaluate_windows(combo):
+    # Wskaźniki liczone raz na całej historii (cache procesu), a każde okno to tylko
+    # wycinek tablic przepuszczony przez pętlę ścieżkową - bez ponownego liczenia
+    w = optimize._worker
+    params = strategy.default_params(**combo)
+    df, buy, sell = backtest.prepare(w['df'], w['df_daily'], params, w['cache'])
+    timestamps = df['timestamp'].to_numpy(dtype='datetime64[ms]').astype(np.int64)
+    results = []
+    for bounds in w['windows']:
+        a, b, c = np.searchsorted(timestamps, bounds)
+        stats = []
+        for lo, hi in ((a, b), (b, c)):
+            window = df.iloc[lo:hi].reset_index(drop=True)
+            equity, trades = backtest.simulate(window, buy[lo:hi], sell[lo:hi], params, INITIAL_CAPITAL)
+            stats.append(backtest.summarize(equity, trades, INITIAL_CAPITAL))
+        results.append(stats)
+    return combo, results
+
+
+def run_walk_forward(df, df_daily, grid=OPTIMIZATION_PARAMS, train_days=WALK_FORWARD_TRAIN_DAYS, test_days=WALK_FORWARD_TEST_DAYS,
+                     metric=WALK_FORWARD_METRIC, data_dir=OPTIMIZE_DATA_DIR, processes=None):
+    windows = walk_forward_windows(df, train_days, test_days)
+    if not windows:
+        raise ValueError(f"Za krótka historia na okno {train_days}+{test_days} dni.")
+    combos = list(optimize.param_grid(grid))
+    order = {optimize.combo_key(combo): i for i, combo in enumerate(combos)}
+    processes = processes or os.cpu_count()
+    logger.info(f"Walk-forward: {len(windows)} okien x {len(combos)} kombinacji na {processes} procesach.")
+
+    optimize.dump_candles(df, df_daily, data_dir)
+    best = [None] * len(windows) # (wynik treningu, kombinacja, statystyki testu) dla każdego okna
+    chunksize = max(1, len(combos) // (processes * 16))
+    started = time.perf_counter()
+    with multiprocessing.Pool(processes, initializer=_init_worker, initargs=(data_dir, windows)) as pool:
+        for count, (combo, results) in enumerate(pool.imap_unordered(_evaluate_windows, combos, chunksize), start=1):
+            for i, (train, test) in enumerate(results):
+                # Remisy rozstrzyga kolejność siatki, żeby wynik nie zależał od kolejności procesów
+                candidate = (train[metric], -order[optimize.combo_key(combo)], combo, train, test)
+                if best[i] is None or candidate[:2] > best[i][:2]:
+                    best[i] = candidate
+            if count % optimize.RANK_EVERY == 0 or count == len(combos):
+                logger.info(f"  {count}/{len(combos)} kombinacji ({time.perf_counter() - started:.1f}s)")
+
+    rows = []
+    for (train_start, test_start, test_end), (_, _, combo, train, test) in zip(windows, best):
+        rows.append({
+            'train_start': pd.to_datetime(train_start, unit='ms'),
+            'test_start': pd.to_datetime(test_start, unit='ms'),
+            'test_end': pd.to_datetime(test_end, unit='ms'),
+            'params': json.dumps(combo, sort_keys=True),
+            f'train_{metric}': train[metric],
+            'test_return_percent': test['total_return_percent'],
+            'test_max_drawdown_percent': test['max_drawdown_percent'],
+            'test_trades': test['trades'],
+            'test_win_rate_percent': test['win_rate_percent'],
+        })
+    return pd.DataFrame(rows)
+
+
+def summarize_walk_forward(windows_df):
+    test_returns = windows_df['test_return_percent'].to_numpy() / 100
+    return {
+        'windows': len(windows_df),
+        'oos_return_percent': (np.prod(1 + test_returns) - 1) * 100, # Okna testowe złożone jedno po drugim
+        'profitable_windows_percent': float((test_returns > 0).mean() * 100) if len(test_returns) else 0.0,
+        'worst_window_drawdown_percent': float(windows_df['test_max_drawdown_percent'].min()) if len(windows_df) else 0.0,
+        'distinct_params': int(windows_df['params'].nunique()),
+    }
+
+
+# --- Monte Carlo -----------------------------------------------------------------
+
+def trade_returns(trades_df, initial_capital=INITIAL_CAPITAL):
+    # Wynik każdej transakcji jako ułamek kapitału przed jej otwarciem
+    pnl = trades_df['pnl_usdc'].to_numpy(dtype=float)
+    capital_before = initial_capital + np.concatenate(([0.0], np.cumsum(pnl)[:-1]))
+    return pnl / capital_before
+
+
+def _resample(task):
+    returns, runs, seed = task
+    rng = np.random.default_rng(seed)
+    samples = rng.choice(returns, size=(runs, len(returns)), replace=True)
+    equity = np.cumprod(1 + samples, axis=1)
+    equity = np.concatenate((np.ones((runs, 1)), equity), axis=1)
+    drawdown = (equity / np.maximum.accumulate(equity, axis=1) - 1).min(axis=1)
+    return (equity[:, -1] - 1) * 100, drawdown * 100
+
+
+def monte_carlo(returns, runs=MONTE_CARLO_RUNS, processes=None, seed=None):
+    # Losowanie kolejności i składu transakcji ze zwracaniem; zwraca DataFrame z
+    # końcowym zwrotem i maksymalnym obsunięciem każdej symulowanej ścieżki
+    returns = np.asarray(returns, dtype=float)
+    if not len(returns):
+        raise ValueError("Brak transakcji do losowania.")
+    chunks = [min(MONTE_CARLO_CHUNK, runs - start) for start in range(0, runs, MONTE_CARLO_CHUNK)]
+    seeds = np.random.SeedSequence(seed).spawn(len(chunks))
+    tasks = [(returns, size, s) for size, s in zip(chunks, seeds)]
+    processes = min(processes or os.cpu_count(), len(tasks))
+    if processes > 1:
+        with multiprocessing.Pool(processes) as pool:
+            results = pool.map(_resample, tasks)
+    else:
+        results = [_resample(task) for task in tasks]
+    return pd.DataFrame({
+        'return_percent': np.concatenate([r[0] for r in results]),
+        'max_drawdown_percent': np.concatenate([r[1] for r in results]),
+    })
+
+
+def summarize_monte_carlo(runs_df, percentiles=(5, 25, 50, 75, 95)):
+    summary = {'runs': len(runs_df), 'loss_probability_percent': float((runs_df['return_percent'] < 0).mean() * 100)}
+    for column in ('return_percent', 'max_drawdown_percent'):
+        for q, value in zip(percentiles, np.percentile(runs_df[column], percentiles)):
+            summary[f'{column}_p{q}'] = float(value)
+    return summary
+
+
+def main_walk_forward():
+    client = Client()  # Publiczne dane rynkowe nie wymagają kluczy API
+    df, df_daily = backtest.load_history(client, regime_period=max(OPTIMIZATION_PARAMS['REGIME_FILTER_PERIOD']))
+    windows_df = run_walk_forward(df, df_daily)
+    windows_df.to_csv(WALK_FORWARD_FILE, index=False)
+    stats = summarize_walk_forward(windows_df)
+    logger.info(f"Walk-forward {SYMBOL} {INTERVAL}: {stats['windows']} okien, zwrot poza próbą {stats['oos_return_percent']:+.2f}%, "
+                f"zyskownych okien {stats['profitable_windows_percent']:.0f}%, najgorsze DD {stats['worst_window_drawdown_percent']:.2f}%, "
+                f"różnych zestawów parametrów: {stats['distinct_params']}")
+    logger.info(f"Zapisano okna do {WALK_FORWARD_FILE}.")
+    return windows_df
+
+
+def main_monte_carlo():
+    client = Client()
+    df, df_daily = backtest.load_history(client)
+    result = backtest.run_backtest(df, df_daily)
+    started = time.perf_counter()
+    runs_df = monte_carlo(trade_returns(result['trades']))
+    elapsed = time.perf_counter() - started
+    runs_df.to_csv(MONTE_CARLO_FILE, index=False)
+    stats = summarize_monte_carlo(runs_df)
+    logger.info(f"Monte Carlo {SYMBOL} {INTERVAL}: {stats['runs']} losowań z {len(result['trades'])} transakcji w {elapsed:.1f}s")
+    logger.info(f"  Zwrot p5/p50/p95: {stats['return_percent_p5']:+.2f}% / {stats['return_percent_p50']:+.2f}% / {stats['return_percent_p95']:+.2f}%")
+    logger.info(f"  Max DD p5/p50/p95: {stats['max_drawdown_percent_p5']:.2f}% / {stats['max_drawdown_percent_p50']:.2f}% / {stats['max_drawdown_percent_p95']:.2f}%")
+    logger.info(f"  Prawdopodobieństwo straty: {stats['loss_probability_percent']:.1f}%. Zapisano losowania do {MONTE_CARLO_FILE}.")
+    return runs_df
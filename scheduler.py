@@ -0,0 +1,117 @@
+import asyncio
+import logging
+import time
+from collections import deque
+
+from binance.helpers import interval_to_milliseconds
+
+import metrics
+
+logger = logging.getLogger("binance_bot")
+
+CLOCK_SYNC_SECONDS = 600  # Co ile odświeżać przesunięcie zegara względem serwera
+LAG_HISTORY = 1000        # Ile ostatnich opóźnień wybudzenia pamiętać na zadanie
+# Świece tygodniowe Binance otwierają się w poniedziałek, a epoka Unix to czwartek
+WEEK_ALIGN_MS = 4 * 24 * 60 * 60 * 1000
+
+
+class ServerClock:
+    # Czas serwera Binance = czas lokalny + przesunięcie zmierzone przez get_server_time
+    # (czas serwera porównany ze środkiem przedziału zapytania, żeby odjąć połowę RTT)
+    def __init__(self, client=None):
+        self.client = client
+        self.offset_ms = 0.0
+        self.synced_at = None
+
+    def now_ms(self):
+        return time.time() * 1000 + self.offset_ms
+
+    def sync(self):
+        if self.client is None:
+            return
+        sent = time.time() * 1000
+        server = self.client.get_server_time()['serverTime']
+        received = time.time() * 1000
+        self.offset_ms = server - (sent + received) / 2
+        self.synced_at = received
+        logger.info(f"Przesunięcie zegara względem serwera Binance: {self.offset_ms:+.0f} ms (RTT {received - sent:.0f} ms)")
+
+    @property
+    def stale(self):
+        return self.client is not None and (self.synced_at is None or time.time() * 1000 - self.synced_at > CLOCK_SYNC_SECONDS * 1000)
+
+
+class _Job:
+    def __init__(self, interval, callback):
+        self.interval = interval
+        self.interval_ms = interval_to_milliseconds(interval)
+        if not self.interval_ms:
+            raise ValueError(f"Nieobsługiwany interwał harmonogramu: {interval}")
+        self.align_ms = WEEK_ALIGN_MS if interval.endswith('w') else 0
+        self.callback = callback
+        self.last_close = None
+        self.lags_ms = deque(maxlen=LAG_HISTORY)
+
+    def closed_at(self, now_ms):
+        # Czas zamknięcia ostatniej świecy zamkniętej najpóźniej w now_ms
+        return (now_ms - self.align_ms) // self.interval_ms * self.interval_ms + self.align_ms
+
+    def next_close(self, now_ms):
+        return self.closed_at(now_ms) + self.interval_ms
+
+
+class CandleScheduler:
+    # Wspólny harmonogram dla wielu instancji: budzi się na najbliższe zamknięcie świecy
+    # (liczone z czasu serwera Binance) i uruchamia razem wszystkie instancje, których
+    # świeca właśnie się zamknęła - ich zapytania do API idą równolegle przez wspólną
+    # sesję HTTP. Każda świeca jest przekazywana do callbacku dokładnie raz; opóźnienie
+    # wybudzenia względem zamknięcia jest zapisywane w _Job.lags_ms.
+    def __init__(self, clock=None):
+        self.clock = clock or ServerClock()
+        self.jobs = []
+
+    def add(self, interval, callback):
+        # callback(close_ms) - korutyna wywoływana po zamknięciu świecy
+        self.jobs.append(_Job(interval, callback))
+
+    async def _sync_clock(self):
+        try:
+            await asyncio.to_thread(self.clock.sync)
+        except Exception as e:
+            logger.warning(f"Nie udało się zsynchronizować zegara z serwerem: {e}")
+
+    def _due_jobs(self, now_ms):
+        due = []
+        for job in self.jobs:
+            close = job.closed_at(now_ms)
+            if close <= job.last_close:
+                continue # Ta świeca została już obsłużona (np. zegar cofnięty po synchronizacji)
+            skipped = (close - job.last_close) // job.interval_ms - 1
+            if skipped > 0:
+                logger.warning(f"Pominięto {skipped:.0f} świec {job.interval} (wybudzenie po przerwie).")
+            job.last_close = close
+            lag = now_ms - close
+            job.lags_ms.append(lag)
+            metrics.WAKE_LAG_SECONDS.observe(lag / 1000, interval=job.interval)
+            logger.info(f"Zamknięcie świecy {job.interval}: wybudzenie {lag:.0f} ms po zamknięciu.")
+            due.append((job, int(close)))
+        return due
+
+    async def run(self):
+        await self._sync_clock()
+        now = self.clock.now_ms()
+        for job in self.jobs:
+            job.last_close = job.closed_at(now) # Świecy zamkniętej przed startem nie oceniamy
+        while True:
+            if self.clock.stale:
+                await self._sync_clock()
+            now = self.clock.now_ms()
+            wake = min(job.next_close(now) for job in self.jobs)
+            await asyncio.sleep(max(0, wake - self.clock.now_ms()) / 1000)
+            due = self._due_jobs(self.clock.now_ms())
+            if not due:
+                continue # Wybudzenie przed czasem - dośpij do zamknięcia
+            results = await asyncio.gather(*(job.callback(close) for job, close in due), return_exceptions=True)
+            for result in results:
+                if isinstance(result, Exception):
+                    logger.error(f"Błąd obsługi zamknięcia świecy: {result}")
@@ -0,0 +1,164 @@
+import json
+import logging
+import os
+import threading
+import zlib
+
+from config import STATE_COMPACT_EVENTS
+
+logger = logging.getLogger("binance_bot")
+
+# Stan pozycji zapisywany jako migawka (state.json, podmieniana atomowo przez os.replace)
+# plus dziennik zdarzeń dopisywanych na końcu (state.json.wal). Odtworzenie stanu to
+# migawka + zdarzenia o numerze większym niż zapisany w migawce, zawsze w tej samej
+# kolejności. Każda linia dziennika ma sumę CRC32, więc urwany ostatni zapis jest
+# rozpoznawany i obcinany zamiast psuć cały stan.
+
+CLOSED = {
+    'in_position': False,
+    'position_side': None,
+    'entry_price': 0,
+    'position_size_usdc': 0,
+    'stop_loss': 0,
+    'exchange_stop': None,
+}
+
+# Zdarzenia bez fsync - tylko flush do systemu operacyjnego (przeżywa awarię procesu,
+# nie zaniku zasilania). Przesunięcia trailing stopu są częste, a po utracie ostatnich
+# z nich pozycję i tak chroni poprzedni poziom i zlecenie stop na giełdzie.
+LAZY_EVENTS = {'stop', 'summary'}
+
+
+def apply_event(state, event, data):
+    if event == 'close':
+        state.update(CLOSED)
+    state.update(data)
+    return state
+
+
+def _encode(record):
+    payload = json.dumps(record, separators=(',', ':'))
+    return f"{zlib.crc32(payload.encode()):08x} {payload}\n"
+
+
+def _decode(line):
+    # Zwraca rekord albo None dla linii urwanej lub uszkodzonej
+    if not line.endswith('\n') or len(line) < 10:
+        return None
+    crc, payload = line[:8], line[9:-1]
+    try:
+        if int(crc, 16) != zlib.crc32(payload.encode()):
+            return None
+        return json.loads(payload)
+    except ValueError:
+        return None
+
+
+def _fsync_dir(path):
+    if os.name == 'posix':
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+class StateJournal:
+    def __init__(self, path, compact_every=STATE_COMPACT_EVENTS):
+        self.path = path
+        self.wal_path = path + '.wal'
+        self.compact_every = compact_every
+        self.state = {}
+        self.seq = 0          # Numer ostatniego zdarzenia
+        self.pending = 0      # Zdarzenia w dzienniku od ostatniej migawki
+        self._wal = None
+        self._lock = threading.Lock()
+
+    def recover(self, default):
+        # Migawka + odtworzenie dziennika. Urwany koniec dziennika jest obcinany, żeby
+        # kolejne zapisy nie trafiły za uszkodzoną linię.
+        with self._lock:
+            state = dict(default)
+            snapshot_seq = 0
+            if os.path.exists(self.path):
+                try:
+                    with open(self.path, 'r') as f:
+                        snapshot = json.load(f)
+                    snapshot_seq = snapshot.pop('journal_seq', 0) # Stary state.json nie ma numeru
+                    state.update(snapshot)
+                except (IOError, json.JSONDecodeError) as e:
+                    logger.error(f"Błąd wczytywania migawki stanu: {e}. Odtwarzam stan z dziennika.")
+            self.seq = snapshot_seq
+
+            replayed = 0
+            valid_bytes = 0
+            if os.path.exists(self.wal_path):
+                with open(self.wal_path, 'r', newline='') as f:
+                    for line in f:
+                        record = _decode(line)
+                        if record is None:
+                            logger.warning(f"Uszkodzony wpis w dzienniku stanu {self.wal_path} - pomijam go i wszystkie dalsze.")
+                            break
+                        valid_bytes += len(line.encode())
+                        if record['seq'] <= snapshot_seq:
+                            continue # Zdarzenie już zawarte w migawce (awaria w trakcie kompakcji)
+                        apply_event(state, record['event'], record['data'])
+                        self.seq = record['seq']
+                        replayed += 1
+                if os.path.getsize(self.wal_path) != valid_bytes:
+                    with open(self.wal_path, 'r+b') as f:
+                        f.truncate(valid_bytes)
+            self.state = state
+            self.pending = replayed
+            self._wal = open(self.wal_path, 'a')
+            if replayed:
+                logger.info(f"Odtworzono {replayed} zdarzeń z dziennika stanu.")
+            return dict(state)
+
+    def _check_open(self):
+        # Bez udanego recover() stan w pamięci nie jest pełny - zapis nadpisałby migawkę
+        if self._wal is None:
+            raise OSError(f"Dziennik stanu {self.wal_path} nie jest otwarty (brak udanego odtworzenia stanu).")
+
+    def append(self, event, **data):
+        # Dopisuje zdarzenie (open, stop, exchange_stop, close, summary); po zamknięciu
+        # pozycji albo co compact_every zdarzeń dziennik jest kompaktowany do migawki
+        with self._lock:
+            self._check_open()
+            self.seq += 1
+            apply_event(self.state, event, data)
+            self._wal.write(_encode({'seq': self.seq, 'event': event, 'data': data}))
+            self._wal.flush()
+            if event not in LAZY_EVENTS:
+                os.fsync(self._wal.fileno())
+            self.pending += 1
+            if event == 'close' or self.pending >= self.compact_every:
+                self._compact()
+
+    def snapshot(self, state=None):
+        with self._lock:
+            self._check_open()
+            if state is not None:
+                self.state = dict(state)
+            self._compact()
+
+    def _compact(self):
+        # Najpierw atomowa migawka, potem obcięcie dziennika. Awaria pomiędzy nimi
+        # zostawia zdarzenia o numerach <= journal_seq, które odtwarzanie pomija.
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({**self.state, 'journal_seq': self.seq}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        _fsync_dir(self.path)
+        self._wal.truncate(0)
+        self._wal.seek(0)
+        os.fsync(self._wal.fileno())
+        self.pending = 0
+
+    def close(self):
+        with self._lock:
+            if self._wal:
+                self._wal.close()
+                self._wal = None
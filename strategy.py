@@ -0,0 +1,153 @@
+import numpy as np
+import pandas as pd
+import pandas_ta as ta
+
+import config
+import timeframes
+
+# Wspólna logika strategii: ten sam kod liczy wskaźniki, sygnały, stop lossy i PnL
+# zarówno dla bota na żywo (bot.py), jak i dla backtestu (backtest.py).
+
+# Parametry strategii, które mogą być nadpisane per instancja / kombinację optymalizacji
+PARAM_NAMES = [
+    'EMA_SHORT', 'EMA_LONG',
+    'RSI_PERIOD', 'RSI_BUY_LEVEL', 'RSI_SELL_LEVEL',
+    'USE_TRAILING_STOP', 'ATR_PERIOD', 'TRAILING_SL_ATR_MULTIPLIER',
+    'USE_DYNAMIC_RISK', 'ADX_PERIOD_FOR_RISK', 'RISK_ADX_THRESHOLD',
+    'RISK_PER_TRADE_HIGH', 'RISK_PER_TRADE_LOW',
+    'USE_MARKET_REGIME_FILTER', 'REGIME_FILTER_PERIOD',
+]
+
+MIN_ORDER_USDC = 10  # Minimalna wartość zlecenia na Binance
+
+
+def default_params(**overrides):
+    params = {name: getattr(config, name) for name in PARAM_NAMES}
+    # Alternatywne poziomy RSI podmieniają poziomy bazowe, jeśli są włączone
+    if config.USE_ALTERNATIVE_RSI:
+        params['RSI_BUY_LEVEL'] = config.RSI_BUY_LEVEL_ALT
+        params['RSI_SELL_LEVEL'] = config.RSI_SELL_LEVEL_ALT
+    params.update(overrides)
+    return params
+
+
+def _cached(cache, key, compute):
+    # Pamięć podręczna serii wskaźników kluczowana (nazwa, okres). Ważna tylko dla
+    # jednego zestawu świec - używana przez optymalizator, gdzie te same okresy
+    # powtarzają się w setkach kombinacji parametrów.
+    if cache is None:
+        return compute()
+    if key not in cache:
+        cache[key] = compute()
+    return cache[key]
+
+
+def calculate_indicators(df, df_daily=None, params=None, cache=None):
+    p = params or default_params()
+    df.set_index('timestamp', inplace=True)
+    df['ema_short'] = _cached(cache, ('ema', p['EMA_SHORT']), lambda: ta.ema(df['close'], length=p['EMA_SHORT']))
+    df['ema_long'] = _cached(cache, ('ema', p['EMA_LONG']), lambda: ta.ema(df['close'], length=p['EMA_LONG']))
+    df['rsi'] = _cached(cache, ('rsi', p['RSI_PERIOD']), lambda: ta.rsi(df['close'], length=p['RSI_PERIOD']))
+    df['atr'] = _cached(cache, ('atr', p['ATR_PERIOD']), lambda: ta.atr(df['high'], df['low'], df['close'], length=p['ATR_PERIOD']))
+
+    if p['USE_DYNAMIC_RISK']:
+        adx_df = _cached(cache, ('adx', p['ADX_PERIOD_FOR_RISK']), lambda: ta.adx(df['high'], df['low'], df['close'], length=p['ADX_PERIOD_FOR_RISK']))
+        if adx_df is not None and not adx_df.empty:
+            df['adx'] = adx_df[f"ADX_{p['ADX_PERIOD_FOR_RISK']}"]
+
+    if p['USE_MARKET_REGIME_FILTER'] and df_daily is not None and not df_daily.empty:
+        df_daily['regime_sma'] = ta.sma(df_daily['close'], length=p['REGIME_FILTER_PERIOD'])
+        join_daily(df, df_daily)
+
+    df.reset_index(inplace=True)
+    df.dropna(inplace=True)
+    return df
+
+
+def join_daily(df, df_daily):
+    # Zamknięcie dnia i SMA reżimu dla każdej świecy (df indeksowany czasem, df_daily datą):
+    # wartości dnia, w którym leży świeca, jak filtr reżimu na żywo; brak dnia w tabeli - NaN
+    aligned = timeframes.align(df.index, df_daily, '1d', ['close', 'regime_sma'], live=True)
+    df['daily_close'] = aligned['close']
+    df['daily_regime_sma'] = aligned['regime_sma']
+    return df
+
+
+def _regime_mask(df, p, bullish):
+    # len(df) dla słownika kolumn to liczba kolumn, więc długość bierzemy z danych
+    n = len(df['close'])
+    if not p['USE_MARKET_REGIME_FILTER']:
+        return np.ones(n, dtype=bool)
+    if 'daily_regime_sma' not in df:
+        return np.zeros(n, dtype=bool)
+    daily_close = np.asarray(df['daily_close'], dtype=float)
+    regime_sma = np.asarray(df['daily_regime_sma'], dtype=float)
+    # Porównania z NaN dają False, więc brak SMA blokuje wejście tak jak w bocie
+    return daily_close >= regime_sma if bullish else daily_close <= regime_sma
+
+
+def buy_signals(df, params=None):
+    # Maska sygnałów KUPNA dla całej tablicy: element i odpowiada sprawdzeniu
+    # _check_buy_signal wykonanemu, gdy wiersz i jest ostatnim wierszem df.
+    # df to DataFrame albo słownik kolumn (np. IndicatorEngine.snapshot())
+    p = params or default_params()
+    ema_short = np.asarray(df['ema_short'], dtype=float)
+    ema_long = np.asarray(df['ema_long'], dtype=float)
+    rsi = np.asarray(df['rsi'], dtype=float)
+    prev_rsi = np.concatenate(([np.nan], rsi[:-1]))
+    level = p['RSI_BUY_LEVEL']
+    trend_ok = ema_short > ema_long
+    rsi_signal = (prev_rsi < level) & (rsi >= level)
+    return trend_ok & rsi_signal & _regime_mask(df, p, bullish=True)
+
+
+def sell_signals(df, params=None):
+    # Maska sygnałów SPRZEDAŻY, odpowiednik _check_sell_signal dla każdego wiersza
+    p = params or default_params()
+    ema_short = np.asarray(df['ema_short'], dtype=float)
+    ema_long = np.asarray(df['ema_long'], dtype=float)
+    rsi = np.asarray(df['rsi'], dtype=float)
+    prev_rsi = np.concatenate(([np.nan], rsi[:-1]))
+    level = p['RSI_SELL_LEVEL']
+    trend_ok = ema_short < ema_long
+    rsi_signal = (prev_rsi > level) & (rsi <= level)
+    return trend_ok & rsi_signal & _regime_mask(df, p, bullish=False)
+
+
+def initial_stop_loss(side, price, atr, params=None):
+    p = params or default_params()
+    offset = atr * p['TRAILING_SL_ATR_MULTIPLIER']
+    return price - offset if side == 'BUY' else price + offset
+
+
+def trail_stop_loss(side, stop_loss, price, atr, params=None):
+    p = params or default_params()
+    if side == 'BUY':
+        return max(stop_loss, price - atr * p['TRAILING_SL_ATR_MULTIPLIER'])
+    return min(stop_loss, price + atr * p['TRAILING_SL_ATR_MULTIPLIER'])
+
+
+def stop_loss_hit(side, stop_loss, price):
+    return (side == 'BUY' and price <= stop_loss) or (side == 'SELL' and price >= stop_loss)
+
+
+def risk_per_trade(adx_value, params=None):
+    p = params or default_params()
+    if p['USE_DYNAMIC_RISK']:
+        return p['RISK_PER_TRADE_HIGH'] if adx_value > p['RISK_ADX_THRESHOLD'] else p['RISK_PER_TRADE_LOW']
+    return p['RISK_PER_TRADE_LOW']
+
+
+def position_size_usdc(balance, entry_price, stop_loss_price, adx_value, params=None):
+    if entry_price == stop_loss_price: return 0
+    risk_amount = balance * risk_per_trade(adx_value, params)
+    sl_distance_percent = abs(entry_price - stop_loss_price) / entry_price
+    return risk_amount / sl_distance_percent
+
+
+def position_pnl(side, entry_price, exit_price, position_size_usdc):
+    # Zwraca (pnl_usdc, pnl_percent) - ta sama matematyka co w _close_position
+    pnl = (exit_price - entry_price) if side == 'BUY' else (entry_price - exit_price)
+    pnl_percent = (pnl / entry_price) * 100
+    pnl_usdc = position_size_usdc * (pnl_percent / 100)
+    return pnl_usdc, pnl_percent
@@ -0,0 +1,168 @@
+import asyncio
+import json
+
+import websockets
+
+import account_stream
+from account_stream import AccountCache, UserDataStream
+from exchange_stop import ExchangeStop
+
+
+def execution_report(order_id, status, time, executed='0.00000000', side='SELL'):
+    # Zdarzenie executionReport w układzie strumienia użytkownika Binance
+    return {'e': 'executionReport', 'E': time, 's': 'BTCUSDC', 'c': f'client{order_id}', 'S': side, 'o': 'STOP_LOSS_LIMIT',
+            'q': '0.10000000', 'p': '94.50000000', 'P': '95.00000000', 'X': status, 'i': order_id, 'z': executed,
+            'Z': f"{float(executed) * 94.5:.8f}", 'T': time}
+
+
+def account_position(time, **balances):
+    return {'e': 'outboundAccountPosition', 'E': time, 'u': time,
+            'B': [{'a': asset, 'f': f"{free:.8f}", 'l': f"{locked:.8f}"} for asset, (free, locked) in balances.items()]}
+
+
+def account(time, **balances):
+    return {'updateTime': time, 'balances': [{'asset': asset, 'free': f"{free:.8f}", 'locked': f"{locked:.8f}"}
+                                             for asset, (free, locked) in balances.items()]}
+
+
+def rest_order(order_id, status):
+    return {'symbol': 'BTCUSDC', 'orderId': order_id, 'clientOrderId': f'client{order_id}', 'side': 'SELL',
+            'type': 'STOP_LOSS_LIMIT', 'status': status, 'origQty': '0.10000000', 'executedQty': '0.00000000',
+            'cummulativeQuoteQty': '0.00000000', 'stopPrice': '95.00000000', 'price': '94.50000000', 'updateTime': 1000,
+            'timeInForce': 'GTC'}
+
+
+def test_execution_report_moves_order_from_open_to_finished():
+    cache = AccountCache()
+    updates = []
+    cache.listeners.append(updates.append)
+    cache.apply(execution_report(7, 'NEW', 1000))
+    assert cache.open_orders[7]['status'] == 'NEW' and cache.order(7)['origQty'] == '0.10000000'
+    cache.apply(execution_report(7, 'FILLED', 2000, executed='0.10000000'))
+    assert 7 not in cache.open_orders
+    assert cache.order(7)['status'] == 'FILLED' and cache.order(7)['executedQty'] == '0.10000000'
+    cache.apply(execution_report(7, 'NEW', 1500)) # Spóźnione, starsze zdarzenie
+    assert cache.order(7)['status'] == 'FILLED'
+    assert [order['status'] for order in updates] == ['NEW', 'FILLED']
+
+
+def test_account_position_updates_balances_newer_than_snapshot():
+    cache = AccountCache()
+    cache.load(account(5000, USDC=(1000.0, 0.0), BTC=(0.0, 0.0)), [])
+    cache.apply(account_position(4000, USDC=(1.0, 0.0))) # Starsze niż migawka REST
+    assert cache.free('USDC') == 1000.0
+    cache.apply(account_position(6000, USDC=(500.0, 0.0), BTC=(0.0, 0.1)))
+    assert cache.free('USDC') == 500.0 and cache.free('BTC') == 0.0 and cache.total('BTC') == 0.1
+    cache.apply({'e': 'balanceUpdate', 'a': 'USDC', 'd': '25.00000000', 'T': 7000})
+    assert cache.free('USDC') == 525.0
+
+
+def test_snapshot_does_not_override_newer_stream_state():
+    cache = AccountCache()
+    cache.set_live(True)
+    cache.apply(account_position(6000, USDC=(500.0, 0.0)))
+    cache.apply(execution_report(7, 'FILLED', 6000, executed='0.10000000'))
+    # Migawka REST sprzed zdarzeń: starsze saldo i zlecenie jeszcze otwarte
+    assert cache.load(account(5000, USDC=(1000.0, 0.0)), [rest_order(7, 'NEW')]) == []
+    assert cache.free('USDC') == 500.0 and 7 not in cache.open_orders
+    # Nowsza migawka wygrywa i zgłasza rozjazd sald
+    assert cache.load(account(8000, USDC=(400.0, 0.0)), []) == ['USDC']
+    assert cache.free('USDC') == 400.0
+
+
+def test_exchange_stop_reads_fill_from_cache_only_while_live():
+    class Client:
+        def __init__(self):
+            self.get_order_calls = 0
+
+        def get_order(self, symbol, orderId):
+            self.get_order_calls += 1
+            return rest_order(orderId, 'NEW')
+
+    client, cache = Client(), AccountCache()
+    stop = ExchangeStop(client, 'BTCUSDC', account=cache)
+    stop.order_id = 7
+    cache.apply(execution_report(7, 'FILLED', 2000, executed='0.10000000'))
+    assert not stop.filled() # Strumień nie działa - status z REST
+    assert client.get_order_calls == 1
+    cache.set_live(True)
+    assert stop.filled()
+    assert client.get_order_calls == 1
+
+
+class StreamClient:
+    # REST dla strumienia konta: listenKey i migawki konta podmieniane przez test
+    def __init__(self):
+        self.account = account(1000, USDC=(1000.0, 0.0), BTC=(0.1, 0.0))
+        self.open_orders = [rest_order(7, 'NEW')]
+        self.reconciles = 0
+        self.listen_keys = 0
+
+    def stream_get_listen_key(self):
+        self.listen_keys += 1
+        return f'key{self.listen_keys}'
+
+    def stream_keepalive(self, listen_key):
+        pass
+
+    def get_account(self):
+        self.reconciles += 1
+        return self.account
+
+    def get_open_orders(self):
+        return self.open_orders
+
+
+async def wait_for(condition, timeout=5):
+    async def poll():
+        while not condition():
+            await asyncio.sleep(0.01)
+    await asyncio.wait_for(poll(), timeout)
+
+
+def test_reconciles_with_rest_after_reconnect(monkeypatch):
+    monkeypatch.setattr(account_stream, 'RECONNECT_DELAY_MIN', 0.05)
+    client = StreamClient()
+    paths = []
+    live = [] # (flaga live, liczba uzgodnień z REST) przy każdej zmianie flagi
+
+    async def main():
+        dropped = asyncio.Event()
+
+        async def handler(connection):
+            paths.append(connection.request.path)
+            if len(paths) == 1:
+                await connection.send(json.dumps(account_position(2000, USDC=(990.0, 0.0), BTC=(0.0, 0.1))))
+                await wait_for(lambda: cache.free('USDC') == 990.0)
+                await connection.close() # Zerwane połączenie
+                dropped.set()
+            else:
+                await connection.wait_closed()
+
+        server = await websockets.serve(handler, '127.0.0.1', 0)
+        stream = UserDataStream(client, url=f"ws://127.0.0.1:{server.sockets[0].getsockname()[1]}/ws")
+        cache = stream.cache
+        set_live = cache.set_live
+
+        def record(value):
+            live.append((value, client.reconciles))
+            set_live(value)
+        cache.set_live = record
+        task = asyncio.create_task(stream.run())
+        await dropped.wait()
+        # W czasie przerwy giełda wykonała stop - strumień tego nie zobaczył
+        client.account = account(3000, USDC=(1009.0, 0.0), BTC=(0.0, 0.0))
+        client.open_orders = []
+        await wait_for(lambda: len(live) == 3)
+        snapshot = (dict(cache.balances), dict(cache.open_orders))
+        stream.stop()
+        await asyncio.wait_for(task, 5)
+        server.close()
+        await server.wait_closed()
+        return snapshot
+
+    balances, open_orders = asyncio.run(main())
+    assert paths == ['/ws/key1', '/ws/key2']
+    # Flaga live dopiero po uzgodnieniu z REST, zdjęta na czas przerwy i po zatrzymaniu
+    assert live == [(True, 1), (False, 1), (True, 2), (False, 2)]
+    assert balances == {'USDC': [1009.0, 0.0], 'BTC': [0.0, 0.0]} and open_orders == {}
@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+INTERVAL_MS = 15 * 60 * 1000
+
+
+@pytest.fixture
+def fixture_candles():
+    # Losowe błądzenie 15m - wystarczająco długie, by zawierało przecięcia RSI
+    rng = np.random.default_rng(7)
+    n = 600
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.004, n)))
+    open_ = np.concatenate(([close[0]], close[:-1]))
+    high = np.maximum(open_, close) * 1.001
+    low = np.minimum(open_, close) * 0.999
+    timestamps = np.arange(n, dtype=np.int64) * INTERVAL_MS + 1_700_000_100_000 // INTERVAL_MS * INTERVAL_MS
+    return pd.DataFrame({'timestamp': pd.to_datetime(timestamps, unit='ms'), 'open': open_, 'high': high,
+                         'low': low, 'close': close, 'volume': 1.0})
+
+
+@pytest.fixture
+def trading_bot(tmp_path, monkeypatch):
+    pytest.importorskip('pandas_ta')
+    monkeypatch.chdir(tmp_path) # Log, stan i magazyn świec bota w katalogu tymczasowym
+    import strategy
+    import tick_sim
+    from bot import BinanceTradingBot
+
+    ex = tick_sim.FakeExchange('BTCUSDC', {'USDC': 1000.0})
+    # Niskie ryzyko na transakcję, by wielkość pozycji mieściła się w saldzie
+    params = strategy.default_params(USE_MARKET_REGIME_FILTER=False, RISK_PER_TRADE_HIGH=0.01, RISK_PER_TRADE_LOW=0.01)
+    bot = BinanceTradingBot('BTCUSDC', '15m', params, ex, tick_sim._Messages(),
+                            state_file=str(tmp_path / 'state.json'), daily_summary=False)
+    bot.candles.clock = bot.daily_candles.clock = lambda: ex.now_ms
+    return bot, ex
+
+
+def _first_buy(df, params):
+    import strategy
+    # Pierwszy sygnał backtestu (calculate_indicators odrzuca wiersze rozgrzewki z NaN)
+    frame = strategy.calculate_indicators(df.copy(), params=params)
+    expected = strategy.buy_signals(frame, params)
+    assert expected.any()
+    first = frame['timestamp'].iloc[int(np.argmax(expected))]
+    return int(np.flatnonzero(df['timestamp'] == first)[0])
+
+
+def _klines(df):
+    timestamps = df['timestamp'].to_numpy(dtype='datetime64[ms]').astype(np.int64)
+    return [[int(t), o, h, l, c, 1.0] for t, o, h, l, c in
+            zip(timestamps, df['open'], df['high'], df['low'], df['close'])]
+
+
+def test_closed_candle_rsi_cross_opens_position(trading_bot, fixture_candles):
+    import strategy
+    bot, ex = trading_bot
+    signal = _first_buy(fixture_candles, bot.params)
+    engine = bot.indicators
+    for i, row in enumerate(_klines(fixture_candles)[:signal + 1]):
+        engine.update(row[0], row[2], row[3], row[4])
+        if i == signal - 1:
+            bot._evaluate_signals(engine.closed())
+            assert not bot.in_position
+    ex.last_price = ex.bid = ex.ask = engine.last_close
+
+    # Świeca w trakcie tuż po otwarciu powtarza wskaźniki zamkniętej - na niej przecięcia nie ma
+    price = engine.last_close
+    assert not strategy.buy_signals(engine.snapshot(price, price, price), bot.params)[-1]
+
+    bot._evaluate_signals(engine.closed())
+    assert bot.in_position and bot.position_side == 'BUY'
+
+
+def test_check_signals_plans_entry_on_candle_that_just_closed(trading_bot, fixture_candles):
+    bot, ex = trading_bot
+    signal = _first_buy(fixture_candles, bot.params)
+    klines = _klines(fixture_candles)
+    ex.add_klines('15m', klines[:signal + 1])
+    ex.open_klines['15m'] = klines[signal + 1][:1] + [klines[signal][4]] * 4 + [0.0]
+    ex.now_ms = klines[signal + 1][0]
+    plan = bot._check_signals()
+    assert plan is not None and plan['side'] == 'BUY'
+    assert bot.indicators.last_timestamp == klines[signal][0]
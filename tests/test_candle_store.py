@@ -0,0 +1,98 @@
+import os
+
+import numpy as np
+import pytest
+
+import candle_store
+from candle_store import CandleStore
+
+MINUTE = 60 * 1000
+START = 1_700_000_040_000 # Pełna minuta
+
+
+def kline(i):
+    # Świeca i w formacie odpowiedzi get_klines Binance
+    t = START + i * MINUTE
+    return [t, f"{100 + i:.8f}", f"{101 + i:.8f}", f"{99 + i:.8f}", f"{100.5 + i:.8f}", '1.00000000', t + MINUTE - 1,
+            '100.0', 10, '0.5', '50.0', '0']
+
+
+class FakeClient:
+    # Giełda z count zamkniętymi świecami 1m i świecą w trakcie; zapisuje parametry zapytań
+    def __init__(self, count):
+        self.count = count
+        self.calls = []
+
+    def get_klines(self, symbol, interval, startTime=None, limit=500):
+        self.calls.append((startTime, limit))
+        first = 0 if startTime is None else max(0, -(-(startTime - START) // MINUTE))
+        return [kline(i) for i in range(first, min(first + limit, self.count + 1))]
+
+
+@pytest.fixture
+def clock():
+    return lambda: START + 10 * MINUTE + 5000 # W trakcie świecy 10
+
+
+@pytest.fixture
+def store(tmp_path, clock):
+    store = CandleStore(str(tmp_path), 'BTCUSDC', '1m')
+    store.clock = clock
+    return store
+
+
+def test_append_rejects_gap_and_skips_known_rows(store):
+    assert store.append([kline(i) for i in range(5)])
+    assert not store.append([kline(7), kline(8)]) # Luka 5-6
+    assert len(store) == 5
+    assert store.append([kline(i) for i in range(3, 8)]) # Zachodzi na magazyn - tylko nowe
+    assert store.column('timestamp').tolist() == [START + i * MINUTE for i in range(8)]
+    assert store.append([kline(9)], allow_gap=True)
+    assert store.last_timestamp == START + 9 * MINUTE
+
+
+def test_append_keeps_only_closed_candles(store):
+    assert store.append([kline(i) for i in range(8, 11)]) # Świeca 10 jeszcze trwa
+    assert len(store) == 2 and store.last_timestamp == START + 9 * MINUTE
+    assert not store.stale
+
+
+def test_repair_truncates_partially_written_row(tmp_path, store):
+    store.append([kline(i) for i in range(5)])
+    expected = store.to_df()
+    # Przerwany zapis: część kolumn ma już kolejny wiersz, jedna tylko jego połowę
+    with open(os.path.join(store.path, 'timestamp.bin'), 'ab') as f:
+        f.write(np.int64(START + 5 * MINUTE).tobytes())
+    with open(os.path.join(store.path, 'close.bin'), 'ab') as f:
+        f.write(b'\x00' * 3)
+
+    reopened = CandleStore(str(tmp_path), 'BTCUSDC', '1m')
+    assert len(reopened) == 5
+    for column, dtype in candle_store.COLUMNS.items():
+        assert os.path.getsize(os.path.join(store.path, f'{column}.bin')) == 5 * np.dtype(dtype).itemsize
+    assert reopened.to_df().equals(expected)
+
+
+def test_sync_pages_missing_candles_over_rest(store, monkeypatch):
+    monkeypatch.setattr(candle_store, 'MAX_KLINES_PER_REQUEST', 3)
+    client = FakeClient(10)
+    store.append([kline(0), kline(1)])
+    # Odpowiedź z ostatnimi świecami nie zachodzi na magazyn - brakujące z REST, stronami
+    store.sync(client, [kline(i) for i in range(8, 11)])
+    assert store.column('timestamp').tolist() == [START + i * MINUTE for i in range(10)]
+    assert client.calls == [(START + i * MINUTE, 3) for i in (2, 5, 8, 11)]
+
+
+def test_sync_without_new_closed_candle_does_not_call_rest(store):
+    client = FakeClient(10)
+    store.append([kline(i) for i in range(10)])
+    store.sync(client, [kline(i) for i in range(8, 11)])
+    store.sync(client)
+    assert client.calls == [] and len(store) == 10
+
+
+def test_sync_empty_store_downloads_from_start(store):
+    client = FakeClient(10)
+    store.sync(client, start_ms=START + 4 * MINUTE)
+    assert store.first_timestamp == START + 4 * MINUTE and store.last_timestamp == START + 9 * MINUTE
+    assert client.calls == [(START + 4 * MINUTE, candle_store.MAX_KLINES_PER_REQUEST)]
@@ -0,0 +1,292 @@
+import json
+import threading
+
+import pytest
+from binance.exceptions import BinanceAPIException
+
+import exchange_stop
+from exchange_stop import ExchangeStop
+
+
+def api_error(code, message):
+    return BinanceAPIException(None, 400, json.dumps({'code': code, 'msg': message}))
+
+
+class MockExchange:
+    # Minimalna giełda dla ExchangeStop: zlecenia w słowniku, status ustawia test
+    def __init__(self):
+        self.orders = {}
+        self.calls = []
+        self.fail_cancel = False
+
+    def get_symbol_info(self, symbol):
+        return {'symbol': symbol, 'filters': [
+            {'filterType': 'PRICE_FILTER', 'tickSize': '0.01000000'},
+            {'filterType': 'LOT_SIZE', 'stepSize': '0.00100000'},
+        ]}
+
+    def _new(self, **params):
+        order = dict(params, orderId=len(self.orders) + 1, status='NEW', origQty=params['quantity'], executedQty='0.00000000',
+                     cummulativeQuoteQty='0.00000000')
+        self.orders[order['orderId']] = order
+        return dict(order)
+
+    def create_order(self, **params):
+        self.calls.append(('create_order', params))
+        return self._new(**params)
+
+    def cancel_replace_order(self, cancelReplaceMode, cancelOrderId, **params):
+        self.calls.append(('cancel_replace_order', dict(params, cancelOrderId=cancelOrderId)))
+        if self.fail_cancel or self.orders[cancelOrderId]['status'] != 'NEW':
+            raise api_error(-2022, 'Order cancel-replace failed.')
+        self.orders[cancelOrderId]['status'] = 'CANCELED'
+        return {'cancelResult': 'SUCCESS', 'newOrderResult': 'SUCCESS', 'newOrderResponse': self._new(**params)}
+
+    def cancel_order(self, symbol, orderId):
+        self.calls.append(('cancel_order', {'orderId': orderId}))
+        order = self.orders[orderId]
+        if order['status'] != 'NEW':
+            raise api_error(-2011, 'Unknown order sent.')
+        order['status'] = 'CANCELED'
+        return dict(order)
+
+    def get_order(self, symbol, orderId):
+        self.calls.append(('get_order', {'orderId': orderId}))
+        return dict(self.orders[orderId])
+
+    def fill(self, order_id, price):
+        order = self.orders[order_id]
+        order.update(status='FILLED', executedQty=order['origQty'],
+                     cummulativeQuoteQty=f"{float(order['origQty']) * price:.8f}")
+
+    def names(self):
+        return [name for name, _ in self.calls]
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture(autouse=True)
+def clear_filters():
+    exchange_stop._filters.clear()
+    yield
+    exchange_stop._filters.clear()
+
+
+@pytest.fixture
+def exchange():
+    return MockExchange()
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def stop(exchange, clock):
+    stop = ExchangeStop(exchange, 'BTCUSDC', offset_percent=0.5, replace_seconds=5, clock=clock)
+    stop.place('SELL', 0.1234, 95.004)
+    exchange.calls.clear()
+    return stop
+
+
+def test_place_rounds_to_symbol_filters(exchange, clock):
+    stop = ExchangeStop(exchange, 'BTCUSDC', offset_percent=0.5, replace_seconds=5, clock=clock)
+    stop.place('SELL', 0.1234, 95.004)
+    _, params = exchange.calls[0]
+    assert params == {'symbol': 'BTCUSDC', 'side': 'SELL', 'type': 'STOP_LOSS_LIMIT', 'timeInForce': 'GTC',
+                      'quantity': '0.123', 'stopPrice': '95.00', 'price': '94.52'}
+    assert stop.state() == {'order_id': 1, 'side': 'SELL', 'quantity': 0.1234, 'stop_price': 95.0}
+    assert stop.last_replace == clock.now
+
+
+def test_place_failure_leaves_stop_inactive(exchange, clock):
+    def reject(**params):
+        raise api_error(-2010, 'Stop price would trigger immediately.')
+    exchange.create_order = reject
+    stop = ExchangeStop(exchange, 'BTCUSDC', clock=clock)
+    with pytest.raises(BinanceAPIException):
+        stop.place('SELL', 0.1, 95)
+    assert not stop.active and stop.state() is None
+
+
+def test_requests_are_coalesced_into_one_replace(exchange, clock, stop):
+    stop.request(96)
+    assert stop.flush() is None # Za wcześnie po złożeniu
+    clock.now += 2
+    stop.request(97)
+    assert stop.flush() is None
+    clock.now += 3
+    stop.request(98)
+    assert stop.flush() == 'replaced'
+    assert exchange.names() == ['cancel_replace_order']
+    _, params = exchange.calls[0]
+    assert params['cancelOrderId'] == 1 and params['stopPrice'] == '98.00'
+    assert stop.order_id == 2 and stop.stop_price == 98.0 and stop.pending is None
+
+
+def test_force_flush_ignores_replace_interval(exchange, clock, stop):
+    stop.request(96)
+    assert stop.flush(force=True) == 'replaced'
+    assert stop.stop_price == 96.0
+
+
+def test_unchanged_level_after_rounding_is_not_sent(exchange, clock, stop):
+    clock.now += 10
+    stop.request(95.001)
+    assert stop.flush() is None
+    assert exchange.calls == [] and stop.pending is None
+
+
+def test_flush_without_request_or_order_sends_nothing(exchange, clock, stop):
+    clock.now += 10
+    assert stop.flush() is None
+    stop.forget()
+    stop.request(99)
+    assert stop.flush(force=True) is None
+    assert exchange.calls == []
+
+
+def test_failed_replace_of_filled_stop_is_reported_gone(exchange, clock, stop):
+    exchange.fill(1, 95.0)
+    stop.request(97)
+    assert stop.flush(force=True) == 'gone'
+    assert exchange.names() == ['cancel_replace_order', 'get_order']
+
+
+def test_failed_replace_of_open_stop_keeps_order(exchange, clock, stop):
+    exchange.fail_cancel = True
+    stop.request(97)
+    assert stop.flush(force=True) is None
+    assert stop.order_id == 1 and stop.stop_price == 95.0
+
+
+def test_fill_detection_prefers_live_account_cache(exchange, clock):
+    class Account:
+        live = True
+        orders = {}
+
+        def order(self, order_id):
+            return self.orders.get(order_id)
+
+    account = Account()
+    stop = ExchangeStop(exchange, 'BTCUSDC', clock=clock, account=account)
+    stop.place('SELL', 0.1, 95)
+    exchange.calls.clear()
+    account.orders[1] = {'orderId': 1, 'status': 'FILLED'}
+    assert stop.filled()
+    assert exchange.calls == []
+    account.orders.clear() # Zlecenia nie ma w cache - zapytanie REST
+    assert not stop.filled()
+    assert exchange.names() == ['get_order']
+
+
+def test_finish_cancels_open_stop(exchange, clock, stop):
+    order = stop.finish()
+    assert order['status'] == 'CANCELED'
+    assert not stop.active and exchange.orders[1]['status'] == 'CANCELED'
+
+
+def test_finish_returns_fill_when_cancel_loses_race(exchange, clock, stop):
+    exchange.fill(1, 94.9)
+    order = stop.finish()
+    assert order['status'] == 'FILLED'
+    assert exchange_stop.average_price(order) == pytest.approx(94.9)
+    assert exchange.names() == ['cancel_order', 'get_order']
+    assert not stop.active
+
+
+def test_finish_raises_when_cancel_fails_on_open_order(exchange, clock, stop):
+    def fail(symbol, orderId):
+        raise api_error(-1001, 'Internal error; unable to process your request.')
+    exchange.cancel_order = fail
+    with pytest.raises(BinanceAPIException):
+        stop.finish()
+    assert stop.active and stop.order_id == 1 # Zlecenie nadal chroni pozycję
+
+
+def test_finish_without_order_returns_none(exchange, clock):
+    assert ExchangeStop(exchange, 'BTCUSDC', clock=clock).finish() is None
+
+
+def test_finish_waits_for_replace_in_flight(exchange, clock, stop):
+    # Przesunięcie w wątku monitora i zamknięcie pozycji z innego wątku: finish musi
+    # anulować zlecenie, które zastąpiło stare, a nie zostawić je osierocone na giełdzie
+    entered, release = threading.Event(), threading.Event()
+    replace = exchange.cancel_replace_order
+
+    def slow_replace(**params):
+        entered.set()
+        release.wait(5)
+        return replace(**params)
+    exchange.cancel_replace_order = slow_replace
+    stop.request(96.0)
+    flushed = []
+    flusher = threading.Thread(target=lambda: flushed.append(stop.flush(force=True)))
+    flusher.start()
+    assert entered.wait(5)
+    finished = []
+    closer = threading.Thread(target=lambda: finished.append(stop.finish()))
+    closer.start()
+    closer.join(0.1)
+    assert closer.is_alive() # Czeka na koniec przesunięcia
+    release.set()
+    flusher.join(5)
+    closer.join(5)
+    assert flushed == ['replaced']
+    assert finished[0]['orderId'] == 2 and finished[0]['status'] == 'CANCELED'
+    assert not stop.active
+    assert [o['status'] for o in exchange.orders.values()] == ['CANCELED', 'CANCELED']
+
+
+def test_flush_after_finish_sends_nothing(exchange, clock, stop):
+    stop.request(96.0)
+    stop.finish()
+    assert stop.flush(force=True) is None
+    assert exchange.names() == ['cancel_order']
+
+
+@pytest.fixture
+def trading_bot(tmp_path, monkeypatch):
+    pytest.importorskip('pandas_ta')
+    monkeypatch.chdir(tmp_path) # Log, stan i magazyn świec bota w katalogu tymczasowym
+    import strategy
+    import tick_sim
+    from bot import BinanceTradingBot
+
+    class RejectingExchange(tick_sim.FakeExchange):
+        reject_market = False
+
+        def create_order(self, **order):
+            if self.reject_market and order.get('type') == 'MARKET':
+                raise api_error(-1003, 'Too many requests.')
+            return super().create_order(**order)
+
+    ex = RejectingExchange('BTCUSDC', {'USDC': 1000.0})
+    ex.last_price, ex.bid, ex.ask = 100.0, 99.99, 100.01
+    bot = BinanceTradingBot('BTCUSDC', '15m', strategy.default_params(), ex, tick_sim._Messages(),
+                            state_file=str(tmp_path / 'state.json'), daily_summary=False)
+    return bot, ex
+
+
+def test_failed_market_close_re_places_exchange_stop(trading_bot):
+    bot, ex = trading_bot
+    bot._enter({'side': 'BUY', 'stop_loss': 95.0, 'size_usdc': 500})
+    first = bot.exchange_stop.order_id
+    quantity = bot.exchange_stop.quantity
+    ex.reject_market = True
+    with pytest.raises(BinanceAPIException):
+        bot._close_position(95.0)
+    assert bot.in_position
+    assert bot.exchange_stop.active and bot.exchange_stop.order_id != first
+    assert ex.orders[first - 1]['status'] == 'CANCELED'
+    assert ex.open_orders[bot.exchange_stop.order_id]['quantity'] == pytest.approx(quantity)
+    ex.reject_market = False
+    bot._close_position(95.0)
+    assert not bot.in_position and not ex.open_orders
@@ -0,0 +1,101 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('pandas_ta')
+
+import strategy
+from indicators import IndicatorEngine, snapshot_row
+
+INTERVAL_MS = 15 * 60 * 1000
+COLUMNS = ['close', 'ema_short', 'ema_long', 'rsi', 'atr', 'adx']
+
+
+@pytest.fixture
+def candles():
+    rng = np.random.default_rng(11)
+    n = 600
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.004, n)))
+    open_ = np.concatenate(([close[0]], close[:-1]))
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.001, n)))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.001, n)))
+    timestamps = 1_700_000_000_000 // INTERVAL_MS * INTERVAL_MS + np.arange(n, dtype=np.int64) * INTERVAL_MS
+    return pd.DataFrame({'timestamp': pd.to_datetime(timestamps, unit='ms'), 'open': open_, 'high': high,
+                         'low': low, 'close': close, 'volume': 1.0})
+
+
+@pytest.fixture
+def params():
+    return strategy.default_params(USE_MARKET_REGIME_FILTER=False, USE_DYNAMIC_RISK=True)
+
+
+def _expected(df, params):
+    # Wskaźniki backtestu indeksowane czasem otwarcia świecy (bez wierszy rozgrzewki)
+    return strategy.calculate_indicators(df.copy(), params=params).set_index('timestamp')
+
+
+def _values(engine):
+    return dict(zip(COLUMNS, engine._values()))
+
+
+def _assert_row(engine, expected):
+    row = expected.loc[pd.to_datetime(engine.last_timestamp, unit='ms')]
+    values = _values(engine)
+    for column in COLUMNS:
+        assert values[column] == pytest.approx(row[column], rel=1e-9), column
+
+
+def test_sync_and_update_match_backtest_row_by_row(candles, params):
+    expected = _expected(candles, params)
+    engine = IndicatorEngine(params)
+    assert engine.sync(candles.iloc[:200], in_progress=False)
+    _assert_row(engine, expected)
+    timestamps = candles['timestamp'].to_numpy(dtype='datetime64[ms]').astype(np.int64)
+    for i in range(200, len(candles)):
+        row = candles.iloc[i]
+        engine.update(int(timestamps[i]), row['high'], row['low'], row['close'])
+        _assert_row(engine, expected)
+
+
+def test_sync_skips_candle_in_progress_and_known_rows(candles, params):
+    expected = _expected(candles, params)
+    engine = IndicatorEngine(params)
+    engine.sync(candles.iloc[:301]) # Ostatni wiersz z get_klines to świeca w trakcie
+    assert engine.last_timestamp == candles['timestamp'].iloc[299].value // 10**6
+    _assert_row(engine, expected)
+    assert engine.sync(candles.iloc[297:321]) # Zachodzi na stan - tylko nowe świece
+    assert engine.last_timestamp == candles['timestamp'].iloc[319].value // 10**6
+    _assert_row(engine, expected)
+
+
+def test_closed_rows_match_backtest_signals(candles, params):
+    expected = _expected(candles, params)
+    buy = strategy.buy_signals(expected, params)
+    sell = strategy.sell_signals(expected, params)
+    engine = IndicatorEngine(params)
+    engine.sync(candles.iloc[:200], in_progress=False)
+    timestamps = candles['timestamp'].to_numpy(dtype='datetime64[ms]').astype(np.int64)
+    for i in range(200, len(candles)):
+        row = candles.iloc[i]
+        engine.update(int(timestamps[i]), row['high'], row['low'], row['close'])
+        rows = engine.closed()
+        j = expected.index.get_loc(pd.to_datetime(engine.last_timestamp, unit='ms'))
+        assert snapshot_row(rows, -2)['rsi'] == pytest.approx(expected['rsi'].iloc[j - 1], rel=1e-9)
+        assert strategy.buy_signals(rows, params)[-1] == buy[j]
+        assert strategy.sell_signals(rows, params)[-1] == sell[j]
+    assert buy.any() and sell.any()
+
+
+def test_reseed_after_gap_matches_backtest_on_seed_window(candles, params):
+    engine = IndicatorEngine(params)
+    engine.sync(candles.iloc[:300], in_progress=False)
+    # Przerwa w danych: pobrane świece nie zachodzą na stan silnika
+    assert not engine.sync(candles.iloc[350:401])
+    assert engine.last_timestamp == candles['timestamp'].iloc[299].value // 10**6
+
+    # Jak _update_indicators: nowy silnik z historii magazynu, potem świeże świece z REST
+    engine = IndicatorEngine(params)
+    engine.sync(candles.iloc[200:380], in_progress=False)
+    assert engine.sync(candles.iloc[350:401])
+    assert engine.ready
+    _assert_row(engine, _expected(candles.iloc[200:400], params))
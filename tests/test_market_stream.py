@@ -0,0 +1,144 @@
+import asyncio
+import json
+
+import websockets
+
+import market_stream
+from market_stream import MarketDataFeed
+
+
+def kline(open_time, high, low, close, closed):
+    return json.dumps({'stream': 'btcusdc@kline_15m', 'data': {
+        'e': 'kline', 's': 'BTCUSDC',
+        'k': {'t': open_time, 'h': str(high), 'l': str(low), 'c': str(close), 'x': closed},
+    }})
+
+
+def book(bid, ask):
+    return json.dumps({'stream': 'btcusdc@bookTicker', 'data': {'u': 1, 's': 'BTCUSDC', 'b': str(bid), 'a': str(ask)}})
+
+
+class Recorder:
+    def __init__(self):
+        self.klines = []
+        self.books = []
+        self.backfills = 0
+
+    def on_kline(self, *args):
+        self.klines.append(args)
+
+    def on_book(self, *args):
+        self.books.append(args)
+
+    def backfill(self):
+        self.backfills += 1
+
+
+async def serve(handler):
+    server = await websockets.serve(handler, '127.0.0.1', 0)
+    port = server.sockets[0].getsockname()[1]
+    return server, f"ws://127.0.0.1:{port}/stream"
+
+
+async def wait_for(condition, timeout=5):
+    async def poll():
+        while not condition():
+            await asyncio.sleep(0.01)
+    await asyncio.wait_for(poll(), timeout)
+
+
+def test_dispatches_kline_and_book_ticker():
+    paths = []
+
+    async def handler(connection):
+        paths.append(connection.request.path)
+        await connection.send(kline(1_700_000_000_000, 101.5, 99.0, 100.25, False))
+        await connection.send(book(100.2, 100.3))
+        await connection.send(kline(1_700_000_000_000, 102, 98.5, 101, True))
+        await connection.wait_closed()
+
+    async def main():
+        server, url = await serve(handler)
+        recorder = Recorder()
+        feed = MarketDataFeed('BTCUSDC', '15m', recorder.on_kline, recorder.on_book, url=url)
+        task = asyncio.create_task(feed.run())
+        await wait_for(lambda: len(recorder.klines) == 2)
+        feed.stop()
+        await asyncio.wait_for(task, 5)
+        server.close()
+        await server.wait_closed()
+        return recorder
+
+    recorder = asyncio.run(main())
+    assert paths == ['/stream?streams=btcusdc@kline_15m/btcusdc@bookTicker']
+    assert recorder.klines == [(1_700_000_000_000, 101.5, 99.0, 100.25, False), (1_700_000_000_000, 102.0, 98.5, 101.0, True)]
+    assert recorder.books == [(100.2, 100.3)]
+    assert all(type(value) is float for value in recorder.klines[0][1:4])
+
+
+def test_reconnects_and_backfills_after_disconnect(monkeypatch):
+    monkeypatch.setattr(market_stream, 'RECONNECT_DELAY_MIN', 0.05)
+    connections = []
+
+    async def handler(connection):
+        connections.append(connection)
+        await connection.send(book(100 + len(connections), 101 + len(connections)))
+        if len(connections) == 1:
+            return # Zerwanie pierwszego połączenia
+        await connection.wait_closed()
+
+    async def main():
+        server, url = await serve(handler)
+        recorder = Recorder()
+        feed = MarketDataFeed('BTCUSDC', '15m', recorder.on_kline, recorder.on_book, backfill=recorder.backfill, url=url)
+        task = asyncio.create_task(feed.run())
+        await wait_for(lambda: len(recorder.books) == 2)
+        feed.stop()
+        await asyncio.wait_for(task, 5)
+        server.close()
+        await server.wait_closed()
+        return recorder
+
+    recorder = asyncio.run(main())
+    assert len(connections) == 2
+    assert recorder.backfills == 2 # Po pierwszym połączeniu i po ponownym
+    assert recorder.books == [(101.0, 102.0), (102.0, 103.0)]
+
+
+def test_stop_closes_open_connection():
+    async def handler(connection):
+        await connection.wait_closed()
+
+    async def main():
+        server, url = await serve(handler)
+        recorder = Recorder()
+        feed = MarketDataFeed('BTCUSDC', '15m', recorder.on_kline, recorder.on_book, backfill=recorder.backfill, url=url)
+        task = asyncio.create_task(feed.run())
+        await wait_for(lambda: recorder.backfills == 1)
+        feed.stop()
+        await asyncio.wait_for(task, 5)
+        server.close()
+        await server.wait_closed()
+        return feed
+
+    feed = asyncio.run(main())
+    assert feed._connection is None
+
+
+def test_stop_interrupts_reconnect_delay(monkeypatch):
+    monkeypatch.setattr(market_stream, 'RECONNECT_DELAY_MIN', 60)
+
+    async def main():
+        server, url = await serve(lambda connection: None)
+        server.close()
+        await server.wait_closed() # Nikt nie nasłuchuje - połączenie się nie uda
+        recorder = Recorder()
+        feed = MarketDataFeed('BTCUSDC', '15m', recorder.on_kline, recorder.on_book, url=url)
+        task = asyncio.create_task(feed.run())
+        await asyncio.sleep(0.2)
+        feed.stop()
+        await asyncio.wait_for(task, 5)
+        return recorder
+
+    recorder = asyncio.run(main())
+    assert recorder.klines == [] and recorder.books == []
@@ -0,0 +1,173 @@
+import asyncio
+import threading
+import time
+
+import pytest
+import telegram
+from aiohttp import web
+
+import metrics
+import notifier
+from notifier import BATCH_SEPARATOR, TelegramNotifier
+
+TOKEN = '123:abc'
+
+
+class TelegramStub:
+    # Lokalny serwer HTTP w miejscu api.telegram.org, we własnym wątku i pętli zdarzeń.
+    # responses to kolejka odpowiedzi (kod, json) dla kolejnych wywołań sendMessage;
+    # gdy jest pusta - sukces. gate wstrzymuje obsługę zapytań do czasu set().
+    def __init__(self):
+        self.requests = [] # (czas, tekst)
+        self.responses = []
+        self.gate = threading.Event()
+        self.gate.set()
+        self.arrived = threading.Event()
+        self._loop = asyncio.new_event_loop()
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        self._ready.wait(5)
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        app = web.Application()
+        app.router.add_post(f'/bot{TOKEN}/sendMessage', self._send_message)
+        self._runner = web.AppRunner(app)
+        self._loop.run_until_complete(self._runner.setup())
+        site = web.TCPSite(self._runner, '127.0.0.1', 0)
+        self._loop.run_until_complete(site.start())
+        self.port = site._server.sockets[0].getsockname()[1]
+        self._ready.set()
+        self._loop.run_forever()
+
+    async def _send_message(self, request):
+        data = await request.post() if request.content_type != 'application/json' else await request.json()
+        self.requests.append((time.monotonic(), data['text']))
+        self.arrived.set()
+        await self._loop.run_in_executor(None, self.gate.wait, 10)
+        if self.responses:
+            status, body = self.responses.pop(0)
+            return web.json_response(body, status=status)
+        return web.json_response({'ok': True, 'result': {
+            'message_id': len(self.requests), 'date': 0, 'chat': {'id': 1, 'type': 'private'}, 'text': data['text']}})
+
+    @property
+    def texts(self):
+        return [text for _, text in self.requests]
+
+    def bot(self):
+        return telegram.Bot(TOKEN, base_url=f'http://127.0.0.1:{self.port}/bot')
+
+    def stop(self):
+        self.gate.set()
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result(5)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(5)
+
+
+@pytest.fixture
+def stub():
+    stub = TelegramStub()
+    yield stub
+    stub.stop()
+
+
+def dropped():
+    return metrics.TELEGRAM_DROPPED.series.get((), 0)
+
+
+def test_send_does_not_wait_for_api(stub):
+    stub.gate.clear()
+    sender = TelegramNotifier(stub.bot(), 1, min_interval=0)
+    started = time.perf_counter()
+    for i in range(5):
+        sender.send(f'msg {i}')
+    assert time.perf_counter() - started < 0.05
+    stub.gate.set()
+    sender.close()
+
+
+def test_messages_waiting_during_send_go_out_as_one_batch(stub):
+    stub.gate.clear()
+    sender = TelegramNotifier(stub.bot(), 1, min_interval=0)
+    sender.send('first')
+    assert stub.arrived.wait(5)
+    for i in range(3):
+        sender.send(f'queued {i}')
+    stub.gate.set()
+    sender.close()
+    assert stub.texts == ['first', BATCH_SEPARATOR.join(['queued 0', 'queued 1', 'queued 2'])]
+
+
+def test_batch_is_split_at_message_length_limit(stub, monkeypatch):
+    monkeypatch.setattr(notifier, 'MAX_MESSAGE_LENGTH', 20)
+    stub.gate.clear()
+    sender = TelegramNotifier(stub.bot(), 1, min_interval=0)
+    sender.send('first')
+    assert stub.arrived.wait(5)
+    for text in ('aaaaaaaa', 'bbbbbbbb', 'cccccccc'):
+        sender.send(text)
+    stub.gate.set()
+    sender.close()
+    assert stub.texts == ['first', 'aaaaaaaa\n\nbbbbbbbb', 'cccccccc']
+
+
+def test_retry_after_waits_the_time_given_by_telegram(stub):
+    stub.responses.append((429, {'ok': False, 'error_code': 429, 'description': 'Too Many Requests: retry after 1',
+                                 'parameters': {'retry_after': 1}}))
+    sender = TelegramNotifier(stub.bot(), 1, min_interval=0)
+    before = dropped()
+    sender.send('limited')
+    sender.close()
+    (first, _), (second, text) = stub.requests
+    assert text == 'limited'
+    assert second - first >= 1.0
+    assert dropped() == before
+
+
+def test_server_errors_are_retried_with_backoff(stub, monkeypatch):
+    monkeypatch.setattr(notifier, 'RETRY_DELAY_MIN', 0.1)
+    error = (502, {'ok': False, 'error_code': 502, 'description': 'Bad Gateway'})
+    stub.responses.extend([error, error])
+    sender = TelegramNotifier(stub.bot(), 1, min_interval=0)
+    sender.send('flaky')
+    sender.close()
+    times = [t for t, _ in stub.requests]
+    assert stub.texts == ['flaky'] * 3
+    assert times[2] - times[1] >= 0.2 > times[1] - times[0] >= 0.1 # Opóźnienie podwajane
+
+
+def test_full_queue_drops_new_messages(stub):
+    stub.gate.clear()
+    sender = TelegramNotifier(stub.bot(), 1, max_queue=2, min_interval=0)
+    sender.send('in flight')
+    assert stub.arrived.wait(5) # Wątek wysyłki trzyma pierwszą wiadomość, kolejka pusta
+    before = dropped()
+    for i in range(4):
+        sender.send(f'msg {i}')
+    assert dropped() == before + 2
+    stub.gate.set()
+    sender.close()
+    assert stub.texts == ['in flight', BATCH_SEPARATOR.join(['msg 0', 'msg 1'])]
+
+
+def test_close_flushes_queue_before_stopping(stub):
+    sender = TelegramNotifier(stub.bot(), 1, min_interval=0.2)
+    for i in range(3):
+        sender.send(f'msg {i}')
+    sender.close()
+    assert not sender._thread.is_alive()
+    assert BATCH_SEPARATOR.join(stub.texts).split(BATCH_SEPARATOR) == ['msg 0', 'msg 1', 'msg 2']
+
+
+def test_min_interval_spaces_sends(stub):
+    stub.gate.clear()
+    sender = TelegramNotifier(stub.bot(), 1, min_interval=0.3)
+    sender.send('one')
+    assert stub.arrived.wait(5)
+    sender.send('two')
+    stub.gate.set()
+    sender.close()
+    (first, _), (second, _) = stub.requests
+    assert second - first >= 0.3
@@ -0,0 +1,138 @@
+import asyncio
+import hashlib
+import hmac
+import types
+
+import pytest
+from aiohttp import web
+from binance.exceptions import BinanceAPIException
+
+import rest_client
+from rest_client import AsyncBinanceClient, WeightBudget
+
+API_KEY = 'key'
+API_SECRET = 'secret'
+
+
+class BinanceStub:
+    # Lokalny serwer REST w miejscu api.binance.com. used_weight to wartość nagłówka
+    # X-MBX-USED-WEIGHT-1M (zerowana z nową minutą zegara), responses - kolejka odpowiedzi
+    # (kod, json, nagłówki); gdy jest pusta - sukces. Każde zapytanie trafia do requests.
+    def __init__(self, clock):
+        self.clock = clock
+        self.minute = int(clock() // 60)
+        self.requests = []
+        self.responses = []
+        self.used_weight = 0
+
+    async def __aenter__(self):
+        app = web.Application()
+        app.router.add_route('*', '/api/{path:.*}', self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', 0)
+        await site.start()
+        self.url = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}/api"
+        return self
+
+    async def __aexit__(self, *exc):
+        await self._runner.cleanup()
+
+    async def _handle(self, request):
+        self.requests.append(request)
+        if int(self.clock() // 60) != self.minute:
+            self.minute, self.used_weight = int(self.clock() // 60), 0
+        self.used_weight += 2
+        headers = {'X-MBX-USED-WEIGHT-1M': str(self.used_weight)}
+        if self.responses:
+            status, body, extra = self.responses.pop(0)
+            return web.json_response(body, status=status, headers=dict(headers, **extra))
+        return web.json_response({'balances': []} if 'account' in request.path else [], headers=headers)
+
+
+class Clock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock(1_699_999_990.0) # 10 s po pełnej minucie
+
+
+@pytest.fixture
+def sleeps(monkeypatch, clock):
+    # Oczekiwanie budżetu przesuwa sztuczny zegar zamiast czekać naprawdę
+    delays = []
+
+    async def sleep(delay):
+        delays.append(delay)
+        clock.now += delay
+    monkeypatch.setattr(rest_client, 'asyncio', types.SimpleNamespace(sleep=sleep))
+    return delays
+
+
+def run(scenario, clock):
+    async def main():
+        async with BinanceStub(clock) as stub:
+            await scenario(stub)
+    asyncio.run(main())
+
+
+def test_used_weight_header_throttles_until_next_minute(clock, sleeps):
+    budget = WeightBudget(limit=100, reserve=10, clock=clock)
+
+    async def scenario(stub):
+        client = AsyncBinanceClient(base_url=stub.url, budget=budget)
+        stub.used_weight = 88 # Inne procesy z tego samego IP zużyły już większość limitu
+        await client.get_klines('BTCUSDC', '15m', limit=3)
+        assert budget.used == 90
+        assert not sleeps
+        await client.get_klines('BTCUSDC', '15m', limit=3) # 90 + 2 > 100 - 10
+        assert sleeps == [pytest.approx(50.05)]
+        assert len(stub.requests) == 2
+        assert budget.used == 2 # Nowa minuta
+        await client.close()
+    run(scenario, clock)
+
+
+@pytest.mark.parametrize('status', [429, 418])
+def test_rate_limit_response_blocks_for_retry_after(clock, sleeps, status):
+    budget = WeightBudget(limit=1200, reserve=0, clock=clock)
+
+    async def scenario(stub):
+        client = AsyncBinanceClient(base_url=stub.url, budget=budget)
+        stub.responses.append((status, {'code': -1003, 'msg': 'Too many requests.'}, {'Retry-After': '7'}))
+        with pytest.raises(BinanceAPIException) as error:
+            await client.get_klines('BTCUSDC', '15m')
+        assert error.value.status_code == status and error.value.code == -1003
+        assert budget.blocked_until == pytest.approx(clock.now + 7)
+        await client.get_klines('BTCUSDC', '15m')
+        assert sleeps == [pytest.approx(7)] # Drugie zapytanie poszło dopiero po Retry-After
+        assert len(stub.requests) == 2
+        await client.close()
+    run(scenario, clock)
+
+
+def test_signed_endpoints_carry_key_and_hmac_signature(clock, sleeps):
+    budget = WeightBudget(clock=clock)
+
+    async def scenario(stub):
+        client = AsyncBinanceClient(API_KEY, API_SECRET, base_url=stub.url, budget=budget, recv_window=3000)
+        await client.get_account()
+        await client.create_order(symbol='BTCUSDC', side='BUY', type='MARKET', quoteOrderQty=25.5)
+        await client.get_klines('BTCUSDC', '1d', limit=2)
+        account, order, klines = stub.requests
+        for request in (account, order):
+            assert request.headers['X-MBX-APIKEY'] == API_KEY
+            query, signature = request.query_string.rsplit('&signature=', 1)
+            assert signature == hmac.new(API_SECRET.encode(), query.encode(), hashlib.sha256).hexdigest()
+            assert request.query['recvWindow'] == '3000' and 'timestamp' in request.query
+        assert order.method == 'POST' and order.path == '/api/v3/order'
+        assert order.query['quoteOrderQty'] == '25.5' and order.query['type'] == 'MARKET'
+        assert 'signature' not in klines.query and klines.query['limit'] == '2'
+        await client.close()
+    run(scenario, clock)
@@ -0,0 +1,80 @@
+import asyncio
+import time
+
+import pytest
+
+from risk import PortfolioRisk
+
+HOUR = 60 * 60 * 1000
+CLOSE_MS = 1_700_000_000_000 - 1_700_000_000_000 % HOUR
+
+
+def plan(symbol, size, balance=1000.0, side='BUY'):
+    return {'symbol': symbol, 'side': side, 'stop_loss': 0.0, 'size_usdc': size, 'balance': balance}
+
+
+def portfolio(keys, batch_timeout=1.0):
+    risk = PortfolioRisk(max_exposure=10.0, batch_timeout=batch_timeout)
+    for key in keys:
+        risk.register(key, key.split()[0], '1h')
+    return risk
+
+
+def test_signals_of_one_close_share_the_balance():
+    risk = portfolio(['BTCUSDC 1h', 'ETHUSDC 1h'])
+
+    async def main():
+        return await asyncio.gather(
+            risk.submit(CLOSE_MS, 'BTCUSDC 1h', plan('BTCUSDC', 800)),
+            risk.submit(CLOSE_MS, 'ETHUSDC 1h', plan('ETHUSDC', 800)),
+        )
+
+    btc, eth = asyncio.run(main())
+    assert btc['size_usdc'] == pytest.approx(500) and eth['size_usdc'] == pytest.approx(500)
+
+
+def test_batch_waits_only_until_timeout_for_missing_instances():
+    risk = portfolio(['BTCUSDC 1h', 'ETHUSDC 1h'], batch_timeout=0.2)
+
+    async def main():
+        started = time.perf_counter()
+        result = await risk.submit(CLOSE_MS, 'BTCUSDC 1h', plan('BTCUSDC', 800))
+        return result, time.perf_counter() - started
+
+    result, elapsed = asyncio.run(main())
+    assert 0.2 <= elapsed < 1.0
+    assert result['size_usdc'] == pytest.approx(800)
+
+
+def test_late_arrival_is_allocated_immediately():
+    risk = portfolio(['BTCUSDC 1h', 'ETHUSDC 1h', 'SOLUSDC 1h'], batch_timeout=0.2)
+
+    async def main():
+        await asyncio.gather(
+            risk.submit(CLOSE_MS, 'BTCUSDC 1h', plan('BTCUSDC', 800)),
+            risk.submit(CLOSE_MS, 'ETHUSDC 1h', None),
+        )
+        started = time.perf_counter()
+        late = await risk.submit(CLOSE_MS, 'SOLUSDC 1h', plan('SOLUSDC', 300))
+        return late, time.perf_counter() - started
+
+    late, elapsed = asyncio.run(main())
+    assert elapsed < 0.1 # Bez ponownego czekania batch_timeout
+    assert late['size_usdc'] == pytest.approx(300)
+    assert risk._served[CLOSE_MS] == {'BTCUSDC 1h', 'ETHUSDC 1h', 'SOLUSDC 1h'}
+    assert CLOSE_MS not in risk._batches
+
+
+def test_next_close_starts_a_new_batch():
+    risk = portfolio(['BTCUSDC 1h', 'ETHUSDC 1h'])
+
+    async def main():
+        for close_ms in (CLOSE_MS, CLOSE_MS + HOUR):
+            results = await asyncio.gather(
+                risk.submit(close_ms, 'BTCUSDC 1h', plan('BTCUSDC', 800)),
+                risk.submit(close_ms, 'ETHUSDC 1h', plan('ETHUSDC', 800)),
+            )
+        return results
+
+    btc, eth = asyncio.run(main())
+    assert btc['size_usdc'] == pytest.approx(500) and eth['size_usdc'] == pytest.approx(500)
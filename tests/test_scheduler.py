@@ -0,0 +1,107 @@
+import asyncio
+import types
+
+import pytest
+
+import scheduler
+from scheduler import WEEK_ALIGN_MS, CandleScheduler, _Job
+
+MINUTE = 60 * 1000
+HOUR = 60 * MINUTE
+WEEK = 7 * 24 * HOUR
+MONDAY = 1_704_067_200_000 # 2024-01-01 00:00 UTC, otwarcie świecy tygodniowej Binance
+
+
+class FakeClock:
+    def __init__(self, now_ms):
+        self.now = now_ms
+        self.stale = False
+
+    def now_ms(self):
+        return self.now
+
+    def sync(self):
+        pass
+
+
+async def noop(close_ms):
+    pass
+
+
+def test_closed_at_aligns_to_candle_boundaries():
+    job = _Job('15m', noop)
+    assert job.closed_at(MONDAY + 15 * MINUTE) == MONDAY + 15 * MINUTE
+    assert job.closed_at(MONDAY + 15 * MINUTE - 1) == MONDAY
+    assert job.next_close(MONDAY + 1) == MONDAY + 15 * MINUTE
+    assert _Job('1d', noop).closed_at(MONDAY + 5 * HOUR) == MONDAY
+
+
+def test_weekly_candles_close_on_monday_not_thursday():
+    job = _Job('1w', noop)
+    assert job.align_ms == WEEK_ALIGN_MS
+    assert job.closed_at(MONDAY + HOUR) == MONDAY
+    assert job.closed_at(MONDAY - 1) == MONDAY - WEEK
+    assert job.next_close(MONDAY + 3 * 24 * HOUR) == MONDAY + WEEK
+    assert MONDAY // WEEK * WEEK != MONDAY # Bez przesunięcia tydzień zamykałby się w czwartek
+
+
+def test_due_jobs_fire_exactly_once_per_close_and_record_lag():
+    clock = FakeClock(MONDAY + 7 * MINUTE)
+    candles = CandleScheduler(clock)
+    candles.add('15m', noop)
+    job = candles.jobs[0]
+    job.last_close = job.closed_at(clock.now)
+    assert candles._due_jobs(MONDAY + 14 * MINUTE) == [] # Przedwczesne wybudzenie
+    assert candles._due_jobs(MONDAY + 15 * MINUTE + 40) == [(job, MONDAY + 15 * MINUTE)]
+    assert candles._due_jobs(MONDAY + 15 * MINUTE + 90) == []
+    assert candles._due_jobs(MONDAY + 15 * MINUTE - 20) == [] # Zegar cofnięty po synchronizacji
+    assert candles._due_jobs(MONDAY + 30 * MINUTE + 5) == [(job, MONDAY + 30 * MINUTE)]
+    assert list(job.lags_ms) == [40, 5]
+
+
+def test_due_jobs_after_pause_fire_latest_close_once():
+    candles = CandleScheduler(FakeClock(0))
+    candles.add('15m', noop)
+    candles.add('1h', noop)
+    fast, slow = candles.jobs
+    fast.last_close = slow.last_close = MONDAY
+    assert candles._due_jobs(MONDAY + 45 * MINUTE + 10) == [(fast, MONDAY + 45 * MINUTE)]
+    due = candles._due_jobs(MONDAY + HOUR + 250)
+    assert due == [(fast, MONDAY + HOUR), (slow, MONDAY + HOUR)]
+    assert list(fast.lags_ms) == [10, 250] and list(slow.lags_ms) == [250]
+
+
+def test_run_calls_each_close_once_on_server_time(monkeypatch):
+    clock = FakeClock(MONDAY + 7 * MINUTE)
+    calls = []
+    wakes = []
+
+    class Stop(Exception):
+        pass
+
+    async def sleep(seconds):
+        # Wybudzenie 30 ms po czasie, a co drugie 1 ms za wcześnie - zadanie dosypia
+        wakes.append(seconds)
+        if len(calls) == 4:
+            raise Stop
+        early = len(wakes) % 2 == 0 and seconds > 0
+        clock.now += round(seconds * 1000) + (-1 if early else 30)
+
+    monkeypatch.setattr(scheduler, 'asyncio', types.SimpleNamespace(
+        sleep=sleep, gather=asyncio.gather, to_thread=asyncio.to_thread))
+    candles = CandleScheduler(clock)
+
+    async def fast(close_ms):
+        calls.append(('15m', close_ms, clock.now - close_ms))
+
+    async def slow(close_ms):
+        calls.append(('30m', close_ms, clock.now - close_ms))
+    candles.add('15m', fast)
+    candles.add('30m', slow)
+    with pytest.raises(Stop):
+        asyncio.run(candles.run())
+    # Świeca zamknięta przed startem nie jest oceniana; każde zamknięcie dokładnie raz
+    assert [(interval, close) for interval, close, _ in calls] == [
+        ('15m', MONDAY + 15 * MINUTE), ('15m', MONDAY + 30 * MINUTE), ('30m', MONDAY + 30 * MINUTE), ('15m', MONDAY + 45 * MINUTE)]
+    assert all(lag >= 0 for _, _, lag in calls)
+    assert list(candles.jobs[0].lags_ms) == [calls[0][2], calls[1][2], calls[3][2]]
@@ -0,0 +1,103 @@
+import json
+import os
+
+import pytest
+
+import state_journal
+from state_journal import CLOSED, StateJournal
+
+DEFAULT = dict(CLOSED, last_summary_date=None)
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'state.json')
+
+
+def _open_position(journal):
+    journal.append('open', in_position=True, position_side='BUY', entry_price=100.0, position_size_usdc=500.0, stop_loss=95.0)
+    journal.append('stop', stop_loss=96.0)
+    journal.append('stop', stop_loss=97.0)
+
+
+def _recover(path):
+    journal = StateJournal(path, compact_every=1000)
+    return journal, journal.recover(DEFAULT)
+
+
+def test_replays_events_after_restart(path):
+    journal, _ = _recover(path)
+    _open_position(journal)
+    journal.close()
+    journal, state = _recover(path)
+    assert state['in_position'] and state['stop_loss'] == 97.0
+    assert journal.seq == 3 and journal.pending == 3
+
+
+@pytest.mark.parametrize('tail', ['0badc0de {"seq":4,"event":"stop","da', '0badc0de {"seq":4,"event":"stop","data":{"stop_loss":99.0}}\n'])
+def test_torn_or_corrupt_last_line_is_skipped_and_truncated(path, tail):
+    journal, _ = _recover(path)
+    _open_position(journal)
+    journal.close()
+    valid = os.path.getsize(path + '.wal')
+    with open(path + '.wal', 'a') as f:
+        f.write(tail) # Urwany zapis albo linia z niezgodną sumą CRC
+
+    journal, state = _recover(path)
+    assert state['stop_loss'] == 97.0 and journal.seq == 3
+    assert os.path.getsize(path + '.wal') == valid
+    journal.append('stop', stop_loss=98.0) # Kolejne zapisy nie trafiają za uszkodzoną linię
+    journal.close()
+    journal, state = _recover(path)
+    assert state['stop_loss'] == 98.0 and journal.seq == 4
+
+
+def test_close_compacts_into_snapshot(path):
+    journal, _ = _recover(path)
+    _open_position(journal)
+    journal.append('close', last_summary_date='2024-01-02')
+    assert os.path.getsize(path + '.wal') == 0
+    with open(path) as f:
+        snapshot = json.load(f)
+    assert snapshot['journal_seq'] == 4 and not snapshot['in_position']
+    journal.close()
+    journal, state = _recover(path)
+    assert state == dict(DEFAULT, last_summary_date='2024-01-02') and journal.seq == 4
+
+
+def test_crash_between_snapshot_replace_and_wal_truncate(path, monkeypatch):
+    journal, _ = _recover(path)
+    _open_position(journal)
+
+    def crash(path):
+        raise OSError('awaria po os.replace')
+    monkeypatch.setattr(state_journal, '_fsync_dir', crash)
+    # Migawka z poprawionym stanem (np. po uzgodnieniu z giełdą) - zdarzenia 1..3 zostają w dzienniku
+    with pytest.raises(OSError):
+        journal.snapshot(dict(journal.state, entry_price=101.0))
+    journal.close()
+    monkeypatch.undo()
+    with open(path) as f:
+        assert json.load(f)['journal_seq'] == 3
+    assert os.path.getsize(path + '.wal') > 0
+
+    # Zdarzenia o numerach <= journal_seq są już w migawce i nie mogą jej nadpisać
+    journal, state = _recover(path)
+    assert state['entry_price'] == 101.0 and state['stop_loss'] == 97.0
+    assert journal.seq == 3 and journal.pending == 0
+    journal.append('stop', stop_loss=98.0)
+    journal.close()
+    journal, state = _recover(path)
+    assert state['entry_price'] == 101.0 and state['stop_loss'] == 98.0 and journal.seq == 4
+
+
+def test_failed_recover_refuses_writes(path):
+    os.mkdir(path + '.wal') # Dziennika nie da się otworzyć
+    journal = StateJournal(path)
+    with pytest.raises(OSError):
+        journal.recover(DEFAULT)
+    with pytest.raises(OSError):
+        journal.append('stop', stop_loss=98.0)
+    with pytest.raises(OSError):
+        journal.snapshot(DEFAULT)
+    assert not os.path.exists(path)
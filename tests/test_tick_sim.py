@@ -0,0 +1,86 @@
+import pytest
+
+from data import parse_klines
+
+MINUTE = 60 * 1000
+
+
+@pytest.fixture
+def exchange(tmp_path, monkeypatch):
+    pytest.importorskip('pandas_ta')
+    monkeypatch.chdir(tmp_path) # Import bota zakłada plik logu w bieżącym katalogu
+    from tick_sim import FakeExchange
+    exchange = FakeExchange('BTCUSDC', {'USDC': 1000.0})
+    exchange.add_klines('1m', [[i * MINUTE, 100.0 + i, 101.0 + i, 99.0 + i, 100.5 + i, 1.0] for i in range(10)])
+    exchange.open_klines['1m'] = [10 * MINUTE, 110.0, 111.0, 109.0, 110.5, 0.5]
+    return exchange
+
+
+def test_get_klines_returns_latest_with_candle_in_progress(exchange):
+    candles = parse_klines(exchange.get_klines(symbol='BTCUSDC', interval='1m', limit=3))
+    assert candles['timestamp'].tolist() == [8 * MINUTE, 9 * MINUTE, 10 * MINUTE]
+    assert candles['close'].tolist() == [108.5, 109.5, 110.5]
+    assert candles['close_time'][-1] == 11 * MINUTE - 1
+
+
+def test_get_klines_pages_from_start_time(exchange):
+    klines = exchange.get_klines(symbol='BTCUSDC', interval='1m', startTime=4 * MINUTE, limit=3)
+    assert [k[0] for k in klines] == [4 * MINUTE, 5 * MINUTE, 6 * MINUTE]
+    klines = exchange.get_klines(symbol='BTCUSDC', interval='1m', startTime=8 * MINUTE, limit=5)
+    assert [k[0] for k in klines] == [8 * MINUTE, 9 * MINUTE, 10 * MINUTE]
+    assert exchange.get_klines(symbol='BTCUSDC', interval='1h', limit=5) == []
+
+
+def test_closed_candle_is_not_repeated_as_in_progress(exchange):
+    exchange.add_klines('1m', [exchange.open_klines['1m']])
+    klines = exchange.get_klines(symbol='BTCUSDC', interval='1m', limit=3)
+    assert [k[0] for k in klines] == [8 * MINUTE, 9 * MINUTE, 10 * MINUTE]
+
+
+def _fixture(n=700, seed=1):
+    # Losowe błądzenie 15m (zamknięcie = otwarcie następnej świecy) i tiki: open, high, low, close
+    import numpy as np
+    import pandas as pd
+    rng = np.random.default_rng(seed)
+    interval_ms = 15 * MINUTE
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.004, n)))
+    open_ = np.concatenate(([close[0]], close[:-1]))
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.001, n)))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.001, n)))
+    timestamps = 1_700_000_000_000 // interval_ms * interval_ms + np.arange(n, dtype=np.int64) * interval_ms
+    df = pd.DataFrame({'timestamp': pd.to_datetime(timestamps, unit='ms'), 'open': open_, 'high': high,
+                       'low': low, 'close': close, 'volume': 1.0})
+    ticks = []
+    for t, prices in zip(timestamps, zip(open_, high, low, close)):
+        for k, price in enumerate(prices):
+            ticks.append((int(t) + k * interval_ms // 4 + 1, 0, float(price), 0.01))
+    return df, ticks
+
+
+def test_simulator_takes_the_backtest_trades(tmp_path, monkeypatch):
+    pytest.importorskip('pandas_ta')
+    monkeypatch.chdir(tmp_path)
+    import pandas as pd
+    import backtest
+    import strategy
+    from tick_sim import FakeExchange, TickSimulator
+
+    df, ticks = _fixture()
+    seed = 300 # Świece historii przed pierwszym tikiem
+    params = strategy.default_params(USE_MARKET_REGIME_FILTER=False, RISK_PER_TRADE_HIGH=0.005, RISK_PER_TRADE_LOW=0.005)
+    trades = backtest.run_backtest(df.copy(), params=params)['trades']
+    trades = trades[trades['entry_time'] >= df['timestamp'].iloc[seed]]
+    assert len(trades)
+
+    # Zapas aktywa bazowego, żeby na rynku spot dało się otworzyć też pozycje SELL
+    exchange = FakeExchange('BTCUSDC', {'USDC': 1000.0, 'BTC': 20.0}, slippage_bps=0)
+    simulator = TickSimulator('BTCUSDC', '15m', params, initial_capital=1000.0, exchange=exchange)
+    report = simulator.run(iter(ticks[seed * 4:]), df)
+    assert simulator.errors == 0
+
+    # Bot wchodzi na pierwszym tiku świecy po świecy z sygnałem (backtest: czas otwarcia świecy z sygnałem)
+    entries = {(row.side, row.entry_time.floor('15min') - pd.Timedelta(minutes=15)): row for row in report.itertuples()}
+    for trade in trades.itertuples():
+        position = entries.get((trade.side, trade.entry_time))
+        assert position is not None, f"Brak pozycji {trade.side} z {trade.entry_time}"
+        assert pd.notna(position.tick_exit_time)
@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import timeframes
+
+DAY = timeframes.DAY_MS
+HOUR = 60 * 60 * 1000
+
+
+@pytest.fixture
+def days():
+    # Dni 0, 1 i 3 - dnia 2 brakuje w tabeli
+    index = pd.Index([pd.Timestamp(ms, unit='ms').date() for ms in (0, DAY, 3 * DAY)])
+    return pd.DataFrame({'close': [10.0, 11.0, 13.0]}, index=index)
+
+
+def bars(*hours):
+    return pd.to_datetime(np.array(hours) * HOUR, unit='ms')
+
+
+def test_current_index_matches_same_day_including_unfinished_one(days):
+    index = timeframes.current_index(bars(0, 23, 24, 50, 73), days.index, '1d')
+    assert index.tolist() == [0, 0, 1, -1, 2]
+
+
+def test_closed_index_uses_last_day_closed_before_bar(days):
+    index = timeframes.closed_index(bars(0, 23, 24, 50, 73), days.index, '1d')
+    assert index.tolist() == [-1, -1, 0, 1, 1]
+
+
+def test_align_live_and_closed(days):
+    base = bars(5, 30, 80)
+    live = timeframes.align(base, days, '1d', ['close'], live=True)['close']
+    closed = timeframes.align(base, days, '1d', ['close'])['close']
+    np.testing.assert_array_equal(live, [10.0, 11.0, 13.0])
+    np.testing.assert_array_equal(closed, [np.nan, 10.0, 11.0])
+
+
+def test_empty_higher_timeframe_gives_nan():
+    empty = pd.DataFrame({'close': []}, index=pd.Index([]))
+    assert timeframes.current_index(bars(1, 2), empty.index, '1d').tolist() == [-1, -1]
+    assert np.isnan(timeframes.align(bars(1, 2), empty, '1d', ['close'], live=True)['close']).all()
+
+
+def test_weekly_buckets_start_on_monday():
+    monday = pd.Timestamp('2024-01-01').value // 10**6
+    ids = timeframes.bucket_ids(np.array([monday - 1, monday, monday + 7 * DAY - 1], dtype=np.int64), '1w')
+    assert ids[0] + 1 == ids[1] == ids[2]
+
+
+def test_month_interval_is_rejected():
+    with pytest.raises(ValueError):
+        timeframes.interval_ms('1M')
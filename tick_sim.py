@@ -0,0 +1,581 @@
+import asyncio
+import bisect
+import csv
+import gzip
+import heapq
+import io
+import itertools
+import json
+import logging
+import math
+import os
+import tempfile
+import zipfile
+
+import pandas as pd
+from binance.client import Client
+from binance.exceptions import BinanceAPIException
+from binance.helpers import interval_to_milliseconds
+
+import backtest
+import strategy
+from bot import BinanceTradingBot
+from config import *
+from exchange_stop import average_price
+from risk import PortfolioRisk
+from timeframes import DAY_MS
+
+logger = logging.getLogger("binance_bot")
+
+TRADE, BOOK = 0, 1  # Rodzaj tiku: (czas_ms, TRADE, cena, ilość) lub (czas_ms, BOOK, bid, ask)
+
+
+# --- Odczyt tików z dysku --------------------------------------------------------
+# Wszystko to generatory czytające plik wiersz po wierszu, więc miesiące tików
+# przechodzą przez symulację w stałej pamięci.
+
+def _rows(path):
+    if path.endswith('.zip'):
+        with zipfile.ZipFile(path) as archive, archive.open(archive.namelist()[0]) as raw:
+            yield from csv.reader(io.TextIOWrapper(raw, encoding='utf-8'))
+    else:
+        with (gzip.open(path, 'rt', encoding='utf-8') if path.endswith('.gz') else open(path, newline='', encoding='utf-8')) as f:
+            yield from csv.reader(f)
+
+
+def _data_rows(paths):
+    for path in paths:
+        for row in _rows(path):
+            if row and row[0][:1].isdigit(): # Pomija nagłówek
+                yield row
+
+
+def _to_ms(value):
+    ts = int(value)
+    return ts // 1000 if ts > 10**14 else ts # Nowsze zrzuty Binance mają czas w mikrosekundach
+
+
+def read_agg_trades(paths):
+    # Układ zrzutów aggTrades z data.binance.vision: agg_trade_id, price, quantity,
+    # first_trade_id, last_trade_id, transact_time, is_buyer_maker[, is_best_match]
+    for row in _data_rows(paths):
+        yield _to_ms(row[5]), TRADE, float(row[1]), float(row[2])
+
+
+def read_book_ticker(paths):
+    # update_id, best_bid_price, best_bid_qty, best_ask_price, best_ask_qty, transaction_time, event_time
+    for row in _data_rows(paths):
+        yield _to_ms(row[5]), BOOK, float(row[1]), float(row[3])
+
+
+def merge_ticks(*streams):
+    # Scala posortowane strumienie tików w jeden chronologiczny
+    return heapq.merge(*streams, key=lambda tick: tick[0])
+
+
+# --- Lokalna giełda --------------------------------------------------------------
+
+def _api_error(code, message):
+    return BinanceAPIException(None, 400, json.dumps({'code': code, 'msg': message}))
+
+
+class FakeExchange:
+    # Zamiennik binance.client.Client w procesie symulacji. Zlecenia MARKET są
+    # wypełniane po bieżącym bid/ask (albo ostatniej transakcji) z poślizgiem, ilość
+    # przycinana do LOT_SIZE, prowizja pobierana w otrzymanym aktywie jak na Binance,
+    # a quoteOrderQty oznacza kwotę w walucie kwotowanej. Zlecenia STOP_LOSS_LIMIT
+    # blokują saldo, są aktywowane ceną transakcji i wykonywane jak zlecenie limit
+    # po bid/ask (match() na każdym tiku). Czas i ceny ustawia symulator.
+    def __init__(self, symbol, balances, quote_asset='USDC', fee_rate=TICK_FEE_RATE, slippage_bps=TICK_SLIPPAGE_BPS,
+                 tick_size=TICK_PRICE_STEP, step_size=TICK_STEP_SIZE, min_notional=TICK_MIN_NOTIONAL):
+        self.symbol = symbol
+        self.quote_asset = quote_asset
+        self.base_asset = symbol[:-len(quote_asset)] if symbol.endswith(quote_asset) else symbol
+        self.balances = {self.base_asset: 0.0, quote_asset: 0.0}
+        self.balances.update(balances)
+        self.locked = {asset: 0.0 for asset in self.balances}
+        self.fee_rate = fee_rate
+        self.slippage = slippage_bps / 10000
+        self.tick_size = tick_size
+        self.step_size = step_size
+        self.min_notional = min_notional
+        self.now_ms = 0
+        self.bid = self.ask = self.last_price = None
+        self.orders = []       # Wszystkie zlecenia w kolejności złożenia (orderId = indeks + 1)
+        self.open_orders = {}  # orderId -> zlecenie stop oczekujące na aktywację lub wykonanie
+        self.klines = {}       # interwał -> (czasy otwarcia, świece zamknięte) dla get_klines
+        self.open_klines = {}  # interwał -> świeca w trakcie
+        self._lot_warned = False
+
+    def get_server_time(self):
+        return {'serverTime': self.now_ms}
+
+    def get_symbol_info(self, symbol):
+        return {'symbol': symbol, 'filters': [
+            {'filterType': 'PRICE_FILTER', 'tickSize': f"{self.tick_size:.8f}"},
+            {'filterType': 'LOT_SIZE', 'stepSize': f"{self.step_size:.8f}"},
+            {'filterType': 'NOTIONAL', 'minNotional': f"{self.min_notional:.8f}"},
+        ]}
+
+    def add_klines(self, interval, candles):
+        # Zamknięte świece symulacji [open_time, open, high, low, close, volume]
+        times, rows = self.klines.setdefault(interval, ([], []))
+        for candle in candles:
+            times.append(candle[0])
+            rows.append(candle)
+
+    def get_klines(self, symbol, interval, limit=500, startTime=None, endTime=None, **kwargs):
+        # Jak Binance: świece od startTime (albo ostatnie limit), na końcu świeca w trakcie
+        times, rows = self.klines.get(interval, ([], []))
+        current = self.open_klines.get(interval)
+        if current is not None and times and current[0] <= times[-1]:
+            current = None # Świeca w trakcie jest już zamknięta
+        if startTime is not None:
+            begin = bisect.bisect_left(times, startTime)
+            candles = rows[begin:begin + limit]
+            if current is not None and len(candles) < limit and current[0] >= startTime:
+                candles.append(current)
+        else:
+            candles = rows[-limit:] + ([current] if current is not None else [])
+            candles = candles[-limit:]
+        if endTime is not None:
+            candles = [c for c in candles if c[0] <= endTime]
+        interval_ms = interval_to_milliseconds(interval)
+        return [[c[0], f"{c[1]:.8f}", f"{c[2]:.8f}", f"{c[3]:.8f}", f"{c[4]:.8f}", f"{c[5]:.8f}", c[0] + interval_ms - 1,
+                 '0', 0, '0', '0', '0'] for c in candles]
+
+    def get_account(self):
+        return {'balances': [self.get_asset_balance(asset) for asset in self.balances]}
+
+    def get_asset_balance(self, asset):
+        return {'asset': asset, 'free': f"{self.balances.get(asset, 0.0):.8f}", 'locked': f"{self.locked.get(asset, 0.0):.8f}"}
+
+    def _fill_price(self, side):
+        if side == 'BUY':
+            price = self.ask if self.ask is not None else self.last_price
+            return price * (1 + self.slippage)
+        price = self.bid if self.bid is not None else self.last_price
+        return price * (1 - self.slippage)
+
+    def _round_quantity(self, quantity, requested):
+        steps = math.floor(quantity / self.step_size + 1e-9)
+        rounded = steps * self.step_size
+        if requested and abs(rounded - quantity) > 1e-12 and not self._lot_warned:
+            # Binance odrzuca takie zlecenie (LOT_SIZE) - tu tylko przycinamy i ostrzegamy raz
+            logger.warning(f"Ilość {quantity:.8f} nie jest wielokrotnością stepSize {self.step_size} - Binance odrzuciłby zlecenie.")
+            self._lot_warned = True
+        return rounded
+
+    def _new_order(self, side, order_type, quantity, **fields):
+        order = {
+            'symbol': self.symbol, 'orderId': len(self.orders) + 1, 'transactTime': self.now_ms,
+            'price': '0.00000000', 'origQty': f"{quantity:.8f}", 'executedQty': '0.00000000',
+            'cummulativeQuoteQty': '0.00000000', 'status': 'NEW', 'type': order_type, 'side': side, 'fills': [],
+        }
+        order.update(fields)
+        self.orders.append(order)
+        return order
+
+    def _fill(self, order, quantity, price):
+        # Rozliczenie wykonania z wolnego salda; prowizja w otrzymanym aktywie
+        notional = quantity * price
+        if order['side'] == 'BUY':
+            if notional > self.balances[self.quote_asset] + 1e-9:
+                raise _api_error(-2010, 'Account has insufficient balance for requested action.')
+            commission, commission_asset = quantity * self.fee_rate, self.base_asset
+            self.balances[self.quote_asset] -= notional
+            self.balances[self.base_asset] += quantity - commission
+        else:
+            if quantity > self.balances[self.base_asset] + 1e-12:
+                raise _api_error(-2010, 'Account has insufficient balance for requested action.')
+            commission, commission_asset = notional * self.fee_rate, self.quote_asset
+            self.balances[self.base_asset] -= quantity
+            self.balances[self.quote_asset] += notional - commission
+        order.update({
+            'status': 'FILLED', 'updateTime': self.now_ms,
+            'executedQty': f"{quantity:.8f}", 'cummulativeQuoteQty': f"{notional:.8f}",
+            'fills': [{'price': f"{price:.8f}", 'qty': f"{quantity:.8f}", 'commission': f"{commission:.8f}", 'commissionAsset': commission_asset}],
+        })
+
+    def create_order(self, **order):
+        if self.last_price is None and self.bid is None:
+            raise _api_error(-1013, 'No market data yet.')
+        if order.get('type') == 'MARKET':
+            return self._market_order(order)
+        if order.get('type') == 'STOP_LOSS_LIMIT':
+            return self._stop_order(order)
+        raise _api_error(-1116, 'Invalid orderType.')
+
+    def _market_order(self, order):
+        side = order['side']
+        price = self._fill_price(side)
+        if 'quoteOrderQty' in order:
+            quantity = self._round_quantity(float(order['quoteOrderQty']) / price, requested=False)
+        else:
+            quantity = self._round_quantity(float(order['quantity']), requested=True)
+        if quantity <= 0 or quantity * price < self.min_notional:
+            raise _api_error(-1013, 'Filter failure: NOTIONAL')
+        result = self._new_order(side, 'MARKET', quantity)
+        try:
+            self._fill(result, quantity, price)
+        except BinanceAPIException:
+            self.orders.pop()
+            raise
+        return dict(result)
+
+    def _stop_order(self, order):
+        side = order['side']
+        quantity = self._round_quantity(float(order['quantity']), requested=True)
+        stop, limit = float(order['stopPrice']), float(order['price'])
+        if quantity <= 0 or quantity * limit < self.min_notional:
+            raise _api_error(-1013, 'Filter failure: NOTIONAL')
+        if self._stop_triggered(side, stop):
+            raise _api_error(-2010, 'Stop price would trigger immediately.')
+        asset, amount = (self.base_asset, quantity) if side == 'SELL' else (self.quote_asset, quantity * limit)
+        if amount > self.balances[asset] + 1e-12:
+            raise _api_error(-2010, 'Account has insufficient balance for requested action.')
+        self.balances[asset] -= amount
+        self.locked[asset] += amount
+        result = self._new_order(side, 'STOP_LOSS_LIMIT', quantity, price=order['price'], stopPrice=order['stopPrice'],
+                                 timeInForce=order.get('timeInForce', 'GTC'))
+        self.open_orders[result['orderId']] = {'order': result, 'stop': stop, 'limit': limit, 'quantity': quantity,
+                                               'asset': asset, 'amount': amount, 'triggered': False}
+        return dict(result)
+
+    def _stop_triggered(self, side, stop):
+        price = self.last_price
+        return price is not None and ((side == 'SELL' and price <= stop) or (side == 'BUY' and price >= stop))
+
+    def _unlock(self, pending):
+        self.locked[pending['asset']] -= pending['amount']
+        self.balances[pending['asset']] += pending['amount']
+
+    def match(self):
+        # Aktywacja zleceń stop ceną ostatniej transakcji i wykonanie po bid/ask,
+        # o ile nie jest gorszy niż cena limit (inaczej zlecenie czeka w arkuszu)
+        for order_id, pending in list(self.open_orders.items()):
+            side = pending['order']['side']
+            if not pending['triggered']:
+                if not self._stop_triggered(side, pending['stop']):
+                    continue
+                pending['triggered'] = True
+            best = self.bid if side == 'SELL' else self.ask
+            best = self.last_price if best is None else best
+            if (side == 'SELL' and best < pending['limit']) or (side == 'BUY' and best > pending['limit']):
+                continue
+            del self.open_orders[order_id]
+            self._unlock(pending)
+            self._fill(pending['order'], pending['quantity'], best)
+
+    def cancel_order(self, symbol, orderId, **kwargs):
+        pending = self.open_orders.pop(orderId, None)
+        if pending is None:
+            raise _api_error(-2011, 'Unknown order sent.')
+        self._unlock(pending)
+        pending['order']['status'] = 'CANCELED'
+        return dict(pending['order'])
+
+    def get_order(self, symbol, orderId, **kwargs):
+        if not 0 < orderId <= len(self.orders):
+            raise _api_error(-2013, 'Order does not exist.')
+        return dict(self.orders[orderId - 1])
+
+    def get_open_orders(self, symbol=None, **kwargs):
+        return [dict(pending['order']) for pending in self.open_orders.values()]
+
+    def cancel_replace_order(self, cancelReplaceMode, cancelOrderId, **order):
+        try:
+            cancelled = self.cancel_order(order['symbol'], cancelOrderId)
+        except BinanceAPIException:
+            raise _api_error(-2022, 'Order cancel-replace failed.')
+        try:
+            new = self.create_order(**order)
+        except BinanceAPIException:
+            raise _api_error(-2021, 'Order cancel-replace partially failed.')
+        return {'cancelResult': 'SUCCESS', 'newOrderResult': 'SUCCESS', 'cancelResponse': cancelled, 'newOrderResponse': new}
+
+    def last_fill_price(self):
+        for order in reversed(self.orders):
+            if order['status'] == 'FILLED':
+                return average_price(order)
+        return None
+
+    def equity(self):
+        price = self.last_price if self.last_price is not None else (self.bid + self.ask) / 2
+        base = self.balances[self.base_asset] + self.locked[self.base_asset]
+        return self.balances[self.quote_asset] + self.locked[self.quote_asset] + base * price
+
+
+# --- Symulacja -------------------------------------------------------------------
+
+class _CandleBuilder:
+    # Składa świece z kolejnych cen; roll(ts) zwraca świece zakończone przed ts,
+    # a okresy bez transakcji wypełnia świecami płaskimi (jak Binance)
+    def __init__(self, interval_ms):
+        self.interval_ms = interval_ms
+        self.candle = None # [open_time, open, high, low, close, volume]
+
+    def start(self, open_time, price):
+        self.candle = [open_time, price, price, price, price, 0.0]
+
+    def roll(self, ts):
+        closed = []
+        while self.candle is not None and ts >= self.candle[0] + self.interval_ms:
+            last = self.candle
+            closed.append(last)
+            self.candle = None
+            if ts >= last[0] + 2 * self.interval_ms:
+                self.start(last[0] + self.interval_ms, last[4])
+        return closed
+
+    def add(self, ts, price, quantity=0.0):
+        c = self.candle
+        if c is None:
+            self.start(ts - ts % self.interval_ms, price)
+            c = self.candle
+        c[2] = max(c[2], price)
+        c[3] = min(c[3], price)
+        c[4] = price
+        c[5] += quantity
+
+
+def _history(timestamps, df):
+    # Świece z DataFrame historii jako [open_time, open, high, low, close, volume] dla FakeExchange
+    times = pd.DatetimeIndex(timestamps).as_unit('ms').asi8.tolist()
+    values = df[['open', 'high', 'low', 'close', 'volume']].to_numpy(dtype=float).tolist()
+    return [[t] + row for t, row in zip(times, values)]
+
+
+class _Messages:
+    # Zamiast kolejki Telegram: wiadomości bota zostają w pamięci symulacji
+    def __init__(self):
+        self.sent = []
+
+    def send(self, message):
+        self.sent.append(message)
+
+
+class _Feed:
+    def stop(self):
+        pass
+
+
+class TickSimulator:
+    # Odtwarza tiki przez prawdziwe metody bota: sygnały na zamknięciu świecy
+    # (_check_signals -> przydział ryzyka portfela -> _enter), kontrola stop
+    # lossa i trailing stop na każdym tiku (_on_kline / _on_book -> _check_position
+    # -> _close_position), z FakeExchange zamiast Binance. Równolegle dla każdej
+    # pozycji prowadzony jest "cień" z dotychczasową logiką na zamknięciu świecy
+    # (jak backtest.simulate), żeby pokazać, gdzie wyjścia intrabar się różnią.
+    def __init__(self, symbol=SYMBOL, interval=INTERVAL, params=None, initial_capital=INITIAL_CAPITAL, exchange=None, risk=None):
+        self.params = params or strategy.default_params()
+        self.interval_ms = interval_to_milliseconds(interval)
+        self.exchange = exchange or FakeExchange(symbol, {'USDC': float(initial_capital)})
+        self.initial_capital = float(initial_capital)
+        self.messages = _Messages()
+        self.interval = interval
+        self._state_dir = tempfile.mkdtemp(prefix='tick_sim_')
+        self.bot = BinanceTradingBot(symbol, interval, self.params, self.exchange, self.messages,
+                                     state_file=os.path.join(self._state_dir, 'state.json'), daily_summary=False,
+                                     candle_store_dir=os.path.join(self._state_dir, 'candles'), risk=risk)
+        self.bot._feed = _Feed()
+        if self.bot.exchange_stop:
+            self.bot.exchange_stop.clock = lambda: self.exchange.now_ms / 1000
+        self.bot.candles.clock = self.bot.daily_candles.clock = lambda: self.exchange.now_ms
+        self.candles = _CandleBuilder(self.interval_ms)
+        self.daily = _CandleBuilder(DAY_MS)
+        self.mid_candles = False # True, gdy są tylko dane bookTicker - świece ze środka spreadu
+        self.positions = []
+        self._open = None    # Pozycja bota w trakcie
+        self._shadows = []   # Pozycje logiki "na zamknięciu świecy", jeszcze bez wyjścia
+        self.errors = 0
+        self.ticks = 0
+
+    def _seed(self, df, df_daily, first_ms):
+        # Wskaźniki z historii sprzed pierwszego tiku; świeca (i dzień) pierwszego tiku
+        # startują ciągle po ostatniej zamkniętej świecy z historii
+        first_open = first_ms - first_ms % self.interval_ms
+        seed = df[df['timestamp'] < pd.to_datetime(first_open, unit='ms')]
+        if seed.empty:
+            raise ValueError("Brak historii świec sprzed danych tikowych do inicjalizacji wskaźników.")
+        self.bot.indicators.sync(seed, in_progress=False)
+        self.exchange.add_klines(self.interval, _history(seed['timestamp'], seed))
+        self.candles.start(self.bot.indicators.last_timestamp + self.interval_ms, float(seed['close'].iloc[-1]))
+        if df_daily is not None and not df_daily.empty:
+            first_day = first_ms - first_ms % DAY_MS
+            days = df_daily[pd.to_datetime(pd.Index(df_daily.index)) < pd.to_datetime(first_day, unit='ms')]
+            if not days.empty:
+                self.bot.indicators.sync_daily(days, in_progress=False)
+                self.exchange.add_klines(Client.KLINE_INTERVAL_1DAY, _history(pd.to_datetime(pd.Index(days.index)), days))
+                self.daily.start(self.bot.indicators.last_daily_timestamp + DAY_MS, float(days['close'].iloc[-1]))
+
+    def _call(self, callback, *args):
+        # Błąd w obsłudze tiku nie przerywa symulacji - na żywo pętla monitorująca też go loguje i trwa dalej
+        bot = self.bot
+        was_in_position, stop = bot.in_position, bot.stop_loss
+        result = None
+        try:
+            result = callback(*args)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Błąd bota w symulacji ({pd.to_datetime(self.exchange.now_ms, unit='ms')}): {e}")
+        if not was_in_position and bot.in_position:
+            self._on_entry()
+        elif was_in_position and not bot.in_position:
+            self._on_exit(stop)
+        return result
+
+    def _on_entry(self):
+        bot = self.bot
+        record = {
+            'side': bot.position_side,
+            'entry_time': self.exchange.now_ms,
+            'entry_price': self.exchange.last_fill_price(),
+            'initial_stop': bot.stop_loss,
+            'tick_exit_time': None, 'tick_stop': None, 'tick_exit_price': None,
+            'candle_exit_time': None, 'candle_stop': None, 'candle_exit_price': None,
+        }
+        self.positions.append(record)
+        self._open = record
+        self._shadows.append([record, bot.stop_loss])
+
+    def _on_exit(self, stop):
+        record = self._open
+        self._open = None
+        if record is None:
+            return
+        record['tick_exit_time'] = self.exchange.now_ms
+        record['tick_stop'] = stop
+        record['tick_exit_price'] = self.exchange.last_fill_price()
+
+    def _update_shadows(self, candle):
+        # Dotychczasowa logika: SL sprawdzany tylko cenami zamknięcia świec
+        close, atr = candle[4], self.bot.indicators.atr.value
+        active = []
+        for shadow in self._shadows:
+            record, stop = shadow
+            if strategy.stop_loss_hit(record['side'], stop, close):
+                record['candle_exit_time'] = candle[0] + self.interval_ms
+                record['candle_stop'] = stop
+                record['candle_exit_price'] = close
+                continue
+            if self.params['USE_TRAILING_STOP']:
+                shadow[1] = strategy.trail_stop_loss(record['side'], stop, close, atr, self.params)
+            active.append(shadow)
+        self._shadows = active
+
+    def _on_candle_close(self, close_ms):
+        # Ta sama ścieżka co BinanceTradingBot.on_candle_close, synchronicznie: kontrola
+        # stopu na giełdzie albo sygnał z zamkniętych świec (_check_signals pobiera świece
+        # z FakeExchange), przydział ryzyka portfela i wejście
+        bot = self.bot
+        if bot.in_position:
+            self._call(bot._check_exchange_stop)
+        if bot.in_position:
+            return
+        plan = self._call(bot._check_signals)
+        if bot.risk:
+            plan = self._call(lambda: asyncio.run(bot.risk.submit(close_ms, bot.risk_key, plan)))
+        if plan is not None:
+            self._call(bot._enter, plan)
+
+    def _on_tick(self, ts, kind, a, b):
+        bot, exchange = self.bot, self.exchange
+        exchange.now_ms = ts
+        if kind == TRADE:
+            exchange.last_price = a
+            price, quantity = a, b
+        else:
+            exchange.bid, exchange.ask = a, b
+            price, quantity = (a + b) / 2, 0.0
+            if exchange.last_price is None or self.mid_candles:
+                exchange.last_price = price
+        builds_candle = kind == TRADE or self.mid_candles
+        exchange.match()
+
+        if builds_candle:
+            days = self.daily.roll(ts)
+            for day in days:
+                bot.indicators.update_daily(day[0], day[4])
+            exchange.add_klines(Client.KLINE_INTERVAL_1DAY, days)
+            closed = self.candles.roll(ts)
+            exchange.add_klines(self.interval, closed)
+            for candle in closed:
+                self._call(bot._on_kline, candle[0], candle[2], candle[3], candle[4], True)
+                self._update_shadows(candle)
+            self.candles.add(ts, price, quantity)
+            self.daily.add(ts, price, quantity)
+            exchange.open_klines[self.interval] = self.candles.candle
+            exchange.open_klines[Client.KLINE_INTERVAL_1DAY] = self.daily.candle
+            if closed:
+                # Pierwszy tik nowej świecy - jak wywołanie harmonogramu po zamknięciu na żywo
+                self._on_candle_close(closed[-1][0] + self.interval_ms)
+
+        if bot.in_position:
+            if kind == BOOK:
+                self._call(bot._on_book, a, b)
+            elif builds_candle:
+                c = self.candles.candle
+                self._call(bot._on_kline, c[0], c[2], c[3], c[4], False)
+
+    def run(self, ticks, df, df_daily=None):
+        ticks = iter(ticks)
+        first = next(ticks, None)
+        if first is None:
+            raise ValueError("Brak danych tikowych.")
+        self._seed(df, df_daily if self.params['USE_MARKET_REGIME_FILTER'] else None, first[0])
+        for tick in itertools.chain([first], ticks):
+            self._on_tick(*tick)
+            self.ticks += 1
+        return self.report()
+
+    def report(self):
+        report = pd.DataFrame(self.positions, columns=[
+            'side', 'entry_time', 'entry_price', 'initial_stop', 'tick_exit_time', 'tick_stop', 'tick_exit_price',
+            'candle_exit_time', 'candle_stop', 'candle_exit_price'])
+        direction = report['side'].map({'BUY': 1.0, 'SELL': -1.0})
+        # Ile punktów procentowych wyniku zmienia wyjście intrabar względem wyjścia na zamknięciu świecy
+        report['tick_return_percent'] = direction * (report['tick_exit_price'] / report['entry_price'] - 1) * 100
+        report['candle_return_percent'] = direction * (report['candle_exit_price'] / report['entry_price'] - 1) * 100
+        report['exit_delay_s'] = (report['candle_exit_time'] - report['tick_exit_time']) / 1000
+        tick_candle = report['tick_exit_time'] // self.interval_ms
+        candle_candle = report['candle_exit_time'] // self.interval_ms - 1
+        report['differs'] = report['tick_exit_time'].notna() & (report['candle_exit_time'].isna() | (tick_candle != candle_candle))
+        for column in ('entry_time', 'tick_exit_time', 'candle_exit_time'):
+            report[column] = pd.to_datetime(report[column], unit='ms')
+        return report
+
+    def summary(self, report):
+        closed = report[report['tick_exit_time'].notna()]
+        both = closed[closed['candle_exit_time'].notna()]
+        return {
+            'ticks': self.ticks,
+            'positions': len(report),
+            'final_equity': self.exchange.equity(),
+            'return_percent': (self.exchange.equity() / self.initial_capital - 1) * 100,
+            'exits_differing': int(report['differs'].sum()),
+            'mean_exit_delay_s': float(both['exit_delay_s'].mean()) if len(both) else 0.0,
+            'mean_return_diff_percent': float((both['candle_return_percent'] - both['tick_return_percent']).mean()) if len(both) else 0.0,
+            'errors': self.errors,
+        }
+
+
+def main():
+    if not TICK_TRADES_FILES and not TICK_BOOK_FILES:
+        logger.error("Brak plików tikowych - ustaw TICK_TRADES_FILES i/lub TICK_BOOK_FILES w config.py.")
+        return None
+    client = Client()  # Publiczne dane rynkowe nie wymagają kluczy API
+    df, df_daily = backtest.load_history(client)
+
+    simulator = TickSimulator(risk=PortfolioRisk() if USE_PORTFOLIO_RISK else None)
+    simulator.mid_candles = not TICK_TRADES_FILES
+    report = simulator.run(merge_ticks(read_agg_trades(TICK_TRADES_FILES), read_book_ticker(TICK_BOOK_FILES)), df, df_daily)
+    stats = simulator.summary(report)
+
+    logger.info(f"Symulacja tikowa {SYMBOL} {INTERVAL}: {stats['ticks']} tików, {stats['positions']} pozycji, błędy bota: {stats['errors']}")
+    logger.info(f"  Kapitał: {simulator.initial_capital:.2f} -> {stats['final_equity']:.2f} USDC ({stats['return_percent']:+.2f}%)")
+    logger.info(f"  Wyjścia intrabar inne niż na zamknięciu świecy: {stats['exits_differing']} z {stats['positions']}, "
+                f"średnio {stats['mean_exit_delay_s']:.0f}s wcześniej, różnica wyniku {stats['mean_return_diff_percent']:+.3f} pp")
+    report.to_csv(TICK_REPORT_FILE, index=False)
+    logger.info(f"Zapisano raport pozycji do {TICK_REPORT_FILE}.")
+    return report
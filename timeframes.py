@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+from binance.helpers import interval_to_milliseconds
+
+# Wyrównanie cech z wyższych interwałów (1d, 4h, 1w...) do świec bazowych. Każdy czas
+# zamieniany jest na numer przedziału wyższego interwału ((czas - przesunięcie) // długość),
+# więc dopasowanie to jedno searchsorted na liczbach całkowitych zamiast mapowania dat
+# wiersz po wierszu. Świeca bazowa widzi tylko świece wyższego interwału zamknięte przed
+# początkiem jej przedziału - bez zaglądania w przyszłość.
+
+DAY_MS = 24 * 60 * 60 * 1000
+
+# Świece tygodniowe Binance otwierają się w poniedziałek, a 1970-01-01 to czwartek
+INTERVAL_OFFSETS_MS = {'1w': 4 * DAY_MS}
+
+
+def interval_ms(interval):
+    ms = interval_to_milliseconds(interval)
+    if ms is None or interval.endswith('M'):
+        raise ValueError(f"Interwał {interval} nie ma stałej długości - nie da się go wyrównać numerem przedziału.")
+    return ms
+
+
+def to_ms(timestamps):
+    # Czasy jako int64 w ms: tablica int64, datetime64, DatetimeIndex albo indeks dat (as_daily)
+    values = np.asarray(timestamps)
+    if values.dtype == np.int64:
+        return values
+    if values.dtype == object:
+        values = pd.to_datetime(pd.Index(timestamps)).to_numpy()
+    return values.astype('datetime64[ms]').astype(np.int64)
+
+
+def bucket_ids(timestamps, interval):
+    return (to_ms(timestamps) - INTERVAL_OFFSETS_MS.get(interval, 0)) // interval_ms(interval)
+
+
+def closed_index(base_timestamps, htf_timestamps, interval):
+    # Dla każdej świecy bazowej (czas otwarcia) indeks ostatniej świecy wyższego interwału
+    # zamkniętej przed przedziałem, w którym leży świeca bazowa; -1, gdy takiej nie ma.
+    # Brakujące świece wyższego interwału (luki) zastępuje ostatnia wcześniejsza.
+    target = bucket_ids(base_timestamps, interval) - 1
+    return np.searchsorted(bucket_ids(htf_timestamps, interval), target, side='right') - 1
+
+
+def current_index(base_timestamps, htf_timestamps, interval):
+    # Indeks świecy wyższego interwału z tego samego przedziału co świeca bazowa - wartości
+    # "na żywo", także z przedziału, który jeszcze trwa; -1, gdy takiej świecy nie ma (luka)
+    target = bucket_ids(base_timestamps, interval)
+    htf = bucket_ids(htf_timestamps, interval)
+    if not len(htf):
+        return np.full(len(target), -1)
+    index = np.minimum(np.searchsorted(htf, target), len(htf) - 1)
+    return np.where(htf[index] == target, index, -1)
+
+
+def take(values, index):
+    # values[index] z NaN tam, gdzie index == -1
+    values = np.asarray(values, dtype=float)
+    if not len(values):
+        return np.full(len(index), np.nan)
+    return np.where(index >= 0, values[np.maximum(index, 0)], np.nan)
+
+
+def align(base_timestamps, df_htf, interval, columns, live=False):
+    # Kolumny df_htf (indeks lub kolumna 'timestamp' z czasem otwarcia) wyrównane do świec
+    # bazowych: {nazwa kolumny: tablica o długości base_timestamps}. Domyślnie ostatnia
+    # zamknięta świeca wyższego interwału; live=True - świeca z tego samego przedziału
+    htf_timestamps = df_htf['timestamp'] if 'timestamp' in df_htf else df_htf.index
+    index = (current_index if live else closed_index)(base_timestamps, htf_timestamps, interval)
+    return {column: take(df_htf[column], index) for column in columns}
+